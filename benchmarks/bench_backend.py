@@ -0,0 +1,45 @@
+"""
+Sequence of 4K frames rendered with process pool vs thread pool sharing one compiled template.
+
+    python -m benchmarks.bench_backend [frames] [workers]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from frame_stamp import process_sequence
+
+TEMPLATE = {
+    "shapes": [
+        {"type": "rect", "x": 40, "y": 40, "width": 1200, "height": 80, "color": [0, 0, 0, 150]},
+        {"type": "label", "text": "frame $frame", "x": 60, "y": 50, "font_size": 48},
+        {"type": "row", "x": 40, "y": 2000, "width": 3000, "height": 80, "shapes": [
+            {"type": "label", "text": "shot sh010", "font_size": 40},
+            {"type": "label", "text": "=$frame/24", "font_size": 40},
+            {"type": "label", "text": "artist", "font_size": 40},
+        ]},
+    ]
+}
+
+
+def main(frames: int = 24, workers: int = None):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp, 'src')
+        src.mkdir()
+        for i in range(frames):
+            Image.new('RGB', (3840, 2160), (i % 255, 90, 120)).save(src / f'frame.{i:04d}.png', compress_level=1)
+        print(f'{"backend":<12}{"seconds":>10}{"fps":>10}')
+        for backend in ('process', 'thread'):
+            start = time.perf_counter()
+            failed = process_sequence(src, Path(tmp, 'out'), TEMPLATE, {}, max_workers=workers, backend=backend,
+                                      resume=False)
+            duration = time.perf_counter() - start
+            assert not failed, failed
+            print(f'{backend:<12}{duration:>10.2f}{frames / duration:>10.2f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,61 @@
+"""
+Memory of shape canvases: square canvas of 2.2 shape diagonals vs tight canvas of the shape bounds.
+
+    python -m benchmarks.bench_canvas_memory
+"""
+import copy
+import glob
+import os
+import time
+
+from PIL import Image
+
+from frame_stamp.shape import base_shape
+from frame_stamp.stamp import FrameStamp
+from frame_stamp.utils import jsonc
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'examples')
+VARIABLES = {'frame': 5, 'timestamp': 1000000, 'timeline_value': 30}
+
+
+def render_allocations(template: dict, strategy: str) -> tuple[list[int], float]:
+    """
+    Sizes in bytes of all canvases allocated by shapes and render time
+    """
+    allocations = []
+    get_canvas = base_shape.BaseShape._get_canvas
+
+    def recording_get_canvas(shape, size):
+        allocations.append(size[0] * size[1] * 4)
+        return get_canvas(shape, size)
+
+    base_shape.CANVAS_STRATEGY = strategy
+    base_shape.BaseShape._get_canvas = recording_get_canvas
+    try:
+        start = time.perf_counter()
+        FrameStamp(Image.new('RGB', (1920, 1080)), copy.deepcopy(template), VARIABLES).render()
+        return allocations, time.perf_counter() - start
+    finally:
+        base_shape.BaseShape._get_canvas = get_canvas
+
+
+def main():
+    mb = 2 ** 20
+    print(f'{"template":<24}{"square total, MB":>18}{"tight total, MB":>17}'
+          f'{"square max, MB":>16}{"tight max, MB":>15}{"square, ms":>12}{"tight, ms":>11}')
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*.json'))):
+        template = jsonc.load(open(path, encoding='utf-8'))['templates'][0]
+        try:
+            square, square_time = render_allocations(template, 'square')
+            tight, tight_time = render_allocations(template, 'tight')
+        except Exception as e:
+            print(f'{os.path.basename(path):<24}skipped: {e}')
+            continue
+        print(f'{os.path.basename(path):<24}{sum(square) / mb:>18.1f}{sum(tight) / mb:>17.1f}'
+              f'{max(square, default=0) / mb:>16.1f}{max(tight, default=0) / mb:>15.1f}'
+              f'{square_time * 1000:>12.1f}{tight_time * 1000:>11.1f}')
+    base_shape.CANVAS_STRATEGY = 'tight'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Render of small thumbnails with process pool: one frame per task vs fixed and adaptive chunks.
+
+    python -m benchmarks.bench_chunking [frames] [workers]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from frame_stamp import process_sequence
+
+TEMPLATE = {
+    "shapes": [
+        {"type": "rect", "x": 2, "y": 2, "width": 60, "height": 10, "color": [0, 0, 0, 150]},
+        {"type": "label", "text": "$frame", "x": 4, "y": 2, "font_size": 8},
+    ]
+}
+
+
+def main(frames: int = 2000, workers: int = None):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp, 'src')
+        src.mkdir()
+        for i in range(frames):
+            Image.new('RGB', (96, 54), (i % 255, 90, 120)).save(src / f'thumb.{i:05d}.png')
+        print(f'{"chunking":<12}{"seconds":>10}{"fps":>10}')
+        for chunking in (None, 8, 'adaptive'):
+            start = time.perf_counter()
+            failed = process_sequence(src, Path(tmp, 'out'), TEMPLATE, {}, max_workers=workers, chunking=chunking)
+            duration = time.perf_counter() - start
+            assert not failed, failed
+            print(f'{str(chunking):<12}{duration:>10.2f}{frames / duration:>10.1f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
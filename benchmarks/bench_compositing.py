@@ -0,0 +1,74 @@
+"""
+Per-frame compositing time of the example templates: paste of full shape canvases (previous implementation),
+paste of visible part of canvases and single premultiplied layer.
+
+    python -m benchmarks.bench_compositing
+"""
+import copy
+import glob
+import os
+import timeit
+
+from PIL import Image, ImageChops
+
+from frame_stamp.stamp import FrameStamp
+from frame_stamp.utils import jsonc
+from frame_stamp.utils.image_tools import OverlayLayer, paste_trimmed
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'examples')
+VARIABLES = {'frame': 5, 'timestamp': 1000000, 'timeline_value': 30}
+SOURCE = Image.new('RGBA', (1920, 1080), (60, 90, 120, 255))
+
+
+def collect_overlays(template: dict) -> list:
+    overlays = []
+    stamp = FrameStamp(SOURCE, copy.deepcopy(template), VARIABLES)
+    stamp._render_shapes(SOURCE.size, lambda overlay, pos: overlays.append((overlay.copy(), pos)))
+    return overlays
+
+
+def composite_paste(overlays: list) -> Image.Image:
+    img = SOURCE.copy()
+    for overlay, pos in overlays:
+        img.paste(overlay, pos, overlay)
+    return img
+
+
+def composite_trimmed(overlays: list) -> Image.Image:
+    img = SOURCE.copy()
+    for overlay, pos in overlays:
+        paste_trimmed(img, overlay, pos)
+    return img
+
+
+def composite_single_layer(overlays: list) -> Image.Image:
+    img = SOURCE.copy()
+    layer = OverlayLayer(img.size)
+    for overlay, pos in overlays:
+        layer.add(overlay, pos)
+    layer.composite(img)
+    return img
+
+
+def main(number=10):
+    print(f'{"template":<24}{"overlays":>9}{"paste, ms":>11}{"trimmed, ms":>13}{"layer, ms":>11}'
+          f'{"saved, ms":>11}{"layer diff":>12}')
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*.json'))):
+        template = jsonc.load(open(path, encoding='utf-8'))['templates'][0]
+        try:
+            overlays = collect_overlays(template)
+        except Exception as e:
+            print(f'{os.path.basename(path):<24}skipped: {str(e).splitlines()[0]}')
+            continue
+        times = [timeit.timeit(lambda: func(overlays), number=number) / number * 1000
+                 for func in (composite_paste, composite_trimmed, composite_single_layer)]
+        expected = composite_paste(overlays).convert('RGB')
+        assert composite_trimmed(overlays).convert('RGB').tobytes() == expected.tobytes()
+        diff = ImageChops.difference(composite_single_layer(overlays).convert('RGB'), expected)
+        max_diff = max(band[1] for band in diff.getextrema())
+        print(f'{os.path.basename(path):<24}{len(overlays):>9}{times[0]:>11.2f}{times[1]:>13.2f}{times[2]:>11.2f}'
+              f'{times[0] - min(times[1:]):>11.2f}{max_diff:>12}')
+
+
+if __name__ == '__main__':
+    main()
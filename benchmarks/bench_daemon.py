@@ -0,0 +1,61 @@
+"""
+Single frame render: new process per frame (cold CLI) vs CLI client of running render service
+vs client in the same process.
+
+    python -m benchmarks.bench_daemon [renders]
+"""
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from frame_stamp.daemon import RenderClient, RenderServer
+
+TEMPLATE = {
+    "shapes": [
+        {"type": "rect", "x": 40, "y": 40, "width": 900, "height": 80, "color": [0, 0, 0, 150]},
+        {"type": "label", "text": "shot $shot frame $frame", "x": 60, "y": 50, "font_size": 48},
+        {"type": "label", "text": "resolution $source_width x $source_height", "x": 60, "y": 200, "font_size": 32},
+    ]
+}
+
+
+def main(renders: int = 10):
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp, 'source.png')
+        Image.new('RGB', (1920, 1080), (40, 90, 120)).save(source)
+        template_file = Path(tmp, 'template.json')
+        template_file.write_text(json.dumps(TEMPLATE))
+        address = Path(tmp, 'framestamp.sock').as_posix()
+        server = RenderServer(address)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        client = RenderClient(address)
+
+        def cli(*args):
+            return lambda i: subprocess.run(
+                [sys.executable, '-m', 'frame_stamp.daemon', '--address', address, 'render', str(template_file),
+                 str(source), str(Path(tmp, f'out.{i}.png')), '-v', f'frame={i}', '-v', 'shot=sh010', *args],
+                check=True)
+
+        def in_process(i):
+            client.render(template_file, source, Path(tmp, f'out.{i}.png'), {'frame': i, 'shot': 'sh010'})
+
+        print(f'{"mode":<16}{"ms/frame":>10}')
+        for name, render in (('cold cli', cli()), ('daemon cli', cli('--daemon')), ('daemon client', in_process)):
+            start = time.perf_counter()
+            for i in range(renders):
+                render(i)
+            duration = time.perf_counter() - start
+            print(f'{name:<16}{duration / renders * 1000:>10.1f}')
+        client.shutdown()
+        thread.join()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,100 @@
+"""
+Per-parameter evaluation cost: regex chain (previous implementation) vs compiled values.
+
+    python -m benchmarks.bench_expressions
+"""
+import math
+import random
+import re
+import timeit
+
+from PIL import Image
+
+from frame_stamp.stamp import FrameStamp
+from frame_stamp.shape import RectShape
+
+PARAMETERS = {
+    'int': '120',
+    'float': '0.5',
+    'unit': '3.5u',
+    'variable': '$panel_height',
+    'scope': 'panel.width',
+    'expression': '=parent.width*0.8-$offset/2',
+    'inline': '`=math.sin($value*0.05)*40`',
+}
+
+
+class LegacyRectShape(RectShape):
+    """Regex chain from previous versions, kept here for comparison"""
+
+    def _eval_parameter_convert(self, key, val, **kwargs):
+        if isinstance(val, (int, float, bool)):
+            return val
+        elif isinstance(val, (list, tuple)):
+            return [self._eval_parameter_convert(key, x) for x in val]
+        elif isinstance(val, dict):
+            return {k: self._eval_parameter_convert(key, v, **kwargs) for k, v in val.items()}
+        if not isinstance(val, str):
+            raise TypeError('Unsupported type {}'.format(type(val)))
+        if val.isdigit():
+            return int(val)
+        elif re.match(r"^\d*\.\d*$", val):
+            return float(val)
+        if re.match(r"-?[\d.]+u", val):
+            return float(val.rstrip('u')) * self.unit
+        if re.match(r"-?[\d.]+p", val):
+            return float(val.rstrip('p')) * self.point
+        for func in [self._eval_percent_of_default, self._eval_from_scope,
+                     self._eval_from_variables, self._legacy_eval_expression]:
+            try:
+                res = func(key, val, **kwargs)
+            except KeyError:
+                continue
+            if res is not None:
+                return res
+        return val
+
+    def _eval_percent_of_default(self, key, val, **kwargs):
+        match = re.match(r'^(\d+)%$', val)
+        if match:
+            return self._resolve_percent(key, float(match.group(1)), **kwargs)
+
+    def _eval_from_scope(self, key, val, **kwargs):
+        match = re.match(r'^(\w+)\.(\w+)$', val)
+        if match:
+            return self._resolve_scope_attr(*match.groups())
+
+    def _eval_from_variables(self, key, val, **kwargs):
+        match = re.match(r"\$([\w\d_]+)", val)
+        if match:
+            return self._resolve_variable(key, match.group(1))
+
+    def _legacy_eval_expression(self, key, expr, **kwargs):
+        expr = expr.strip('`')
+        if not expr.startswith('='):
+            return
+        expr = expr.lstrip('=')
+        for op in re.findall(r"[\w\d.%$]+", expr):
+            val = self._eval_parameter_convert(key, op)
+            expr = expr.replace(op, str(val if not callable(val) else val()))
+        return eval(expr, {'math': math, 'random': random.random})
+
+
+def main(number=20000):
+    template = {
+        'variables': {'panel_height': '5u', 'offset': 20, 'value': 3},
+        'shapes': [{'type': 'rect', 'id': 'panel', 'width': 300, 'height': 40}],
+    }
+    stamp = FrameStamp(Image.new('RGB', (1920, 1080)), template, {})
+    legacy = LegacyRectShape({}, stamp._shared_context)
+    compiled = RectShape({}, stamp._shared_context)
+    print(f'{"parameter":<12}{"legacy, us":>14}{"compiled, us":>14}{"speedup":>10}')
+    for name, value in PARAMETERS.items():
+        before = timeit.timeit(lambda: legacy._eval_parameter_convert('x', value), number=number)
+        after = timeit.timeit(lambda: compiled._eval_parameter_convert('x', value), number=number)
+        assert legacy._eval_parameter_convert('x', value) == compiled._eval_parameter_convert('x', value)
+        print(f'{name:<12}{before / number * 1e6:>14.2f}{after / number * 1e6:>14.2f}{before / after:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Per-frame update of one FrameStamp: new FrameStamp for each frame vs CompiledTemplate.bind vs FrameStamp.rebind.
+Burn-in template with two labels changing per frame and many static ones, output of all modes is the same.
+
+    python -m benchmarks.bench_rebind [frames]
+"""
+import sys
+import time
+
+from PIL import Image
+
+from frame_stamp import CompiledTemplate, FrameStamp
+
+TEMPLATE = {
+    "shapes": [
+        {"type": "rect", "id": "top", "x": 0, "y": 0, "width": "$source_width", "height": "=$unt*6",
+         "color": [0, 0, 0, 140]},
+        {"type": "label", "id": "project", "parent": "top", "x": "=$unt", "y": "=$unt", "text": "$project",
+         "font_size": "=$unt*3"},
+        {"type": "label", "parent": "top", "x": "=project.right+$unt*4", "y": "=$unt", "text": "shot $shot",
+         "font_size": "=$unt*3"},
+        {"type": "label", "parent": "top", "x": "=$source_width-$unt*30", "y": "=$unt",
+         "text": "frame $frame", "font_size": "=$unt*3"},
+        {"type": "row", "x": "=$unt", "y": "=$source_height-$unt*8", "width": "=$source_width-$unt*2",
+         "height": "=$unt*6", "shapes": [
+            {"type": "label", "text": "$artist", "font_size": "=$unt*2.5"},
+            {"type": "label", "text": "$department", "font_size": "=$unt*2.5"},
+            {"type": "label", "text": "version $version", "font_size": "=$unt*2.5"},
+            {"type": "label", "text": "last frame $last_frame", "font_size": "=$unt*2.5"},
+        ]},
+        {"type": "label", "x": "=$source_width-$unt*20", "y": "=$source_height-$unt*14", "text": "$frame",
+         "font_size": "=$unt*4"},
+    ]
+}
+VARIABLES = {"project": "Project", "shot": "sh010", "artist": "artist", "department": "comp",
+             "version": 12, "last_frame": 1100}
+
+
+def run(frames: int, source: Image.Image, mode: str) -> tuple[float, bytes]:
+    compiled = CompiledTemplate(TEMPLATE)
+    stamp = FrameStamp(source, TEMPLATE, {**VARIABLES, 'frame': 0})
+    start = time.perf_counter()
+    for i in range(frames):
+        variables = {**VARIABLES, 'frame': 1001 + i}
+        if mode == 'construct':
+            result = FrameStamp(source, TEMPLATE, variables).render()
+        elif mode == 'bind':
+            result = compiled.bind(source, variables).render()
+        else:
+            result = stamp.rebind(source, variables).render()
+    return time.perf_counter() - start, result.tobytes()
+
+
+def main(frames: int = 1000):
+    source = Image.new('RGB', (1280, 720), (40, 60, 80))
+    print(f'{"mode":<12}{"total s":>10}{"ms/frame":>10}')
+    expected = None
+    for mode in ('construct', 'bind', 'rebind'):
+        duration, result = run(frames, source, mode)
+        expected = expected or result
+        assert result == expected
+        print(f'{mode:<12}{duration:>10.2f}{duration / frames * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,52 @@
+"""
+Memory of the sequence pipeline on long sequences: resident memory of main process
+sampled while frames are rendered. Should stay flat after the first frames.
+
+    python -m benchmarks.bench_sequence_memory [frames] [workers]
+"""
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from frame_stamp.pipeline import FrameJob, SequencePipeline
+
+TEMPLATE = {
+    "shapes": [
+        {"type": "rect", "x": 10, "y": 10, "width": 400, "height": 40, "color": [0, 0, 0, 150]},
+        {"type": "label", "text": "frame $frame", "x": 20, "y": 20, "font_size": 24},
+    ]
+}
+
+
+def rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(frames: int = 100000, workers: int = None):
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp, 'source.png')
+        Image.new('RGB', (960, 540), (60, 90, 120)).save(source)
+        # same source for all frames, output files are overwritten to keep disk usage small
+        jobs = (FrameJob(i, source, Path(tmp, f'out.{i % 100:03d}.png'), {'frame': i}) for i in range(frames))
+        pipeline = SequencePipeline(TEMPLATE, max_workers=workers)
+        start = time.perf_counter()
+        print(f'{"frames":>10}{"rss, MB":>10}{"fps":>10}')
+        for result in pipeline.run(jobs):
+            if result.error:
+                print(result)
+            done = result.index + 1
+            if done % (frames // 10 or 1) == 0:
+                print(f'{done:>10}{rss_mb():>10.1f}{done / (time.perf_counter() - start):>10.1f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
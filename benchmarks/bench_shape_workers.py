@@ -0,0 +1,44 @@
+"""
+Contact sheet with hundreds of shapes in one 4K frame: sequential render vs shapes rasterized on thread pool.
+
+    python -m benchmarks.bench_shape_workers [cells] [repeats]
+"""
+import sys
+import time
+
+from PIL import Image
+
+from frame_stamp import FrameStamp
+
+
+def contact_sheet(cells: int) -> dict:
+    shapes = []
+    columns = 20
+    for i in range(cells):
+        x, y = 20 + (i % columns) * 190, 20 + (i // columns) * 110
+        shapes += [
+            {"type": "rect", "x": x, "y": y, "width": 180, "height": 100, "color": [0, 0, 0, 120],
+             "rotate": (i % 7) - 3},
+            {"type": "label", "x": x + 6, "y": y + 6, "text": f"shot {i:03d} frame $frame", "font_size": 16},
+            {"type": "circle", "x": x + 150, "y": y + 70, "width": 20, "height": 20, "color": [255, 80, 0, 200]},
+        ]
+    return {"shapes": shapes}
+
+
+def main(cells: int = 200, repeats: int = 3):
+    template = contact_sheet(cells)
+    source = Image.new('RGB', (3840, 2160), (40, 60, 80))
+    print(f'{"workers":<10}{"ms/frame":>10}')
+    expected = None
+    for workers in (0, 2, 4, 8):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            result = FrameStamp(source, template, {'frame': 1}).render(shape_workers=workers).tobytes()
+        duration = (time.perf_counter() - start) / repeats
+        expected = expected or result
+        assert result == expected
+        print(f'{workers:<10}{duration * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
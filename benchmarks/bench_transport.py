@@ -0,0 +1,41 @@
+"""
+Sequence of 4K frames rendered with process pool: frames decoded by workers and pickled back
+vs frames exchanged through shared memory slots.
+
+    python -m benchmarks.bench_transport [frames] [workers]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from frame_stamp import process_sequence
+
+TEMPLATE = {
+    "shapes": [
+        {"type": "rect", "x": 40, "y": 40, "width": 1200, "height": 80, "color": [0, 0, 0, 150]},
+        {"type": "label", "text": "frame $frame", "x": 60, "y": 50, "font_size": 48},
+    ]
+}
+
+
+def main(frames: int = 24, workers: int = None):
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp, 'src')
+        src.mkdir()
+        for i in range(frames):
+            # uncompressed format, time is spent on transport rather than on codec
+            Image.new('RGB', (3840, 2160), (i % 255, 90, 120)).save(src / f'frame.{i:04d}.bmp')
+        print(f'{"transport":<12}{"seconds":>10}{"fps":>10}')
+        for transport in (None, 'shm'):
+            start = time.perf_counter()
+            failed = process_sequence(src, Path(tmp, 'out'), TEMPLATE, {}, max_workers=workers, transport=transport)
+            duration = time.perf_counter() - start
+            assert not failed, failed
+            print(f'{str(transport):<12}{duration:>10.2f}{frames / duration:>10.2f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -1,71 +1,124 @@
 import logging
 import multiprocessing
-from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Iterable, Iterator, Union
 
 from PIL import Image
 
 from .__version__ import __version__
-from .stamp import FrameStamp
+from .stamp import FrameStamp, CompiledTemplate
+from .manifest import RenderManifest
+from .overlay import OverlayManifest, render_overlays
+from .pipeline import ChunkPolicy, FrameJob, FrameResult, SequencePipeline, iter_jobs, save_image
+from .sharding import FrameClaims, parse_frame_ranges, shard_indices
 
 
-def process_sequence(src_dir: str, output_dir: str, template: dict, context: dict, file_pattern: str = '*.*',
-                     multithread=True, context_callback=None, **kwargs):
+def process_sequence(src_dir: str, output_dir: str, template: Union[dict, CompiledTemplate], context: dict,
+                     file_pattern: str = '*.*', multithread=True, context_callback=None, max_workers: int = None,
+                     depth: int = None, ordered: bool = True, on_result: Callable[[FrameResult], None] = None,
+                     chunking: Union[str, int, ChunkPolicy, None] = 'adaptive', transport: str = None,
+                     resume: bool = True, force: bool = False, shard_index: int = None, shard_count: int = None,
+                     frames: Union[str, Iterable] = None, claim: bool = False, run_id: str = None,
+                     backend: str = 'process', **kwargs) -> list[FrameResult]:
+    """
+    Render all files of the directory with streaming pipeline (see frame_stamp.pipeline).
+
+    multithread : render frames in pool of workers, otherwise in one thread
+    backend     : pool of workers: "process" or "thread", threads share compiled template
+                  and don't pickle frames, faster for large frames
+    depth       : max number of frames in the pipeline, memory usage doesn't depend on number of files
+    ordered     : results are reported in order of files, otherwise as completed
+    on_result   : function called with FrameResult of each frame
+    chunking    : frames per task of render process: "adaptive" by measured render time,
+                  fixed number of frames or None for one frame per task
+    transport   : "shm" to exchange frames with render processes through shared memory
+    resume      : keep render manifest in output directory and skip frames rendered with the same
+                  source, template and variables (see frame_stamp.manifest)
+    force       : render all frames even if they are up to date
+    shard_index : render only part of frames with this index of shard_count contiguous parts
+    shard_count : number of parts, each part is rendered by separate process or host
+    frames      : indices of frames to render: "0-99,150,200-" or list of indices and ranges
+    claim       : claim each frame in output directory before render, several processes or hosts
+                  with the same arguments share frames without duplicates (see frame_stamp.sharding),
+                  rendered frames stay claimed until their inputs are changed or output is removed
+    run_id      : id of forced claimed render shared by its processes or hosts, frames done by one of them
+                  are not rendered again by others
+
+    Returns results of failed frames
+    """
+    pipeline, jobs, total = prepare_sequence(
+        src_dir, output_dir, template, context, file_pattern=file_pattern, multithread=multithread,
+        context_callback=context_callback, max_workers=max_workers, depth=depth, ordered=ordered,
+        chunking=chunking, transport=transport, resume=resume, force=force, shard_index=shard_index,
+        shard_count=shard_count, frames=frames, claim=claim, run_id=run_id, backend=backend, **kwargs)
+    failed = []
+    for result in pipeline.run(jobs, total=total):
+        if on_result:
+            on_result(result)
+        if not result.ok:
+            failed.append(result)
+    return failed
+
+
+def prepare_sequence(src_dir: str, output_dir: str, template: Union[dict, CompiledTemplate], context: dict,
+                     file_pattern: str = '*.*', multithread=True, context_callback=None, max_workers: int = None,
+                     depth: int = None, ordered: bool = True, chunking: Union[str, int, ChunkPolicy, None] = 'adaptive',
+                     transport: str = None, resume: bool = True, force: bool = False, shard_index: int = None,
+                     shard_count: int = None, frames: Union[str, Iterable] = None, claim: bool = False, run_id: str = None,
+                     backend: str = 'process', **kwargs) -> tuple[SequencePipeline, Iterator[FrameJob], int]:
+    """
+    Pipeline, jobs and number of jobs of process_sequence arguments
+    """
     src_dir = Path(src_dir)
     if not src_dir.exists():
         raise IOError(f'Source path not exists {src_dir}')
     output_dir = Path(output_dir)
     output_dir.mkdir(exist_ok=True, parents=True)
-    files = sorted(src_dir.glob(file_pattern))
+    files = sorted(f for f in src_dir.glob(file_pattern) if f.is_file() and f.name != RenderManifest.FILE_NAME)
     if kwargs.get('limit'):
         files = files[:kwargs['limit']]
 
-    render = run_multiprocess if multithread else run_single_thread
-    render(files, template, output_dir, context, context_callback=context_callback, **kwargs)
+    indices = None
+    if frames is not None:
+        indices = parse_frame_ranges(frames, len(files))
+    if shard_count:
+        shard = shard_indices(len(indices if indices is not None else files), shard_index or 0, shard_count)
+        indices = [indices[i] for i in shard] if indices is not None else list(shard)
 
+    template = CompiledTemplate.from_template(template)
+    # claims are keyed by frame hashes, manifest is kept in force mode without resume
+    manifest = RenderManifest(output_dir, template, force=force or not resume) if resume or claim else None
+    claims = FrameClaims(output_dir, force=force, run_id=run_id) if claim else None
+    pipeline = SequencePipeline(template, context, multithread=multithread,
+                                max_workers=max_workers or context.get('max_workers'),
+                                depth=depth, ordered=ordered, chunking=chunking,
+                                transport=transport, manifest=manifest, claims=claims, backend=backend)
+    if max_workers is not None:
+        # context callback gets max_workers with other keyword arguments
+        kwargs['max_workers'] = max_workers
+    jobs = iter_jobs(files, output_dir, context, context_callback, indices=indices, **kwargs)
+    return pipeline, jobs, len(files) if indices is None else len(indices)
 
-def _executor_helper(kwargs):
-    try:
-        render_single_frame(**kwargs)
-    except Exception as e:
-        logging.exception('Render error')
 
+def run_single_thread(files: list[Path], template: Union[dict, CompiledTemplate], output_dir: str, context: dict,
+                      context_callback: Callable, **kwargs) -> list[FrameResult]:
+    pipeline = SequencePipeline(template, context, multithread=False, depth=kwargs.get('depth'))
+    return list(pipeline.run(iter_jobs(files, output_dir, context, context_callback, **kwargs), total=len(files)))
 
-def run_single_thread(files: list[Path], template: dict, output_dir: str, context: dict, context_callback: Callable, **kwargs):
-    for i, file in enumerate(files):
-        render_single_frame(
-            image_path=file,
-            save_path=Path(output_dir, file.name),
-            template=template,
-            context={**context, 'frame': i, 'file': file, 'total_frames': len(files),
-                     **(context_callback(i, file, len(files), **kwargs) if context_callback else {})},
-            **kwargs
-        )
 
-
-def run_multiprocess(files: list[Path], template: dict, output_path: str, context: dict, **kwargs):
-    # get cpu count
-    callback = kwargs.get('context_callback')
+def run_multiprocess(files: list[Path], template: Union[dict, CompiledTemplate], output_path: str, context: dict,
+                     **kwargs) -> list[FrameResult]:
+    callback = kwargs.pop('context_callback', None)
     workers = kwargs.get('max_workers') or context.get('max_workers') or multiprocessing.cpu_count()
-    logging.info(f'Use Multiprocess render ({workers} cpu)')
-    # start pool
-    with ProcessPoolExecutor(max_workers=workers) as executor:
-        executor.map(_executor_helper, (dict(
-            image_path=file,
-            save_path=Path(output_path, file.name),
-            template=template,
-            context={**context, 'frame': i, 'file': file, 'total_frames': len(files),
-                     **(callback(i, file, len(files), **kwargs) if callback else {})}
-        ) for i, file in enumerate(files)))
-
-
-def render_single_frame(image_path: str, save_path: str, template: dict, context: dict, **kwargs):
+    pipeline = SequencePipeline(template, context, max_workers=workers, depth=kwargs.get('depth'))
+    return list(pipeline.run(iter_jobs(files, output_path, context, callback, **kwargs), total=len(files)))
+
+
+def render_single_frame(image_path: str, save_path: str, template: Union[dict, CompiledTemplate], context: dict, **kwargs):
     image_path = Path(image_path)
     logging.info(f'Process file {image_path.name}')
     save_path = Path(save_path)
     img = Image.open(str(image_path))
     renderer = FrameStamp(img, template, context)
     img = renderer.render()
-    img.save(save_path.as_posix(), save_path.suffix.strip('.').upper())
-    return save_path
+    return save_image(img, save_path)
@@ -0,0 +1,144 @@
+"""
+Asyncio API of rendering.
+
+Decode, render and encode never run in the event loop: single frames are rendered in a thread
+or process pool executor, sequences run the streaming pipeline (see frame_stamp.pipeline)
+in a background thread and results are passed to the loop as frames complete.
+
+    >>> image = await render_async('source.png', template, {'frame': 1}, executor=pool)
+    >>> async for result in process_sequence_async(src_dir, output_dir, template, variables, max_workers=4):
+    >>>     print(result.index, result.path, result.error)
+
+Cancellation of the awaiting task cancels renders not started yet, started frames are finished
+by their workers and their results are dropped. Breaking out of `async for` or closing the iterator
+stops the sequence the same way: no new frames are taken, frames in flight are completed
+and the render manifest is saved.
+
+Number of parallel jobs is limited with shared asyncio.Semaphore passed as `limit`,
+workers of each sequence are limited by its max_workers and depth.
+"""
+import asyncio
+import threading
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import AsyncIterator, Union
+
+from PIL import Image
+
+from . import prepare_sequence
+from .pipeline import FrameResult, read_image, save_image
+from .stamp import CompiledTemplate, FrameStamp
+
+
+def render_to(image: Union[str, Path, Image.Image], template: Union[dict, CompiledTemplate], variables: dict,
+              save_path: Union[str, Path] = None, **kwargs) -> Union[Image.Image, Path]:
+    """
+    Decode, render and write one frame, runs in executor.
+    Returns output path when save path is given, otherwise rendered image
+    """
+    if not isinstance(image, Image.Image):
+        image = read_image(image)
+    image = FrameStamp(image, template, variables).render(**kwargs)
+    if save_path is None:
+        return image
+    return save_image(image, save_path)
+
+
+async def render_async(image: Union[str, Path, Image.Image], template: Union[dict, CompiledTemplate],
+                       variables: dict, save_path: Union[str, Path] = None, executor: Executor = None,
+                       limit: asyncio.Semaphore = None, **kwargs) -> Union[Image.Image, Path]:
+    """
+    Render one frame in executor.
+
+    image       : source path or image
+    save_path   : write result to file and return the path instead of image,
+                  rendered image is not sent back from process pool
+    executor    : thread or process pool, default executor of the loop by default.
+                  Process pool receives pickled template on each call, compiled template is compiled again
+    limit       : semaphore shared by jobs to limit number of parallel renders
+    """
+    loop = asyncio.get_running_loop()
+    if limit is None:
+        return await loop.run_in_executor(executor, _call, image, template, variables, save_path, kwargs)
+    async with limit:
+        return await loop.run_in_executor(executor, _call, image, template, variables, save_path, kwargs)
+
+
+def _call(image, template, variables, save_path, kwargs):
+    return render_to(image, template, variables, save_path, **kwargs)
+
+
+class _Stop(Exception):
+    """
+    Sequence iterator is closed
+    """
+
+
+async def process_sequence_async(src_dir: Union[str, Path], output_dir: Union[str, Path],
+                                 template: Union[dict, CompiledTemplate], context: dict, ordered: bool = False,
+                                 limit: asyncio.Semaphore = None, **kwargs) -> AsyncIterator[FrameResult]:
+    """
+    Render all files of the directory, yields FrameResult of each frame as it completes.
+    Arguments are the same as of process_sequence, results are unordered by default.
+
+    limit       : semaphore shared by jobs, held by the sequence until it is finished
+    """
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue()
+    stop = threading.Event()
+    # result is taken from the pipeline when previous one is taken by the loop,
+    # frames are not accumulated if the consumer is slower than render
+    taken = threading.Semaphore(1)
+    end = object()
+
+    def produce():
+        try:
+            pipeline, jobs, total = prepare_sequence(src_dir, output_dir, template, context, ordered=ordered,
+                                                     **kwargs)
+            run = pipeline.run(jobs, total=total)
+            try:
+                for result in run:
+                    while not taken.acquire(timeout=0.1):
+                        if stop.is_set():
+                            raise _Stop()
+                    if stop.is_set():
+                        raise _Stop()
+                    loop.call_soon_threadsafe(results.put_nowait, result)
+            finally:
+                # pipeline stops taking jobs and waits for frames in flight
+                run.close()
+        except _Stop:
+            pass
+        except BaseException as e:
+            _put(e)
+        else:
+            _put(end)
+
+    def _put(item):
+        try:
+            loop.call_soon_threadsafe(results.put_nowait, item)
+        except RuntimeError:
+            # loop is closed
+            pass
+
+    if limit is not None:
+        await limit.acquire()
+    thread = threading.Thread(target=produce, name='frame-stamp-async-sequence', daemon=True)
+    try:
+        thread.start()
+        while True:
+            item = await results.get()
+            if item is end:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            taken.release()
+            yield item
+    finally:
+        stop.set()
+        try:
+            if thread.is_alive():
+                await loop.run_in_executor(None, thread.join)
+        finally:
+            if limit is not None:
+                limit.release()
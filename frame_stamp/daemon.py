@@ -0,0 +1,361 @@
+"""
+Persistent render service.
+
+Each new process pays for Python start, imports, font loading and template compilation before
+the first frame. RenderServer runs once and keeps compiled templates, fonts, rendered labels
+and resource images warm between jobs, clients only send jobs and read status.
+
+Jobs are JSON lines sent over Unix socket (or TCP "host:port" on systems without Unix sockets).
+Each job gets a stream of JSON status lines, the last one has status "done" or "error".
+
+    $ python -m frame_stamp.daemon serve
+    $ python -m frame_stamp.daemon render template.json source.png output.png -v frame=1 --daemon
+
+    >>> client = RenderClient()
+    >>> client.render(template, 'source.png', 'output.png', {'frame': 1})
+    >>> for status in client.process_sequence(template, src_dir, output_dir, {'fps': 24}):
+    >>>     print(status['index'], status['path'])
+
+Requests:
+
+    render      : {"cmd": "render", "template": dict or file, "template_name": name in file, "source": file,
+                   "output": file, "variables": {}}
+    sequence    : {"cmd": "sequence", "template": ..., "src_dir": dir, "output_dir": dir, "variables": {},
+                   "options": {keyword arguments of process_sequence}}
+    ping, stats, shutdown
+
+Jobs of the same template are rendered one by one on the render thread of the template, so shapes
+created by the first job (they are kept per thread, see CompiledTemplate) are reused by jobs of all
+connections. Jobs of different templates are rendered in parallel.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, Union
+
+from frame_stamp import CompiledTemplate, process_sequence
+from frame_stamp.pipeline import FrameResult, save_image
+from frame_stamp.shape.image import image_cache_info
+from frame_stamp.shape.label import font_cache_info, label_cache_info
+from frame_stamp.utils.cache import LRUCache
+from frame_stamp.utils.templates import load_template_file, parse_variables
+
+logger = logging.getLogger(__name__)
+TEMPLATE_CACHE_SIZE = 32
+# options of sequence job passed to process_sequence, paths and callbacks are not accepted
+SEQUENCE_OPTIONS = ('file_pattern', 'multithread', 'backend', 'max_workers', 'depth', 'ordered', 'chunking', 'transport',
+                    'resume', 'force', 'shard_index', 'shard_count', 'frames', 'claim', 'run_id', 'limit')
+
+
+def default_address() -> str:
+    if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+        return os.path.join(tempfile.gettempdir(), f'framestamp-{os.getuid()}.sock')
+    return '127.0.0.1:47311'
+
+
+def _parse_address(address: str):
+    """
+    Unix socket path or (host, port)
+    """
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and os.sep not in host:
+        return host or '127.0.0.1', int(port)
+    return address
+
+
+class RenderError(Exception):
+    """
+    Job failed in render service
+    """
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                self.server.handle_request_data(request, self.send)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                logger.exception('Job failed')
+                self.send({'status': 'error', 'error': f'{type(e).__name__}: {e}'})
+
+    def send(self, data: dict):
+        self.wfile.write(json.dumps(data, default=str).encode() + b'\n')
+        self.wfile.flush()
+
+
+class TemplateWorker(object):
+    """
+    Compiled template with own render thread
+    """
+    def __init__(self, template: dict):
+        self.template = CompiledTemplate(template)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='framestamp-template')
+
+    def run(self, func: Callable, *args, **kwargs):
+        """
+        Call func(compiled_template, *args, **kwargs) on render thread and return its result
+        """
+        return self._executor.submit(func, self.template, *args, **kwargs).result()
+
+
+class RenderServer(object):
+    """
+    Render service keeping compiled templates and shape caches between jobs.
+
+    address     : Unix socket path or "host:port"
+    """
+    def __init__(self, address: str = None):
+        self.address = address or default_address()
+        # template hash > worker, thread of evicted worker exits when the worker is collected
+        self.templates = LRUCache(maxsize=TEMPLATE_CACHE_SIZE)
+        self.jobs = 0
+        self.started = time.time()
+        self._server = self._create_server(_parse_address(self.address))
+        self._server.handle_request_data = self.handle
+
+    @staticmethod
+    def _create_server(address) -> socketserver.BaseServer:
+        if isinstance(address, tuple):
+            socketserver.ThreadingTCPServer.allow_reuse_address = True
+            server = socketserver.ThreadingTCPServer(address, _RequestHandler)
+        else:
+            if os.path.exists(address):
+                # socket is left by killed server, refuse to take socket of running one
+                try:
+                    with socket.socket(socket.AF_UNIX) as sock:
+                        sock.connect(address)
+                except OSError:
+                    os.remove(address)
+                else:
+                    raise RuntimeError(f'Render service is already running: {address}')
+            server = socketserver.ThreadingUnixStreamServer(address, _RequestHandler)
+        server.daemon_threads = True
+        return server
+
+    def serve_forever(self):
+        logger.info('Render service listening on %s', self.address)
+        try:
+            self._server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """
+        Stop serve_forever from other thread
+        """
+        threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def close(self):
+        self._server.server_close()
+        self.templates.clear()
+        if isinstance(_parse_address(self.address), str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def get_template(self, template: Union[dict, str], name: str = None) -> TemplateWorker:
+        """
+        Render worker of the template. Template files are compiled again after change,
+        name selects template of the file
+        """
+        if isinstance(template, str):
+            path = Path(template)
+            stat = path.stat()
+            key = ('file', path.resolve().as_posix(), stat.st_mtime_ns, stat.st_size, name)
+            factory = lambda: load_template_file(path, name)
+        else:
+            key = ('dict', hashlib.sha1(json.dumps(template, sort_keys=True, default=str).encode()).hexdigest())
+            factory = lambda: template
+        return self.templates.get_or_create(key, lambda: TemplateWorker(factory()))
+
+    def handle(self, request: dict, send):
+        """
+        Execute the job and send its status with send(dict)
+        """
+        cmd = request.get('cmd')
+        if cmd == 'ping':
+            send({'status': 'done', 'pid': os.getpid()})
+        elif cmd == 'stats':
+            send({'status': 'done', 'jobs': self.jobs, 'uptime': time.time() - self.started,
+                  'templates': self.templates.info(), 'fonts': font_cache_info(),
+                  'labels': label_cache_info(), 'images': image_cache_info()})
+        elif cmd == 'shutdown':
+            send({'status': 'done'})
+            self.shutdown()
+        elif cmd == 'render':
+            self.jobs += 1
+            self.render(request, send)
+        elif cmd == 'sequence':
+            self.jobs += 1
+            self.render_sequence(request, send)
+        else:
+            raise ValueError(f'Unknown command: {cmd}')
+
+    def render(self, request: dict, send):
+        start = time.perf_counter()
+        worker = self.get_template(request['template'], request.get('template_name'))
+        path = worker.run(_render_frame, request['source'], request['output'], request.get('variables') or {})
+        send({'status': 'done', 'path': path.as_posix(), 'duration': time.perf_counter() - start})
+
+    def render_sequence(self, request: dict, send):
+        start = time.perf_counter()
+        options = request.get('options') or {}
+        unknown = set(options).difference(SEQUENCE_OPTIONS)
+        if unknown:
+            raise ValueError(f'Unknown options of sequence: {", ".join(sorted(unknown))}')
+        worker = self.get_template(request['template'], request.get('template_name'))
+        failed = worker.run(_render_sequence, request['src_dir'], request['output_dir'],
+                            request.get('variables') or {}, on_result=lambda result: send(_result_status(result)),
+                            **options)
+        send({'status': 'done', 'failed': len(failed), 'duration': time.perf_counter() - start})
+
+
+def _render_frame(compiled: CompiledTemplate, source: str, output: str, variables: dict) -> Path:
+    return save_image(compiled.bind(source, variables).render(), output)
+
+
+def _render_sequence(compiled: CompiledTemplate, src_dir: str, output_dir: str, variables: dict, **kwargs) -> list:
+    return process_sequence(src_dir, output_dir, compiled, variables, **kwargs)
+
+
+def _result_status(result: FrameResult) -> dict:
+    return {'status': 'frame', 'index': result.index, 'source': result.source, 'path': result.path,
+            'duration': result.duration, 'skipped': result.skipped,
+            'error': f'{type(result.error).__name__}: {result.error}' if result.error else None}
+
+
+class RenderClient(object):
+    """
+    Client of the render service. Template is a dict or path to template file readable by the service.
+
+    address     : Unix socket path or "host:port" of the service
+    timeout     : seconds to wait for connection and each status line
+    """
+    def __init__(self, address: str = None, timeout: float = None):
+        self.address = address or default_address()
+        self.timeout = timeout
+
+    def _connect(self) -> socket.socket:
+        address = _parse_address(self.address)
+        family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def request(self, cmd: str, **params) -> Iterator[dict]:
+        """
+        Send job and iterate over its status lines. RenderError is raised on failed job
+        """
+        with self._connect() as sock, sock.makefile('rwb') as stream:
+            stream.write(json.dumps({'cmd': cmd, **params}, default=str).encode() + b'\n')
+            stream.flush()
+            for line in stream:
+                status = json.loads(line)
+                if status['status'] == 'error':
+                    raise RenderError(status['error'])
+                yield status
+                if status['status'] == 'done':
+                    return
+        raise RenderError('Connection closed by render service')
+
+    def _last(self, cmd: str, **params) -> dict:
+        status = None
+        for status in self.request(cmd, **params):
+            pass
+        return status
+
+    def is_running(self) -> bool:
+        try:
+            self.ping()
+        except OSError:
+            return False
+        return True
+
+    def ping(self) -> dict:
+        return self._last('ping')
+
+    def stats(self) -> dict:
+        return self._last('stats')
+
+    def shutdown(self):
+        self._last('shutdown')
+
+    def render(self, template: Union[dict, str], source: str, output: str, variables: dict = None,
+               template_name: str = None) -> dict:
+        """
+        Render single frame, returns status with output path and render duration
+        """
+        return self._last('render', template=_template_param(template), template_name=template_name,
+                          source=Path(source).absolute(), output=Path(output).absolute(), variables=variables or {})
+
+    def process_sequence(self, template: Union[dict, str], src_dir: str, output_dir: str, variables: dict = None,
+                         template_name: str = None, **options) -> Iterator[dict]:
+        """
+        Render directory of frames, yields status of each frame and final status with number of failed frames
+        """
+        return self.request('sequence', template=_template_param(template), template_name=template_name,
+                            src_dir=Path(src_dir).absolute(), output_dir=Path(output_dir).absolute(),
+                            variables=variables or {}, options=options)
+
+
+def _template_param(template: Union[dict, str, Path]) -> Union[dict, str]:
+    if isinstance(template, CompiledTemplate):
+        return template.template
+    if isinstance(template, dict):
+        return template
+    return Path(template).absolute().as_posix()
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog='python -m frame_stamp.daemon')
+    parser.add_argument('--address', help='Unix socket path or host:port of render service')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('serve', help='run render service')
+    commands.add_parser('stop', help='stop render service')
+    commands.add_parser('stats', help='print cache stats of render service')
+    render_parser = commands.add_parser('render', help='render single frame')
+    render_parser.add_argument('template')
+    render_parser.add_argument('-n', '--name', help='name of template in template file, first template by default')
+    render_parser.add_argument('source')
+    render_parser.add_argument('output')
+    render_parser.add_argument('-v', '--variable', action='append', default=[], help='name=value, value is JSON or text')
+    render_parser.add_argument('--daemon', action='store_true', help='render with running service')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        logging.basicConfig(level=logging.INFO)
+        RenderServer(args.address).serve_forever()
+    elif args.command == 'stop':
+        RenderClient(args.address).shutdown()
+    elif args.command == 'stats':
+        print(json.dumps(RenderClient(args.address).stats(), indent=2))
+    elif args.command == 'render':
+        variables = parse_variables(args.variable)
+        if args.daemon:
+            RenderClient(args.address).render(args.template, args.source, args.output, variables, args.name)
+        else:
+            template = load_template_file(args.template, args.name)
+            save_image(CompiledTemplate(template).bind(args.source, variables).render(), args.output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Render manifest of the sequence output directory.
+
+Manifest keeps a hash of all render inputs for each output frame:
+
+    - source file stat (size and modification time) or its content
+    - compiled template
+    - resolved variables of the frame
+    - library version
+
+On rerun frames with unchanged hash and existing output are skipped, so sequence render
+continues after crash and after template change only changed frames are rendered.
+Fonts and resource files referenced by the template are not part of the hash, use force mode
+after they are changed.
+
+Manifest is written atomically (temporary file and rename) not more often than `save_interval`,
+a killed render loses records of last frames only and renders them again.
+Several processes can share the manifest: on write own changes are merged into the file under a file lock.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Union
+
+from .__version__ import __version__
+from .sharding import FileLock
+from .stamp import CompiledTemplate
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, sort_keys=True, default=str, ensure_ascii=False)
+
+
+def file_signature(path: Union[str, Path], content: bool = False) -> str:
+    """
+    Identity of the source file: size and modification time or digest of content
+    """
+    if content:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(2 ** 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+class RenderManifest(object):
+    """
+    Hashes of rendered frames stored in the output directory.
+
+    output_dir      : directory of rendered frames
+    template        : template used for all frames
+    force           : render all frames, hashes are recorded anyway
+    hash_content    : hash content of source files instead of stat
+    save_interval   : min seconds between writes of manifest file
+    """
+    FILE_NAME = '.framestamp-manifest.json'
+    FORMAT_VERSION = 1
+
+    def __init__(self, output_dir: Union[str, Path], template: Union[dict, CompiledTemplate], force: bool = False,
+                 hash_content: bool = False, save_interval: float = 1.0):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / self.FILE_NAME
+        self.force = force
+        self.hash_content = hash_content
+        self.save_interval = save_interval
+        template = template.template if isinstance(template, CompiledTemplate) else template
+        self._template_hash = hashlib.sha1(_dumps(template).encode()).hexdigest()
+        self._frames = {}
+        # records and removals (None) since last write
+        self._changes = {}
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+        self.load()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def load(self):
+        """
+        Read existing manifest
+        """
+        with self._lock:
+            self._frames = self._read()
+
+    def _read(self) -> dict:
+        """
+        Records of manifest file, broken or foreign manifest is ignored
+        """
+        if not self.path.exists():
+            return {}
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+            if data.get('format') == self.FORMAT_VERSION:
+                return dict(data.get('frames') or {})
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning('Render manifest %s is not readable, all frames are rendered: %s', self.path, e)
+        return {}
+
+    def frame_hash(self, source: Union[str, Path], context: dict) -> str:
+        """
+        Hash of all inputs of the frame render
+        """
+        digest = hashlib.sha1()
+        for part in (file_signature(source, self.hash_content), self._template_hash, _dumps(context), __version__):
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _key(self, save_path: Union[str, Path]) -> str:
+        save_path = Path(save_path)
+        try:
+            return save_path.relative_to(self.output_dir).as_posix()
+        except ValueError:
+            return save_path.as_posix()
+
+    def is_current(self, save_path: Union[str, Path], frame_hash: str) -> bool:
+        """
+        Frame is rendered with the same inputs and output file exists
+        """
+        if self.force:
+            return False
+        with self._lock:
+            recorded = self._frames.get(self._key(save_path))
+        return recorded == frame_hash and Path(save_path).exists()
+
+    def record(self, save_path: Union[str, Path], frame_hash: str):
+        """
+        Remember hash of rendered frame, manifest file is written if save interval is passed
+        """
+        key = self._key(save_path)
+        with self._lock:
+            self._frames[key] = self._changes[key] = frame_hash
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def discard(self, save_path: Union[str, Path]):
+        """
+        Forget frame failed to render
+        """
+        key = self._key(save_path)
+        with self._lock:
+            self._frames.pop(key, None)
+            self._changes[key] = None
+
+    def save(self):
+        """
+        Merge changes into manifest file and write it atomically
+        """
+        with self._lock:
+            if not self._changes:
+                return
+            self._saved_at = time.monotonic()
+            with FileLock(self.path.with_name(self.FILE_NAME + '.lock')):
+                frames = self._read()
+                for key, frame_hash in self._changes.items():
+                    if frame_hash is None:
+                        frames.pop(key, None)
+                    else:
+                        frames[key] = frame_hash
+                self._write(frames)
+            self._frames = frames
+            self._changes = {}
+
+    def _write(self, frames: dict):
+        data = _dumps({'format': self.FORMAT_VERSION, 'version': __version__, 'frames': frames})
+        fd, tmp_path = tempfile.mkstemp(prefix=self.FILE_NAME, suffix='.tmp', dir=self.output_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
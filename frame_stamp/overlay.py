@@ -0,0 +1,136 @@
+"""
+Overlay-only render of sequences.
+
+When the burn-in is composited downstream, plates don't need to be decoded: the template is rendered
+onto a transparent canvas of the plate size (see FrameStamp.is_overlay) and written as RGBA files.
+
+Consecutive frames with the same overlay share one file:
+
+    - before render, signatures of all render units (see frame_stamp.layers.get_signature) are compared
+      with the previous frame. Equal signatures give the same overlay, the frame is not rendered
+    - rendered overlay equal to the previous one is not written again
+
+Static template gives one overlay file for the whole sequence, dynamic one gives a new file on each change.
+Manifest in the output directory maps frames to overlay files:
+
+    {"size": [1920, 1080], "frames": {"1001": "overlay.1001.png", "1002": "overlay.1001.png", ...}}
+
+    >>> manifest = render_overlays(template, (1920, 1080), output_dir, range(1001, 1101), {'shot': 'sh010'})
+    >>> manifest.path(1050)
+"""
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Iterable, Union
+
+from .layers import get_signature
+from .stamp import CompiledTemplate, FrameStamp
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'overlays.json'
+
+
+class OverlayManifest(object):
+    """
+    Overlay files of the sequence frames
+
+    output_dir  : directory of overlay files
+    size        : canvas size
+    frames      : frame > file name in the output directory
+    """
+    def __init__(self, output_dir: Union[str, Path], size: tuple[int, int], frames: dict = None):
+        self.output_dir = Path(output_dir)
+        self.size = tuple(size)
+        self.frames = dict(frames or {})
+
+    @property
+    def files(self) -> list[str]:
+        """
+        Unique overlay files in order of frames
+        """
+        return list(dict.fromkeys(self.frames.values()))
+
+    @property
+    def is_static(self) -> bool:
+        return len(self.files) == 1
+
+    def path(self, frame: int) -> Path:
+        return self.output_dir / self.frames[frame]
+
+    def save(self) -> Path:
+        path = self.output_dir / MANIFEST_NAME
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps({'size': list(self.size), 'frames': {str(k): v for k, v in self.frames.items()}},
+                                  indent=1))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, output_dir: Union[str, Path]) -> 'OverlayManifest':
+        data = json.loads((Path(output_dir) / MANIFEST_NAME).read_text())
+        return cls(output_dir, data['size'], {int(k): v for k, v in data['frames'].items()})
+
+
+def frame_signature(stamp: FrameStamp) -> Union[tuple, None]:
+    """
+    Inputs of all render units of bound frame. None if the overlay can't be predicted
+    """
+    size = stamp.source.size
+    signature = []
+    for shape in stamp.get_shapes():
+        if shape.skip:
+            signature.append((shape, 'skip'))
+            continue
+        for unit in shape.iter_render_units():
+            unit_signature = get_signature(unit, size)
+            if unit_signature is None:
+                return None
+            signature.append((unit.key, unit_signature))
+    return tuple(signature)
+
+
+def render_overlays(template: Union[dict, CompiledTemplate], size: tuple[int, int], output_dir: Union[str, Path],
+                    frames: Iterable[int], context: dict, context_callback: Callable[[int], dict] = None,
+                    name: str = 'overlay', extension: str = 'png', **kwargs) -> OverlayManifest:
+    """
+    Render overlays of the frames onto transparent canvas and write changed ones to the output directory.
+
+    size            : canvas size, size of the plates
+    frames          : frame numbers, variable "frame" of each overlay
+    context_callback: function of frame number returning variables of the frame
+    name            : overlay file is named "{name}.{frame:04d}.{extension}" by first frame it is used by
+    extension       : format with alpha channel: png, tif, webp
+
+    Template dict is compiled with static layers, unchanged shapes are not rendered again on changed frames.
+    Returns saved manifest
+    """
+    if not isinstance(template, CompiledTemplate):
+        template = CompiledTemplate(template, static_layers=True)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = OverlayManifest(output_dir, size)
+    signature = data = file_name = None
+    rendered = 0
+    for frame in frames:
+        variables = {**context, 'frame': frame}
+        if context_callback:
+            variables.update(context_callback(frame))
+        stamp = template.bind(size, variables)
+        if signature is not None and frame_signature(stamp) == signature:
+            manifest.frames[frame] = file_name
+            continue
+        img = stamp.render(**kwargs)
+        rendered += 1
+        # inputs read while rendering are known now, next frame is compared with them
+        signature = frame_signature(stamp)
+        frame_data = img.tobytes()
+        if frame_data != data:
+            data = frame_data
+            file_name = f'{name}.{frame:04d}.{extension}'
+            img.save(output_dir / file_name)
+        manifest.frames[frame] = file_name
+    manifest.save()
+    logger.debug('Overlays: %s frames, %s rendered, %s files', len(manifest.frames), rendered, len(manifest.files))
+    return manifest
@@ -0,0 +1,100 @@
+"""
+Parallel rasterization of shapes of one frame.
+
+Shapes refer to each other through scope, so layout is resolved first on the calling thread in z-order:
+geometry of every shape and its parents is computed and cached before any shape is drawn.
+Then render units (see BaseShape.iter_render_units) are rasterized on a thread pool. A unit draws only
+its own shape, or children of a combined shape, and reads cached geometry of the other shapes.
+Overlays are composited on the calling thread in z-order, each unit after all previous units,
+so the frame is identical to sequential render.
+
+Units of shapes with random values are rendered on the calling thread in their turn,
+random numbers are taken in the same order as by sequential render.
+Not more than two units per worker are rasterized ahead of compositing.
+
+    >>> units = [unit for shape in shapes for unit in shape.iter_render_units()]
+    >>> render_units(units, image.size, partial(paste_trimmed, image), workers=8)
+"""
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Callable
+
+from .shape.base_shape import BaseShape, RenderUnit, RootParent
+from .utils import expressions
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_layout(shape: BaseShape):
+    """
+    Compute and cache geometry of the shape and all its parents
+    """
+    while shape is not None and not isinstance(shape, RootParent):
+        shape.is_enabled()
+        shape.x, shape.y, shape.width, shape.height
+        shape.global_rotate, shape.rotation_pivot, shape.center
+        shape = shape.parent
+
+
+def uses_random(shape: BaseShape) -> bool:
+    """
+    Any parameter of the shape or of its inner shapes can call random functions.
+    Names are searched in all strings, plain text with the same words is treated as random too
+    """
+    stack = [shape._data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            if not expressions.VOLATILE_NAMES.isdisjoint(expressions.NAME_PATTERN.findall(value)):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(v for k, v in value.items() if k != 'parent')
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+def _rasterize(unit: RenderUnit, size: tuple[int, int], kwargs: dict) -> list:
+    try:
+        return list(unit.render(size, **kwargs))
+    except Exception as e:
+        logger.error('Error rendering shape %s: %s', unit.shape, e)
+        raise
+
+
+def render_units(units: list[RenderUnit], size: tuple[int, int], composite: Callable, workers: int, **kwargs):
+    """
+    Rasterize units on `workers` threads and composite overlays with composite(overlay, pos) in order of units
+    """
+    serial = [uses_random(unit.shape) for unit in units]
+    for unit, is_serial in zip(units, serial):
+        if not is_serial:
+            for shape in chain((unit.shape,), unit.layout_shapes):
+                resolve_layout(shape)
+    queued = iter(zip(units, serial))
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-stamp-shape') as pool:
+
+        def submit_ahead():
+            while len(pending) < workers * 2:
+                try:
+                    unit, is_serial = next(queued)
+                except StopIteration:
+                    return
+                pending.append((unit, None if is_serial else pool.submit(_rasterize, unit, size, kwargs)))
+
+        try:
+            submit_ahead()
+            while pending:
+                unit, future = pending.popleft()
+                submit_ahead()
+                overlays = _rasterize(unit, size, kwargs) if future is None else future.result()
+                for overlay, pos in overlays:
+                    composite(overlay, tuple(pos))
+                del overlays
+        finally:
+            for _, future in pending:
+                if future is not None:
+                    future.cancel()
@@ -0,0 +1,563 @@
+"""
+Streaming render of image sequences.
+
+Frames pass three stages:
+
+    decode  : thread preparing frames ahead of render: variables, decoded source in thread mode
+              or with shared memory transport
+    render  : pool of workers rendering the template: processes, threads or one thread
+    encode  : threads writing rendered images
+
+Thread workers share one compiled template (it keeps own shapes for each thread), decode sources
+and render without pickling. PIL releases GIL in decode, compositing and encode, so threads
+scale on large frames. Render processes load the template once in pool initializer and warm up its caches
+with blank frame of the first source size. Tasks carry only source path and variables
+changed relative to the sequence context, worker decodes the source itself.
+Frames are sent to processes in chunks sized by chunk policy (see AdaptiveChunks).
+
+Not more than `depth` frames are in the pipeline at once: decoded, rendering, waiting for write
+or waiting for previous frames in ordered mode. Decode stage waits for a free slot,
+so memory does not depend on sequence length. Default depth is 2 frames per render worker.
+Render processes get more frames for full chunks while frames in flight fit PIPELINE_MEMORY_MB
+(decoded and rendered RGBA frames), so small frames are chunked and large ones are not buffered.
+Each frame gives a FrameResult record, error of one frame does not stop the sequence.
+
+    >>> pipeline = SequencePipeline(template, max_workers=8)
+    >>> for result in pipeline.run(jobs):
+    >>>     print(result.path, result.duration, result.error)
+"""
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Union
+
+from PIL import Image
+
+from .manifest import RenderManifest
+from .sharding import FrameClaims
+from .stamp import FrameStamp, CompiledTemplate
+from .transport import SharedFrame, SharedFrameRing
+
+logger = logging.getLogger(__name__)
+BACKENDS = ('process', 'thread')
+# memory of frames in flight for default depth of render processes
+PIPELINE_MEMORY = int(float(os.getenv('FRAMESTAMP_PIPELINE_MB', 1024)) * 2**20)
+
+
+class FrameJob(object):
+    """
+    Frame of the sequence to render.
+
+    index       : frame index in the sequence
+    source      : source image path
+    save_path   : output image path
+    context     : variables of the frame or function returning them, called by decode stage
+    """
+    __slots__ = ('index', 'source', 'save_path', 'context', 'start')
+
+    def __init__(self, index: int, source: Union[str, Path], save_path: Union[str, Path],
+                 context: Union[dict, Callable[[], dict]]):
+        self.index = index
+        self.source = Path(source)
+        self.save_path = Path(save_path)
+        self.context = context
+        self.start = None
+
+    def get_context(self) -> dict:
+        return self.context() if callable(self.context) else self.context
+
+
+class FrameResult(object):
+    """
+    Result of one frame of the sequence.
+
+    index       : frame index in the sequence
+    source      : source image path
+    path        : saved image path, None on error
+    duration    : seconds from decode start to written file
+    error       : exception raised by any stage or None
+    skipped     : frame is not rendered, output is up to date according to render manifest
+                  or frame is claimed by other process
+    """
+    __slots__ = ('index', 'source', 'path', 'duration', 'error', 'skipped')
+
+    def __init__(self, index: int, source: Path, path: Path = None, duration: float = 0.0, error: Exception = None,
+                 skipped: bool = False):
+        self.index = index
+        self.source = source
+        self.path = path
+        self.duration = duration
+        self.error = error
+        self.skipped = skipped
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        state = f'error={self.error!r}' if self.error else f'path={self.path}'
+        if self.skipped:
+            state += ' skipped'
+        return f'<FrameResult #{self.index} {state} {self.duration:.3f}s>'
+
+
+def read_image(path: Union[str, Path]) -> Image.Image:
+    img = Image.open(str(path))
+    img.load()
+    return img
+
+
+def render_frame(image: Image.Image, template: Union[dict, CompiledTemplate], context: dict) -> Image.Image:
+    """
+    Render one decoded frame, runs in render worker
+    """
+    return FrameStamp(image, template, context).render()
+
+
+def render_chunk(template: Union[dict, CompiledTemplate], tasks: list[tuple]) -> list[tuple]:
+    """
+    Render frames of one task. Task frame is decoded image, frame in shared memory or source path with variables.
+    Returns rendered image, error and render duration for each frame.
+    Frame in shared memory is rendered in place and returned as is
+    """
+    rendered = []
+    for image, context in tasks:
+        start = time.perf_counter()
+        try:
+            if isinstance(image, SharedFrame):
+                image.write(render_frame(image.image(), template, context))
+                rendered.append((image, None, time.perf_counter() - start))
+                continue
+            if not isinstance(image, Image.Image):
+                image = read_image(image)
+            rendered.append((render_frame(image, template, context), None, time.perf_counter() - start))
+        except Exception as e:
+            rendered.append((None, e, time.perf_counter() - start))
+    return rendered
+
+
+# state of render process, set by pool initializer
+_worker_template = None
+_worker_context = None
+
+
+def init_worker(template: CompiledTemplate, context: dict, warm_up_source: str = None, warm_up_context: dict = None):
+    """
+    Initializer of render process: template is unpickled, compiled and warmed up once for process lifetime.
+    Warm up renders blank frame of source size with variables of the first frame
+    """
+    global _worker_template, _worker_context
+    _worker_template = CompiledTemplate.from_template(template)
+    _worker_context = context
+    if warm_up_source:
+        try:
+            with Image.open(warm_up_source) as img:
+                size = img.size
+        except Exception as e:
+            # broken frame is reported by its task
+            logger.debug('Warm up source not readable: %s', e)
+            return
+        _worker_template.warm_up(size, warm_up_context or context)
+
+
+def render_in_worker(tasks: list[tuple[Union[str, SharedFrame], dict]]) -> list[tuple]:
+    """
+    Render task of initialized process: source paths or shared frames with changed variables of the frames
+    """
+    return render_chunk(_worker_template, [(source, {**_worker_context, **variables}) for source, variables in tasks])
+
+
+class ChunkPolicy(object):
+    """
+    Fixed number of frames sent to render process with one task
+    """
+    def __init__(self, size: int = 1):
+        self.size = max(1, int(size))
+
+    @property
+    def max_size(self) -> int:
+        return self.size
+
+    def next_size(self, remaining: int = None, workers: int = 1) -> int:
+        return self.size
+
+    def update(self, durations: list[float]):
+        """
+        Render time of each frame of completed task
+        """
+
+
+class AdaptiveChunks(ChunkPolicy):
+    """
+    Chunk size from measured render time of frames: task takes about `target` seconds,
+    so IPC cost of small frames is shared by many frames and heavy frames are sent one by one.
+    Near the end of the sequence chunks shrink to a half of remaining frames per worker,
+    workers finish at the same time instead of waiting for one long chunk.
+    """
+    def __init__(self, target: float = 0.05, max_size: int = 16, smoothing: float = 0.2):
+        super().__init__(1)
+        self.target = target
+        self._max_size = max(1, max_size)
+        self.smoothing = smoothing
+        self.frame_time = None
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    def next_size(self, remaining: int = None, workers: int = 1) -> int:
+        if self.frame_time is None:
+            # first frames measure render time
+            return 1
+        size = int(self.target / max(self.frame_time, 1e-6))
+        if remaining is not None:
+            size = min(size, math.ceil(remaining / (2 * workers)))
+        return max(1, min(self._max_size, size))
+
+    def update(self, durations: list[float]):
+        for duration in durations:
+            if self.frame_time is None:
+                self.frame_time = duration
+            else:
+                self.frame_time += (duration - self.frame_time) * self.smoothing
+
+
+def get_chunk_policy(chunking: Union[str, int, ChunkPolicy, None]) -> ChunkPolicy:
+    """
+    Chunk policy from process_sequence option: "adaptive", number of frames, None for one frame per task
+    """
+    if isinstance(chunking, ChunkPolicy):
+        return chunking
+    if chunking is None:
+        return ChunkPolicy(1)
+    if chunking == 'adaptive':
+        return AdaptiveChunks()
+    if isinstance(chunking, int):
+        return ChunkPolicy(chunking)
+    raise ValueError(f'Unknown chunking policy: {chunking}')
+
+
+def get_context_delta(context: dict, base: dict) -> dict:
+    """
+    Variables of the frame context which are missing or different in base context
+    """
+    return {key: value for key, value in context.items() if key not in base or base[key] != value}
+
+
+def save_image(img: Image.Image, path: Union[str, Path]) -> Path:
+    """
+    Write image with format from file extension
+    """
+    path = Path(path)
+    frmt = Image.registered_extensions().get(path.suffix.lower())
+    if frmt == 'JPEG' and img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.save(path.as_posix(), frmt)
+    return path
+
+
+class _End(object):
+    """
+    Last item of results queue, count of frames taken by decode stage
+    """
+    __slots__ = ('count',)
+
+    def __init__(self, count: int):
+        self.count = count
+
+
+class SequencePipeline(object):
+    """
+    Bounded decode > render > encode pipeline.
+
+    template        : template used for all frames
+    context         : variables shared by all frames, sent to render processes once
+    multithread     : render in pool of workers, otherwise in one thread
+    max_workers     : number of render workers, cpu count by default
+    backend         : pool of workers: "process" or "thread"
+    depth           : max number of frames in the pipeline, 2 frames per render worker by default,
+                      more frames for chunks of render processes within PIPELINE_MEMORY
+    ordered         : yield results in order of jobs, otherwise as completed
+    encode_workers  : number of threads writing images
+    chunking        : frames per render process task, see get_chunk_policy. Thread render takes frames one by one
+    transport       : "shm" to decode frames in this process and exchange pixels with render processes
+                      through shared memory slots (see frame_stamp.transport), one slot per frame in flight.
+                      By default render processes decode sources and send rendered frames back pickled
+    manifest        : render manifest of output directory, up to date frames are skipped (see frame_stamp.manifest)
+    claims          : claims of frames in output directory shared with other processes, frames claimed
+                      by other processes are skipped (see frame_stamp.sharding). Requires manifest
+    """
+    def __init__(self, template: Union[dict, CompiledTemplate], context: dict = None, multithread: bool = True,
+                 max_workers: int = None, depth: int = None, ordered: bool = True, encode_workers: int = 2,
+                 chunking: Union[str, int, ChunkPolicy, None] = 'adaptive', transport: str = None,
+                 manifest: RenderManifest = None, claims: FrameClaims = None, backend: str = 'process'):
+        self.template = CompiledTemplate.from_template(template)
+        self.context = context or {}
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown render backend: {backend}')
+        if transport not in (None, 'shm'):
+            raise ValueError(f'Unknown frame transport: {transport}')
+        self.multithread = multithread
+        self.backend = backend if multithread else None
+        self.max_workers = (max_workers or multiprocessing.cpu_count()) if multithread else 1
+        # processes only exchange frames and chunks of tasks, threads share memory
+        self.processes = self.backend == 'process'
+        self.transport = transport if self.processes else None
+        self.chunks = get_chunk_policy(chunking) if self.processes else ChunkPolicy(1)
+        self.depth = max(1, depth or self.max_workers * 2)
+        # with default depth render processes get more frames for chunks once frame size is known
+        self._chunk_depth = not depth and self.processes and self.transport is None and self.chunks.max_size > 1
+        self.ordered = ordered
+        self.encode_workers = max(1, encode_workers)
+        self.manifest = manifest
+        self.claims = claims
+        if claims is not None and manifest is None:
+            raise ValueError('Frame claims require render manifest')
+
+    def _create_render_pool(self, job: FrameJob, context: dict):
+        """
+        Pool is created for the first frame, its size and variables are used to warm up render processes
+        """
+        if self.processes:
+            logger.info('Use multiprocess render (%s cpu)', self.max_workers)
+            return ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_worker,
+                                       initargs=(self.template, self.context, job.source.as_posix(), context))
+        if self.backend == 'thread':
+            logger.info('Use multithread render (%s threads)', self.max_workers)
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='frame-stamp-render')
+
+    def get_chunk_depth(self, source: Union[str, Path]) -> int:
+        """
+        Frames in the pipeline to fill chunks of all render processes, limited by memory of decoded
+        and rendered frames of the source size
+        """
+        try:
+            with Image.open(source) as img:
+                frame_bytes = img.size[0] * img.size[1] * 4 * 2
+        except OSError:
+            return self.depth
+        limit = self.max_workers * 2 * self.chunks.max_size
+        return max(self.depth, min(limit, PIPELINE_MEMORY // max(1, frame_bytes)))
+
+    def _prepare_task(self, job: FrameJob, context: dict, ring: SharedFrameRing = None) -> tuple:
+        if not self.multithread:
+            return read_image(job.source), context
+        if not self.processes:
+            # thread worker decodes the source itself
+            return job.source.as_posix(), context
+        delta = get_context_delta(context, self.context)
+        if ring is not None:
+            image = read_image(job.source)
+            if ring.fits(image.size):
+                frame = ring.acquire(image.size)
+                try:
+                    frame.write(image)
+                except Exception:
+                    ring.release(frame)
+                    raise
+                return frame, delta
+            logger.debug('Frame %s does not fit shared memory slot, send path', job.source)
+        return job.source.as_posix(), delta
+
+    def _submit_chunk(self, pool, tasks: list[tuple]) -> Future:
+        if self.processes:
+            return pool.submit(render_in_worker, tasks)
+        return pool.submit(render_chunk, self.template, tasks)
+
+    def run(self, jobs: Iterable[FrameJob], total: int = None) -> Iterator[FrameResult]:
+        """
+        Render all jobs, yields result of each frame.
+        Jobs are taken from iterable only when pipeline has a free slot.
+        Total number of jobs is used to shrink chunks at the end of sequence
+        """
+        if total is None and hasattr(jobs, '__len__'):
+            total = len(jobs)
+        results = queue.Queue()
+        slots = threading.Semaphore(self.depth)
+        stop = threading.Event()
+        render_pool = None
+        encode_pool = ThreadPoolExecutor(max_workers=self.encode_workers, thread_name_prefix='frame-stamp-encode')
+        ring = None
+        # shared frames and manifest hashes of frames in flight
+        frames = {}
+        hashes = {}
+
+        def finish(seq: int, job: FrameJob, error: BaseException = None):
+            frame = frames.pop(seq, None)
+            if frame is not None:
+                ring.release(frame)
+            frame_hash = hashes.pop(seq, None)
+            if frame_hash is not None:
+                if error is None:
+                    self.manifest.record(job.save_path, frame_hash)
+                else:
+                    self.manifest.discard(job.save_path)
+                if self.claims is not None:
+                    if error is None:
+                        self.claims.complete(job.save_path, frame_hash)
+                    else:
+                        self.claims.release(job.save_path, frame_hash)
+            if error is not None and not isinstance(error, CancelledError):
+                logger.error('Error processing frame %s (%s): %s', job.index, job.source, error)
+            results.put((seq, FrameResult(job.index, job.source, None if error else job.save_path,
+                                          time.perf_counter() - job.start, error)))
+
+        def encode(seq: int, job: FrameJob, image: Union[Image.Image, SharedFrame]):
+            try:
+                if isinstance(image, SharedFrame):
+                    image = image.image()
+                save_image(image, job.save_path)
+                del image
+            except BaseException as e:
+                finish(seq, job, e)
+            else:
+                finish(seq, job)
+
+        def on_rendered(items: list[tuple], future: Future):
+            try:
+                if stop.is_set():
+                    raise CancelledError()
+                rendered = future.result()
+            except BaseException as e:
+                for seq, job, _ in items:
+                    finish(seq, job, e)
+                return
+            self.chunks.update([duration for _, error, duration in rendered if error is None])
+            for (seq, job, _), (image, error, _) in zip(items, rendered):
+                if error is not None:
+                    finish(seq, job, error)
+                    continue
+                try:
+                    encode_pool.submit(encode, seq, job, image)
+                except RuntimeError as e:
+                    # pool is closed
+                    finish(seq, job, e)
+
+        def decode():
+            nonlocal render_pool, ring
+            count = 0
+            chunk = []
+            size = 1
+
+            def submit():
+                nonlocal chunk
+                if not chunk:
+                    return
+                items, chunk = chunk, []
+                try:
+                    future = self._submit_chunk(render_pool, [task for _, _, task in items])
+                except Exception as e:
+                    for seq, job, _ in items:
+                        finish(seq, job, e)
+                    return
+                future.add_done_callback(partial(on_rendered, items))
+
+            try:
+                for job in jobs:
+                    if not slots.acquire(blocking=False):
+                        # frames of incomplete chunk hold slots, send them before waiting
+                        submit()
+                        while not slots.acquire(timeout=0.1):
+                            if stop.is_set():
+                                return
+                    if stop.is_set():
+                        return
+                    seq, count = count, count + 1
+                    job.start = time.perf_counter()
+                    try:
+                        context = job.get_context()
+                        if self.manifest is not None:
+                            frame_hash = self.manifest.frame_hash(job.source, context)
+                            if self.manifest.is_current(job.save_path, frame_hash) or (
+                                    self.claims is not None and not self.claims.claim(job.save_path, frame_hash)):
+                                results.put((seq, FrameResult(job.index, job.source, job.save_path, skipped=True)))
+                                continue
+                            hashes[seq] = frame_hash
+                        if render_pool is None:
+                            render_pool = self._create_render_pool(job, context)
+                            if self._chunk_depth:
+                                depth = self.get_chunk_depth(job.source)
+                                if depth > self.depth:
+                                    logger.debug('Pipeline depth %s frames', depth)
+                                    slots.release(depth - self.depth)
+                        if self.transport == 'shm' and ring is None:
+                            with Image.open(job.source) as img:
+                                ring = SharedFrameRing(self.depth, img.size[0] * img.size[1] * 4)
+                        task = self._prepare_task(job, context, ring)
+                        if isinstance(task[0], SharedFrame):
+                            frames[seq] = task[0]
+                    except Exception as e:
+                        finish(seq, job, e)
+                        continue
+                    if not chunk:
+                        size = self.chunks.next_size(None if total is None else total - seq, self.max_workers)
+                    chunk.append((seq, job, task))
+                    if len(chunk) >= size:
+                        submit()
+                submit()
+            except Exception as e:
+                logger.exception('Error reading sequence jobs: %s', e)
+            finally:
+                results.put(_End(count))
+
+        decoder = threading.Thread(target=decode, name='frame-stamp-decode', daemon=True)
+        decoder.start()
+        waiting = {}
+        next_seq = 0
+        taken = None
+        try:
+            while taken is None or next_seq < taken:
+                item = results.get()
+                if isinstance(item, _End):
+                    taken = item.count
+                    continue
+                seq, result = item
+                if self.ordered:
+                    waiting[seq] = result
+                    while next_seq in waiting:
+                        next_seq += 1
+                        slots.release()
+                        yield waiting.pop(next_seq - 1)
+                else:
+                    next_seq += 1
+                    slots.release()
+                    yield result
+        finally:
+            stop.set()
+            decoder.join()
+            if render_pool is not None:
+                render_pool.shutdown(wait=True, cancel_futures=True)
+            encode_pool.shutdown(wait=True)
+            if ring is not None:
+                ring.close()
+            if self.manifest is not None:
+                self.manifest.save()
+
+
+def iter_jobs(files: list[Path], output_dir: Union[str, Path], context: dict, context_callback: Callable = None,
+              indices: Iterable[int] = None, **kwargs) -> Iterator[FrameJob]:
+    """
+    Jobs of the sequence files or of selected frame indices.
+    Context callback is called when frame is taken by decode stage
+    """
+    total = len(files)
+    for i in range(total) if indices is None else indices:
+        file = files[i]
+        base_context = {**context, 'frame': i, 'file': file, 'total_frames': total}
+        if context_callback:
+            frame_context = partial(_callback_context, base_context, context_callback, i, file, total, kwargs)
+        else:
+            frame_context = base_context
+        yield FrameJob(i, file, Path(output_dir, file.name), frame_context)
+
+
+def _callback_context(base_context: dict, context_callback: Callable, i: int, file: Path, total: int,
+                      kwargs: dict) -> dict:
+    return {**base_context, **context_callback(i, file, total, **kwargs)}
@@ -7,12 +7,16 @@ import string
 
 from PIL import Image, ImageDraw
 
-from frame_stamp.utils import cached_result, geometry_tools
-from frame_stamp.utils.point import Point
+from frame_stamp.utils import READS_PARENT, READS_VOLATILE, cached_result, expressions, geometry_tools, \
+    invalidate_cached, record_read
+from frame_stamp.utils.point import Point, PointInt
 from frame_stamp.utils.rect import Rect
 
 logger = logging.getLogger(__name__)
 
+# "tight": canvas of the shape bounds (rotated shapes use square canvas), "square": canvas of 2.2 shape diagonals
+CANVAS_STRATEGY = os.getenv('FRAMESTAMP_CANVAS', 'tight')
+
 
 try:
     BICUBIC = Image.BICUBIC
@@ -43,6 +47,8 @@ class BaseShape:
     names_stop_list = ['parent']
     default_width = 0
     default_height = 0
+    # shape is drawn on the tight canvas, see CANVAS_STRATEGY
+    tight_canvas = True
 
     def __init__(self, shape_data, context, **kwargs):
         if shape_data.get('id') in self.names_stop_list:
@@ -54,6 +60,10 @@ class BaseShape:
         self._local_context = kwargs.get('local_context') or {}
         self._debug_enabled = bool(os.environ.get('DEBUG_SHAPES'))
         self._debug_variables = {}
+        # inputs read while computing values, used to find shapes that do not change between frames
+        self._variable_deps = set()
+        self._shape_deps = set()
+        self._volatile = False
         if 'parent' in shape_data:
             parent_name = shape_data['parent']
             if isinstance(parent_name, BaseShape):
@@ -78,17 +88,91 @@ class BaseShape:
 
     def clear_cache(self):
         self.__cache__.clear()
+        self.__dict__.pop('__cache_reads__', None)
+
+    def invalidate_cache(self, names: set) -> bool:
+        """
+        Drop computed values depending on the inputs: variable names, READS_PARENT, READS_FILES.
+        Volatile values are dropped too. Returns True if any value is dropped
+        """
+        return invalidate_cached(self, names)
+
+    def reset(self):
+        """
+        Drop all computed values before rendering with new source image or variables
+        """
+        self.clear_cache()
+        if isinstance(self._parent, RootParent):
+            self._parent.clear_cache()
+
+    def update_layout(self):
+        """
+        Recompute layout of child shapes after reset. Used by combined shapes
+        """
+
+    def refresh_variables(self):
+        """
+        Take variables of the new frame, values computed from other inputs are kept
+        """
+        self.__cache__.pop(VARIABLES_KEY, None)
+        if isinstance(self._parent, RootParent):
+            self._parent.refresh_variables()
+
+    def iter_child_shapes(self):
+        """
+        Shapes created by combined shape, its layout depends on them
+        """
+        return iter(())
+
+    def resource_keys(self) -> tuple:
+        """
+        Identity of resource files read by the shape, part of the render signature
+        """
+        return ()
+
+    # DEPENDENCIES
+
+    def _track_variable(self, name: str):
+        self._variable_deps.add(name)
+        record_read(name)
+
+    def _track_shape(self, shape: 'BaseShape'):
+        if shape is not self and not isinstance(shape, RootParent):
+            self._shape_deps.add(shape)
+
+    def _track_volatile(self):
+        """
+        Result of the shape is different on each render (random, current time, source pixels)
+        """
+        self._volatile = True
+        record_read(READS_VOLATILE)
+
+    def iter_render_units(self):
+        """
+        Independent parts of the shape render in z-order
+        """
+        yield RenderUnit(self, self.render)
 
     def update_local_context(self, **kwargs):
+        """
+        Set variables of the shape only, values computed from their previous values are dropped
+        """
         self._local_context.update(kwargs)
+        self.refresh_variables()
+        self.invalidate_cache(set(kwargs))
 
     @property
     @cached_result
     def parent(self):
+        record_read(READS_PARENT)
         return self._parent or RootParent(self.context)
 
     def set_parent(self, parent):
+        """
+        Values computed from the previous parent are dropped
+        """
         self._parent = parent
+        self.invalidate_cache({READS_PARENT})
 
     @property
     @cached_result
@@ -113,9 +197,9 @@ class BaseShape:
     @cached_result
     def variables(self) -> dict:
         return {
-            "source_width": self.source_image.size[0],
-            "source_height": self.source_image.size[1],
-            "source_aspect": self.source_image.size[1]/self.source_image.size[0],
+            "source_width": self.source_frame.size[0],
+            "source_height": self.source_frame.size[1],
+            "source_aspect": self.source_frame.size[1]/self.source_frame.size[0],
             "unt": self.unit,
             "pnt": self.point,
             **self.context['variables'],
@@ -126,20 +210,20 @@ class BaseShape:
     @cached_result
     def unit(self):
         # 1% from height
-        return round(self.source_image.size[1]*0.01, 3)
+        return round(self.source_frame.size[1]*0.01, 3)
 
     @property
     @cached_result
     def point(self):
         # relative almost monotonic size for any aspect and size
         from math import sqrt
-        w, h = self.source_image.size
+        w, h = self.source_frame.size
         return round(0.01*sqrt(w*h), 3)
 
     @property
     @cached_result
     def z_index(self):
-        parent_index = self._parent.z_index if self._parent else 0
+        parent_index = self.parent.z_index
         return parent_index + self._eval_parameter('z_index', default=0) # shape_data.get('z_index', 0)
 
     @property
@@ -150,12 +234,22 @@ class BaseShape:
         return {k: v for k, v in self.context['scope'].items() if k != self.id}
 
     @property
-    def source_image(self):
+    def source_frame(self):
+        """
+        Source frame, its size is known before pixels are decoded (see frame_stamp.source)
+        """
         return self.context['source_image']
 
+    @property
+    def source_image(self):
+        """
+        Source image canvas, pixels are decoded on first access
+        """
+        return self.context['source_image'].canvas
+
     @property
     def source_image_raw(self):
-        return self.context['source_image_raw']
+        return self.context['source_image'].raw
 
     def add_shape(self, shape):
         return self.context['add_shape'](shape)
@@ -206,31 +300,9 @@ class BaseShape:
         if not isinstance(val, str):
             raise TypeError('Unsupported type {}'.format(type(val)))
         # only the line remains
-        if val.isdigit():  # int
-            return int(val)
-        elif re.match(r"^\d*\.\d*$", val):  # float
-            return float(val)
-        # unit
-        if re.match(r"-?[\d.]+u", val):
-            return float(val.rstrip('u')) * self.unit
-        # point
-        if re.match(r"-?[\d.]+p", val):
-            return float(val.rstrip('p')) * self.point
-
-        # identifying other options
-        for func in [self._eval_percent_of_default,     # percentage of default value
-                     self._eval_from_scope,             # data from another shape
-                     self._eval_from_variables,         # data from template variables or from defaults
-                     self._eval_expression]:            # execution of express
-            try:
-                res = func(key, val, **kwargs)
-            except KeyError:
-                continue
-            if res is not None:
-                return res
-        return val
-
-    def _eval_percent_of_default(self, key, val, **kwargs):
+        return expressions.compile_value(val).evaluate(self, key, kwargs)
+
+    def _resolve_percent(self, key, percent: float, **kwargs):
         """
         Calculating the percentage of the default value
 
@@ -238,18 +310,9 @@ class BaseShape:
 
         Parameters
         ----------
-        key
-        val
-        default_key
-
-        Returns
-        -------
-
+        key: str
+        percent: float
         """
-        match = re.match(r'^(\d+)%$', val)
-        if not match:
-            return
-        percent = float(match.group(1))
         default = kwargs.get('default', self.defaults.get(kwargs.get('default_key') or key))
         if default is None:
             raise KeyError('No default value for key {}'.format(key))
@@ -259,7 +322,7 @@ class BaseShape:
         else:
             raise TypeError('Percent value must be int or float, not {}'.format(type(percent)))
 
-    def _eval_from_scope(self, key: str, val: str, **kwargs):
+    def _resolve_scope_attr(self, name: str, attr: str):
         """
         Accessing parameter values of other shapes
 
@@ -267,26 +330,23 @@ class BaseShape:
 
         Parameters
         ----------
-        key: str
-        val: str
-        default_key: str
+        name: str
+        attr: str
         """
-        match = re.match(r'^(\w+)\.(\w+)$', val)
-        if not match:
-            return
-        name, attr = match.groups()
         if name == self.id:
             raise RecursionError('Don`t use ID of same object in itself expression. '
                                  'Use name "self": "x": "=-10-self.width.')
         if name == 'parent':
+            self._track_shape(self.parent)
             return getattr(self.parent, attr)
         if name == 'self':
             return getattr(self, attr)
         if name not in self.scope:
             return
+        self._track_shape(self.scope[name])
         return getattr(self.scope[name], attr)
 
-    def _eval_from_variables(self, key: str, val: str, **kwargs):
+    def _resolve_variable(self, key: str, variable: str):
         """
         Getting a value from the global variable context
 
@@ -295,13 +355,9 @@ class BaseShape:
         Parameters
         ----------
         key: str
-        val: str
-        default_key: str
+        variable: str
         """
-        match = re.match(r"\$([\w\d_]+)", val)
-        if not match:
-            return
-        variable = match.group(1)
+        self._track_variable(variable)
         if variable in self.variables:
             return self._eval_parameter_convert(key, self.variables[variable])
         elif variable in self.defaults:
@@ -319,24 +375,11 @@ class BaseShape:
         ----------
         key: str
         expr: str
-        default_key: str
         """
-        expr = expr.strip('`')
-        if not expr.startswith('='):
+        node = expressions.compile_value(expr)
+        if not isinstance(node, expressions.Expression):
             return
-        expr = expr.lstrip('=')
-        for op in re.findall(r"[\w\d.%$]+", expr):
-            val = self._eval_parameter_convert(key, op)
-            if val is None:
-                val = op
-                # raise ValueError('Expression operand "{}" is nt correct: {}'.format(op, expr))
-            expr = expr.replace(op, str(val if not callable(val) else val()))
-        try:
-            res = eval(expr, {**locals(), **self.render_globals()})
-        except Exception as e:
-            logger.exception('Evaluate expression error in field {}/{}: {}'.format(self, key, expr))
-            raise
-        return res
+        return node.evaluate(self, key, kwargs)
 
     def render_globals(self):
         return dict(
@@ -349,6 +392,7 @@ class BaseShape:
 
     def _render_variables(self, text, context):
         for pattern, name, _slice in re.findall(r"(\$([\w_]+)(\[[\d:]+])?)", text):
+            self._track_variable(name)
             val = context[name]
             if _slice:
                 indexes = _slice.strip('[]').split(':')
@@ -366,6 +410,7 @@ class BaseShape:
     @cached_result
     def debug_options(self):
         debug_options = {}
+        self._track_variable('debug')
         variables_debug_options = self.variables.get('debug')
         if variables_debug_options is not None:
             assert isinstance(variables_debug_options, dict),  'Debug value must be a dict'
@@ -633,7 +678,8 @@ class BaseShape:
         return gradient_list
 
     def get_resource_search_dirs(self):
-        paths = self.variables.get('local_resource_paths') or []
+        self._track_variable('local_resource_paths')
+        paths = list(self.variables.get('local_resource_paths') or [])
         paths.extend(self.defaults.get('local_resource_paths') or [])
         paths.append(os.path.abspath(os.path.dirname(__file__)+'/../fonts'))
         search_dirs_from_env = os.getenv('FRAMESTAMP_RESOURCE_DIR')
@@ -643,6 +689,8 @@ class BaseShape:
 
     def get_resource_file(self, file_name):
         while '$' in file_name:
+            for name in re.findall(r'\$\{?(\w+)', file_name):
+                self._track_variable(name)
             file_name = string.Template(file_name).substitute({**self.variables, **self.defaults})
         file_name = os.path.expanduser(file_name)
         if os.path.isabs(file_name) and os.path.exists(file_name):
@@ -652,17 +700,45 @@ class BaseShape:
                 path = os.path.join(search_dir, file_name)
                 if os.path.exists(path):
                     return path
+            self._track_variable('get_resource_func')
             func = self.context['variables'].get('get_resource_func')
             if func:
                 return func(file_name)
         raise OSError('File not found: {}'.format(file_name))
 
     def _get_render_sized_canvas(self):
+        canvas_size, center, zero = self._get_square_canvas_geometry()
+        return self._get_canvas(canvas_size), canvas_size, center, zero
+
+    def _get_square_canvas_geometry(self):
+        """
+        Size, rotation center and zero point of the square canvas which fits the shape with any rotation
+        """
         side_size = int(self._compute_maximum_distance_from_center() * 2.2) + int(self.shape_canvas_offset()+2)
         canvas_size = (side_size, side_size)
         center = Point(side_size/2, side_size/2)
         zero = Point((side_size-self.width) / 2, (side_size-self.height) / 2)
-        return self._get_canvas(canvas_size), canvas_size, center, zero
+        return canvas_size, center, zero
+
+    def _get_tight_canvas_box(self, canvas_size: tuple[int, int], zero: Point) -> tuple:
+        """
+        Smallest part of the square canvas that contains the shape.
+        Drawing on this part gives the same pixels as drawing on the whole square canvas.
+        """
+        left, top, right, bottom = self.canvas_margins()
+        box = (zero.x - left, zero.y - top, zero.x + self.width + right, zero.y + self.height + bottom)
+        x1, y1, x2, y2 = math.floor(box[0]), math.floor(box[1]), math.ceil(box[2]), math.ceil(box[3])
+        if x1 < 0 or y1 < 0 or x2 > canvas_size[0] or y2 > canvas_size[1]:
+            # shape is clipped by the square canvas, clipping of polygons depends on the whole canvas size
+            return 0, 0, canvas_size[0], canvas_size[1]
+        return x1, y1, max(x1 + 1, x2), max(y1 + 1, y2)
+
+    def canvas_margins(self) -> tuple:
+        """
+        Distance from the shape rect to the farthest drawn pixel: left, top, right, bottom
+        """
+        offset = self.shape_canvas_offset() + 2
+        return offset, offset, offset, offset
 
     def shape_canvas_offset(self):
         return 0
@@ -671,10 +747,8 @@ class BaseShape:
         return (self.width ** 2 + self.height ** 2) ** 0.5 / 2
 
     def _draw_gradient(self, image, gradient: dict):
-        from ..utils.image_tools import get_gradient_renderer, mix_alpha_channels
-        # todo: need to optimize!
-        render = get_gradient_renderer(gradient['type'])
-        grad_img = render(size=(self.width, self.height), **gradient)
+        from ..utils.image_tools import get_gradient, mix_alpha_channels
+        grad_img = get_gradient(gradient['type'], (self.width, self.height), **gradient)
         grad_canvas = Image.new('RGBA', image.size)
         grad_canvas.paste(grad_img, self._debug_variables['zero_point'].int().tuple)
         if gradient.get('use_gradient_alpha'):
@@ -719,7 +793,16 @@ class BaseShape:
         if not self.is_enabled():
             return self._get_canvas(size)
         # get current shape canvas size including rotation
-        shape_canvas, canvas_size, center, zero_point = self._get_render_sized_canvas()
+        canvas_size, center, square_zero = self._get_square_canvas_geometry()
+        canvas_offset = PointInt(0, 0)
+        # debug draws bounds of the full canvas, bicubic rotation depends on position of the center in pixel grid
+        if self.tight_canvas and not self.global_rotate and not self.debug and CANVAS_STRATEGY != 'square':
+            x1, y1, x2, y2 = self._get_tight_canvas_box(canvas_size, square_zero)
+            canvas_offset = PointInt(x1, y1)
+            canvas_size = (x2 - x1, y2 - y1)
+            center = center - canvas_offset
+        zero_point = square_zero - canvas_offset
+        shape_canvas = self._get_canvas(canvas_size)
         self._debug_variables['zero_point'] = zero_point
         # draw base shape
         shape_canvas = self.draw_shape(shape_canvas, canvas_size, center, zero_point) or shape_canvas
@@ -733,7 +816,7 @@ class BaseShape:
             shape_canvas = shape_canvas.rotate(self.global_rotate, expand=False, center=(*center,), resample=BICUBIC)
         # compute coords for pasting
         global_pos = Point(self.x, self.y)
-        paste_pos = global_pos - zero_point
+        paste_pos = global_pos - square_zero
         # compute transformation offset for rotated shape
         pivot = Point(self.rotation_pivot)
         paste_offset = self.center - self.rotation_transform(self.center) + self.compute_rotation_offset()
@@ -744,7 +827,7 @@ class BaseShape:
         if self.debug:
             self._render_debug(shape_canvas)
         # return main image ###########################
-        yield shape_canvas, paste_pos.int()
+        yield shape_canvas, (paste_pos.int() + canvas_offset).int()
         # #################
 
         # external debug draw ##########################
@@ -778,6 +861,9 @@ class RootParent(BaseShape):
         self._parent = None
         self._debug_render = False
         self.__cache__ = {}
+        self._variable_deps = set()
+        self._shape_deps = set()
+        self._volatile = False
 
     @property
     def z_index(self):
@@ -797,12 +883,12 @@ class RootParent(BaseShape):
     @property
     @cached_result
     def width(self):
-        return self.source_image.size[0]
+        return self.source_frame.size[0]
 
     @property
     @cached_result
     def height(self):
-        return self.source_image.size[1]
+        return self.source_frame.size[1]
 
     def rotation_transform(self, point, *args, **kwargs):
         return point
@@ -814,3 +900,26 @@ class RootParent(BaseShape):
     @property
     def global_rotate(self):
         return 0
+
+
+VARIABLES_KEY = BaseShape.variables.fget.__qualname__
+
+
+class RenderUnit(object):
+    """
+    Part of the frame rendered by one call.
+
+    shape           : shape owning the render
+    render          : generator function, receives canvas size and yields overlays with positions
+    layout_shapes   : shapes whose geometry is used by the render besides own shape and parents
+    """
+    __slots__ = ('shape', 'render', 'layout_shapes')
+
+    def __init__(self, shape: BaseShape, render, layout_shapes: list = None):
+        self.shape = shape
+        self.render = render
+        self.layout_shapes = layout_shapes or []
+
+    @property
+    def key(self):
+        return self.shape, self.render.__name__
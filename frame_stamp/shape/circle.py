@@ -53,6 +53,10 @@ class CircleShape(BaseShape):
     def shape_canvas_offset(self):
         return self.outline_width
 
+    def canvas_margins(self) -> tuple:
+        width = (self.outline or {}).get('width') or 0
+        return tuple(margin + width for margin in super().canvas_margins())
+
     def draw_shape(self, shape_canvas, canvas_size, center, zero_point, **kwargs):
         img = ImageDraw.Draw(shape_canvas)
         point1 = zero_point+PointInt(self.width, self.height)
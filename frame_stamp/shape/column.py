@@ -11,6 +11,7 @@ class ColumnShape(GridShape):
     shape_name = 'column'
 
     def __init__(self, shape_data, renderer, **kwargs):
-        shape_data['columns'] = 1
-        shape_data['rows'] = shape_data.get('rows') or len(shape_data.get('shapes', [])) or 0
+        # template data is shared by shapes of all render threads, never modify it
+        shape_data = {**shape_data, 'columns': 1,
+                      'rows': shape_data.get('rows') or len(shape_data.get('shapes', [])) or 0}
         super(ColumnShape, self).__init__(shape_data, renderer, **kwargs)
@@ -6,11 +6,11 @@ from typing import Literal, Union
 
 from PIL import ImageDraw, Image
 
-from frame_stamp.utils import cached_result
+from frame_stamp.utils import READS_PARENT, cached_result
 from frame_stamp.utils.exceptions import PresetError
 from frame_stamp.utils.point import Point
 from frame_stamp.utils.rect import Rect
-from frame_stamp.shape.base_shape import BaseShape, EmptyShape
+from frame_stamp.shape.base_shape import BaseShape, EmptyShape, RenderUnit
 
 logger = logging.getLogger(__name__)
 
@@ -27,15 +27,37 @@ class GridShape(BaseShape):
 
     def __init__(self, *args, **kwargs):
         super(GridShape, self).__init__(*args, **kwargs)
-        self._shapes = self._create_shapes_from_data(**kwargs)
-        if self.fit_to_content_height:
-            self._fix_cell_height()
-
-    def _create_shapes_from_data(self, **kwargs) -> list[BaseShape]:
+        self._shapes = []
+        self._children = {}
+        self._children_kwargs = kwargs
         if self.width == 0:
             logger.warning('Grid width is 0')
         if self.height == 0:
             logger.warning('Grid height is 0')
+        self.update_layout()
+
+    def reset(self):
+        super().reset()
+        for shape in self._children.values():
+            shape.parent.reset()
+            shape.reset()
+
+    def iter_child_shapes(self):
+        return iter(self._children.values())
+
+    def update_layout(self):
+        """
+        Distribute child shapes by cells. Shapes are created once and reused on the next layout updates.
+        """
+        scope = self.context['scope']
+        for shape in self._shapes:
+            if shape.id is not None and scope.get(shape.id) is shape:
+                del scope[shape.id]
+        self._shapes = self._create_shapes_from_data(**self._children_kwargs)
+        if self.fit_to_content_height:
+            self._fix_cell_height()
+
+    def _create_shapes_from_data(self, **kwargs) -> list[BaseShape]:
         shapes = []
         shape_list = self._data.get('shapes')
         if not shape_list:
@@ -52,10 +74,21 @@ class GridShape(BaseShape):
                 raise PresetError('Shape type not defined in template element: {}'.format(shape_config))
             cells[i]['parent'] = self
             lc = {'cell_index': i+offs, 'row': cells[i+offs]['row'], 'column': cells[i+offs]['column']}
-            shape_config['parent'] = EmptyShape(cells[i+offs], self.context, local_context=lc)
-            shape_cls = get_shape_class(shape_type)
-            kwargs['local_context'] = lc
-            shape = shape_cls(shape_config, self.context, **kwargs)
+            shape = self._children.get(i)
+            if shape is None:
+                parent = EmptyShape(cells[i+offs], self.context, local_context=lc)
+                shape_cls = get_shape_class(shape_type)
+                kwargs['local_context'] = lc
+                shape = shape_cls({**shape_config, 'parent': parent}, self.context, **kwargs)
+                self._children[i] = shape
+            else:
+                # reuse existing shape with new cell
+                shape.parent._data = cells[i+offs]
+                shape.update_local_context(**lc)
+                shape.parent.update_local_context(**lc)
+                shape.parent.clear_cache()
+                shape.invalidate_cache({READS_PARENT})
+                shape.update_layout()
             if shape.skip:
                 offs -= 1
                 continue
@@ -168,8 +201,8 @@ class GridShape(BaseShape):
                 if s._local_context['row'] == row:
                     s.parent._data['y'] += data['offs']
                     s.parent._data['height'] = s.parent._data['h'] = data['height']
-                    s.parent.__cache__.clear()
-                    s.__cache__.clear()
+                    s.parent.clear_cache()
+                    s.invalidate_cache({READS_PARENT})
 
     def _adjust_columns_width(self, columns: dict[int, int]) -> dict[int, int]:
         custom_columns_width = self.columns_width
@@ -293,11 +326,24 @@ class GridShape(BaseShape):
     def border_color(self) -> Union[tuple[int, int, int], str]:
         return self._eval_parameter('border_color', default='black')
 
+    def iter_render_units(self):
+        if not self.is_enabled():
+            return
+        shapes = self.get_cell_shapes()
+        for shape in shapes:
+            yield from shape.iter_render_units()
+        if self.border.get('enabled'):
+            yield RenderUnit(self, self.render_border, [shape.parent for shape in shapes])
+
     def render(self, size: tuple[int, int], **kwargs) -> tuple[Image.Image, Point]:
         shapes = self.get_cell_shapes()
         if shapes and self.is_enabled():
             for shape in shapes:
                 yield from shape.render(size, **kwargs)
+        yield from self.render_border(size, **kwargs)
+
+    def render_border(self, size: tuple[int, int], **kwargs) -> tuple[Image.Image, Point]:
+        shapes = self.get_cell_shapes()
         if self.border.get('enabled') and self.is_enabled():
             offset_top = self.border.get('offset_top', self.border.get('offset', 0))
             offset_bottom = self.border.get('offset_bottom', self.border.get('offset', 0))
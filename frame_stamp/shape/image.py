@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 
 import colorsys
+import hashlib
 import logging
 import os.path
 import re
@@ -8,7 +9,8 @@ import re
 from PIL import Image, ImageChops, ImageOps
 
 from frame_stamp.shape.base_shape import BaseShape
-from frame_stamp.utils import cached_result, b64
+from frame_stamp.utils import READS_FILES, b64, cached_result, record_read
+from frame_stamp.utils.cache import LRUCache
 from frame_stamp.utils.point import Point
 
 logger = logging.getLogger(__name__)
@@ -18,6 +20,28 @@ try:
 except AttributeError:
     LANCZOS = Image.LANCZOS
 
+IMAGE_CACHE_SIZE = 256
+IMAGE_CACHE_BYTES = int(float(os.getenv('FRAMESTAMP_IMAGE_CACHE_MB', 512)) * 2**20)
+
+# decoded, masked and resized resource images shared by all shapes of the process
+_images = LRUCache(maxsize=IMAGE_CACHE_SIZE, max_bytes=IMAGE_CACHE_BYTES,
+                   sizeof=lambda img: img.width * img.height * len(img.getbands()))
+
+
+def image_cache_info() -> dict:
+    """
+    Hit/miss counters and memory usage of resource images cache
+    """
+    return _images.info()
+
+
+def set_image_cache_budget(max_bytes: int):
+    """
+    Memory limit for resource images. Default is 512Mb or value of FRAMESTAMP_IMAGE_CACHE_MB environment variable
+    """
+    _images.max_bytes = max_bytes
+    _images.clear()
+
 
 class ImageShape(BaseShape):
     """
@@ -31,48 +55,107 @@ class ImageShape(BaseShape):
     """
     shape_name = 'image'
 
-    @cached_result
-    def _get_image(self, value: str) -> Image.Image:
+    def _get_image_key(self, value: str):
         """
-        Read file from disk
+        Identity of the image file: resolved path with modification time or digest of base64 value.
+        None for source frame image
         """
-        # source image of the frame, not to be confused with the source of the shape itself
         if value == '$source':
+            return None
+        if b64.is_b64(value):
+            key = ('base64', hashlib.sha1(value.encode()).hexdigest())
+        else:
+            record_read(READS_FILES)
+            res = self.get_resource_file(value)
+            if not res or not os.path.exists(res):
+                raise IOError(f'Path not exists: ({value}) {res}')
+            key = (os.path.abspath(res), os.stat(res).st_mtime_ns)
+        if key[0].lower().endswith('.svg') or value.lower().endswith('.svg'):
+            # svg is rendered to shape size
+            key += (super().width or None, super().height or None)
+        return key
+
+    def _get_image(self, value: str, key: tuple) -> Image.Image:
+        """
+        Read file from disk. Decoded images are shared between all shapes and frames, don't modify them
+        """
+        # source image of the frame, not to be confused with the source of the shape itself
+        if key is None:
             # return source frame image
+            self._track_volatile()
             return self.source_image_raw.copy()
+        return _images.get_or_create(('image',) + key, lambda: self._read_image(value, key))
+
+    def _read_image(self, value: str, key: tuple) -> Image.Image:
         # is base64
-        elif b64.is_b64(value):
-            return b64.b64_to_file(value)
-        # looking for file
-        res = self.get_resource_file(value)
-        if not os.path.exists(res):
-            raise IOError(f'Path not exists: ({value}) {res}')
-        if res:
-            if res.lower().endswith('.svg'):
-                from ..utils.render_svg import render
-
-                w = super().width or None
-                h = super().height or None
-                return render(res, (w, h))
-            return Image.open(str(res))
-        raise IOError(f'Path not exists: ({value}) {res}')
+        if b64.is_b64(value):
+            img = b64.b64_to_file(value)
+        elif key[0].lower().endswith('.svg'):
+            from ..utils.render_svg import render
+
+            img = render(key[0], key[2:])
+        else:
+            img = Image.open(key[0])
+        img.load()
+        return img
 
     @property
-    def source(self) -> Image.Image:
+    @cached_result
+    def source_key(self):
+        """
+        Identity of the masked source image. None if the image can't be cached
+        """
+        key = self.source_file_key
+        if key is None:
+            return
+        return key, self.mask_file_key, self.transparency
+
+    @property
+    @cached_result
+    def source_file_key(self):
+        return self._get_image_key(self.source_path)
+
+    @property
+    @cached_result
+    def mask_file_key(self):
+        mask = self.mask_path
+        return self._get_image_key(mask) if mask else None
+
+    @property
+    @cached_result
+    def source_path(self) -> str:
         source = self._eval_parameter('source')
         if not source:
             raise RuntimeError('Image source not set')
-        source = os.path.expandvars(source)
-        img = self._get_image(source)
-        # apply mask and transparency
-        img = self.apply_mask(img, self.mask, self.transparency)
-        return img
+        return os.path.expandvars(source)
+
+    @property
+    @cached_result
+    def mask_path(self) -> str:
+        mask = self._eval_parameter('mask', default=None)
+        return os.path.expandvars(mask) if mask else None
+
+    def resource_keys(self) -> tuple:
+        return self.source_key,
+
+    @property
+    def source(self) -> Image.Image:
+        key = self.source_key
+        if key is None:
+            return self.apply_mask(self._get_image(self.source_path, self.source_file_key), self.mask,
+                                   self.transparency)
+        return _images.get_or_create(('masked',) + key, lambda: self.apply_mask(
+            self._get_image(self.source_path, key[0]), self.mask, self.transparency))
 
     @property
     @cached_result
     def source_resized(self) -> Image.Image:
-        img = self.source
-        # resize
+        key = self.source_key
+        if key is None:
+            return self._resize(self.source)
+        return _images.get_or_create(('resized', self.size) + key, lambda: self._resize(self.source))
+
+    def _resize(self, img: Image.Image) -> Image.Image:
         if self.size != img.size:
             target_size = list(self.size)
             if target_size[0] == 0:
@@ -132,10 +215,10 @@ class ImageShape(BaseShape):
     @property
     @cached_result
     def mask(self) -> Image.Image:
-        mask = self._data.get('mask')
+        mask = self.mask_path
         if not mask:
             return
-        img = self._get_image(mask)
+        img = self._get_image(mask, self.mask_file_key)
         return img.convert('L')
 
     def apply_mask(self, img: Image.Image, mask: Image.Image, transparency: int = 0) -> Image.Image:
@@ -207,5 +290,10 @@ class ImageShape(BaseShape):
     def draw_shape(
             self, shape_canvas: Image.Image, canvas_size: tuple[int, int], center: Point, zero_point: Point, **kwargs
         ) -> None:
-        img = self._apply_multiply_color(self.source_resized)
+        key = self.source_key
+        if key is None or not self.multiply_color:
+            img = self._apply_multiply_color(self.source_resized)
+        else:
+            img = _images.get_or_create(('multiplied', self.size, self.multiply_color) + key,
+                                        lambda: self._apply_multiply_color(self.source_resized))
         shape_canvas.paste(img, tuple(zero_point.int()), img)
@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 
+import hashlib
 import html
 import logging
 import os
@@ -13,11 +14,53 @@ from PIL import ImageFont, ImageDraw, ImageFilter, Image
 
 from frame_stamp.shape.base_shape import BaseShape
 from frame_stamp.utils import cached_result, b64
+from frame_stamp.utils.cache import LRUCache, freeze
 from frame_stamp.utils.point import Point
 from frame_stamp.utils.rect import Rect
 
 logger = logging.getLogger(__name__)
 DEFAULT_FONT = Path(__file__).parent.parent.joinpath('fonts/OpenSans.ttf').as_posix()
+FONT_CACHE_SIZE = 128
+LABEL_CACHE_SIZE = 4096
+LABEL_CACHE_BYTES = int(float(os.getenv('FRAMESTAMP_LABEL_CACHE_MB', 256)) * 2**20)
+
+# fonts are shared between all labels of the process
+_fonts = LRUCache(maxsize=FONT_CACHE_SIZE)          # (font file or base64 digest, size) > font
+_font_files = LRUCache(maxsize=FONT_CACHE_SIZE)     # (font name, search dirs) > font file
+# rendered label canvases, (font, text, style, canvas size) > image
+_label_images = LRUCache(maxsize=LABEL_CACHE_SIZE, max_bytes=LABEL_CACHE_BYTES,
+                         sizeof=lambda img: img.width * img.height * 4)
+
+
+# draw used only to measure text
+_measure_draw = ImageDraw.Draw(Image.new('L', (1, 1)))
+
+
+def font_cache_info() -> dict:
+    """
+    Hit/miss counters of font cache and font name resolution cache
+    """
+    return dict(fonts=_fonts.info(), names=_font_files.info())
+
+
+def clear_font_cache():
+    _fonts.clear()
+    _font_files.clear()
+
+
+def label_cache_info() -> dict:
+    """
+    Hit/miss counters and memory usage of rendered labels cache
+    """
+    return _label_images.info()
+
+
+def set_label_cache_budget(max_bytes: int):
+    """
+    Memory limit for rendered labels. Default is 256Mb or value of FRAMESTAMP_LABEL_CACHE_MB environment variable
+    """
+    _label_images.max_bytes = max_bytes
+    _label_images.clear()
 
 
 class LabelShape(BaseShape):
@@ -230,10 +273,12 @@ class LabelShape(BaseShape):
         str
         """
         ctx = {**self.defaults, **self.variables}
+        self._track_variable('timestamp')
         ts = ctx.get('timestamp')
         if ts:
             date = datetime.fromtimestamp(ts)
         else:
+            self._track_volatile()
             date = datetime.now()
         for dt_str in re.findall(r'{:.+?}', text):
             if not re.findall(r'%\w', dt_str):
@@ -326,10 +371,21 @@ class LabelShape(BaseShape):
         """
         Returns a ready-to-render font
         """
-        font = self._resolve_font_name(self.font_name)
-        if not font:
-            font = DEFAULT_FONT
-        return ImageFont.FreeTypeFont(font, self.font_size)
+        font_name, size = self.font_name, self.font_size
+        if b64.is_b64(font_name):
+            return _fonts.get_or_create(self.font_key, lambda: ImageFont.FreeTypeFont(b64.b64_str_to_file(font_name), size))
+        return _fonts.get_or_create(self.font_key, lambda: ImageFont.FreeTypeFont(self.font_key[0], size))
+
+    @property
+    @cached_result
+    def font_key(self) -> tuple:
+        """
+        Font file or digest of base64 font with font size
+        """
+        font_name = self.font_name
+        if b64.is_b64(font_name):
+            return 'base64:' + hashlib.sha1(font_name.encode()).hexdigest(), self.font_size
+        return self._get_font_file(font_name) or DEFAULT_FONT, self.font_size
 
     @property
     @cached_result
@@ -498,6 +554,21 @@ class LabelShape(BaseShape):
     def height(self) -> int:
         return self.get_size()[1] + self.padding_top + self.padding_bottom
 
+    def _get_font_file(self, font_name: str) -> str:
+        """
+        Cached result of font name resolution
+        """
+        if '$' in font_name:
+            return self._resolve_font_name(font_name)
+        self._track_variable('get_resource_func')
+        key = (font_name, os.getcwd(), tuple(self.get_resource_search_dirs()),
+               self.context['variables'].get('get_resource_func'))
+
+        def resolve():
+            path = self._resolve_font_name(font_name)
+            return os.path.abspath(path) if path and os.path.exists(path) else path
+        return _font_files.get_or_create(key, resolve)
+
     def _resolve_font_name(self, font_name: str) -> str:
         """
         Looking for font by name
@@ -549,10 +620,26 @@ class LabelShape(BaseShape):
             ofs = max([ofs, max(offsets)])
         return ofs*1.2
 
-    def draw_shape(self, shape_canvas: Image.Image, canvas_size: tuple[int, int], center: Point, zero_point: Point, **kwargs):
-        drw = ImageDraw.Draw(shape_canvas)
+    def canvas_margins(self) -> tuple:
+        # glyphs can go out of the font metric lines, outline is blurred
+        render_offset, text_args, is_multiline = self._get_text_args()
+        measure = _measure_draw.multiline_textbbox if is_multiline else _measure_draw.textbbox
+        text_args.pop('fill')
+        left, top, right, bottom = measure(render_offset.tuple, self.text, **text_args)
+        extra = self.shape_canvas_offset() + 2
+        if self.outline:
+            extra += self.outline.get('width', 3) * 4
+        # text origin stays on the same side of the canvas edge, fractional part of negative position
+        # is rendered differently
+        left, top = min(left, render_offset.x), min(top, render_offset.y)
+        return (max(0, -left) + extra, max(0, -top) + extra,
+                max(0, right - self.width) + extra, max(0, bottom - self.height) + extra)
+
+    def _get_text_args(self) -> tuple:
+        """
+        Text position relative to the shape rect, arguments of ImageDraw.text and multiline flag
+        """
         is_multiline = '\n' in self.text
-        printer = drw.multiline_text if is_multiline else drw.text
         text_args = dict(
             font=self.font,
             fill=self.color
@@ -560,9 +647,28 @@ class LabelShape(BaseShape):
         font_metrics = self.get_font_metrics()
         render_offset = Point(self.padding_left, -font_metrics['top_line']+self.padding_top)
         if is_multiline:
-            text_args['spacing'] = self.spacing - self.get_font_metrics()['offset_y']
+            text_args['spacing'] = self.spacing - font_metrics['offset_y']
             if self.align_h:
                 text_args['align'] = self.align_h
+        return render_offset, text_args, is_multiline
+
+    def draw_shape(self, shape_canvas: Image.Image, canvas_size: tuple[int, int], center: Point, zero_point: Point, **kwargs):
+        key = (self.font_key, self.text, self.color, self.spacing, self.align_h, freeze(self.outline),
+               freeze(self.backdrop), self.width, self.height, self.padding_left, self.padding_top,
+               tuple(canvas_size), zero_point.tuple)
+        image = _label_images.get(key)
+        if image is None:
+            image = self._draw_label(shape_canvas, zero_point)
+            _label_images.set(key, image)
+        if self.gradient or self.debug:
+            # cached image must not be changed
+            return image.copy()
+        return image
+
+    def _draw_label(self, shape_canvas: Image.Image, zero_point: Point) -> Image.Image:
+        drw = ImageDraw.Draw(shape_canvas)
+        render_offset, text_args, is_multiline = self._get_text_args()
+        printer = drw.multiline_text if is_multiline else drw.text
         # render outline
         if self.outline:
             outline_text_args = text_args.copy()
@@ -20,6 +20,8 @@ class LineShape(BaseShape):
     """
     shape_name = 'line'
     default_width = 2
+    # wide lines and polygons are rasterized differently on a shifted canvas
+    tight_canvas = False
 
     @property
     @cached_result
@@ -45,6 +45,10 @@ class RectShape(BaseShape):
     def shape_canvas_offset(self) -> int:
         return self.border_width
 
+    def canvas_margins(self) -> tuple:
+        width = (self.border or {}).get('width') or 0
+        return tuple(margin + width for margin in super().canvas_margins())
+
     def draw_shape(self, shape_canvas: Image.Image, canvas_size: tuple[int, int], center: Point, zero_point: Point, **kwargs):
         img = ImageDraw.Draw(shape_canvas)
         point1 = zero_point+PointInt(self.width, self.height)
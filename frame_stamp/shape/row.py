@@ -11,6 +11,7 @@ class RowShape(GridShape):
     shape_name = 'row'
 
     def __init__(self, shape_data: dict, renderer, **kwargs):
-        shape_data['rows'] = 1
-        shape_data['columns'] = shape_data.get('columns') or len(shape_data.get('shapes', []))
+        # template data is shared by shapes of all render threads, never modify it
+        shape_data = {**shape_data, 'rows': 1,
+                      'columns': shape_data.get('columns') or len(shape_data.get('shapes', []))}
         super(RowShape, self).__init__(shape_data, renderer, **kwargs)
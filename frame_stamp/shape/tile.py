@@ -20,6 +20,14 @@ class TileShape(BaseShape):
         super().__init__(*args, **kwargs)
         self._shapes = self._init_shapes(**kwargs)
 
+    def reset(self):
+        super().reset()
+        for shape in self._shapes:
+            shape.reset()
+
+    def iter_child_shapes(self):
+        return iter(self._shapes)
+
     @property
     def rotate(self) -> int:
         """Tile rotation not supported. use grid_rotate"""
@@ -102,6 +110,7 @@ class TileShape(BaseShape):
             shape: BaseShape = shape_cls(shape_config, self.context, **kwargs)
             if shape.id:
                 raise PresetError('Shape ID for tiled element is not allowed: {}'.format(shape.id))
+            self._track_shape(shape)
             shapes.append(shape)
         return shapes
 
@@ -134,7 +143,6 @@ class TileShape(BaseShape):
                                 self.context)
 
             sh: BaseShape = next(shapes)
-            sh.clear_cache()
             sh.set_parent(parent)
             sh.update_local_context(tile_index=index, global_index=i)
 
@@ -0,0 +1,224 @@
+"""
+Split of a sequence between several render processes or hosts.
+
+Static split: each process renders a part of frames selected by shard_index/shard_count
+(contiguous ranges of the same size) or by explicit frame ranges "0-99,200-249".
+
+Dynamic split: all processes walk the same frames and claim each frame in shared output directory
+before render (see FrameClaims). Claim is a lock file created with O_EXCL, so only one process
+gets the frame. Claim of rendered frame stays as done marker for other processes.
+
+    >>> claims = FrameClaims(output_dir)
+    >>> if claims.claim(save_path, frame_hash):
+    >>>     render()
+    >>>     claims.complete(save_path, frame_hash)
+
+Claims are keyed by frame hash of the render manifest, frames changed since last run are claimed again.
+In force mode frames done by other runs are claimed again too. Processes of one forced render share
+the run id, so frames done by each other are not rendered twice:
+
+    >>> claims = FrameClaims(output_dir, force=True, run_id='retake-12')
+Stale claim is taken over under a lock and checked again, so two processes never take over the same claim.
+"""
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Iterable, Union
+
+logger = logging.getLogger(__name__)
+
+
+def parse_frame_ranges(value: Union[str, Iterable], count: int) -> list[int]:
+    """
+    Sorted unique frame indices from "0-9,15,20-" string or iterable of indices and ranges.
+    Range end is inclusive, open start or end means first or last frame. Indices out of sequence are ignored
+    """
+    if isinstance(value, str):
+        indices = set()
+        for part in value.replace(' ', '').split(','):
+            if not part:
+                continue
+            start, sep, end = part.partition('-')
+            if sep:
+                start = int(start) if start else 0
+                end = int(end) if end else count - 1
+                indices.update(range(start, end + 1))
+            else:
+                indices.add(int(part))
+    else:
+        indices = set()
+        for item in value:
+            if isinstance(item, range):
+                indices.update(item)
+            elif isinstance(item, (list, tuple)):
+                start, end = item
+                indices.update(range(start, end + 1))
+            else:
+                indices.add(int(item))
+    return sorted(i for i in indices if 0 <= i < count)
+
+
+def shard_indices(count: int, shard_index: int, shard_count: int) -> range:
+    """
+    Contiguous range of frames of the shard. Shards differ in size by one frame at most
+    """
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f'Invalid shard {shard_index} of {shard_count}')
+    size, rest = divmod(count, shard_count)
+    start = shard_index * size + min(shard_index, rest)
+    return range(start, start + size + (1 if shard_index < rest else 0))
+
+
+def _owner() -> dict:
+    return {'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time()}
+
+
+def _pid_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        pass
+    return True
+
+
+class FileLock(object):
+    """
+    Lock between processes and hosts sharing a directory. Lock older than stale_timeout is broken.
+
+        >>> with FileLock(path):
+        >>>     ...
+    """
+    def __init__(self, path: Union[str, Path], timeout: float = 30.0, stale_timeout: float = 60.0):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - self.path.stat().st_mtime > self.stale_timeout:
+                        logger.warning('Break stale lock %s', self.path)
+                        self.path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f'Lock is busy: {self.path}')
+                time.sleep(0.02)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump(_owner(), f)
+            return
+
+    def release(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class FrameClaims(object):
+    """
+    Claims of frames in the shared output directory.
+
+    output_dir      : directory of rendered frames shared by all processes
+    stale_timeout   : seconds after which claim of a frame in progress is taken over,
+                      claims of dead processes of the same host are taken over at once
+    force           : frames done by other runs are rendered again
+    run_id          : id of the render shared by all its processes, unique id if not set
+    """
+    DIR_NAME = '.framestamp-claims'
+
+    def __init__(self, output_dir: Union[str, Path], stale_timeout: float = 600.0, force: bool = False,
+                 run_id: str = None):
+        self.root = Path(output_dir, self.DIR_NAME)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.stale_timeout = stale_timeout
+        self.force = force
+        self.run_id = str(run_id) if run_id is not None else uuid.uuid4().hex
+        self._host = socket.gethostname()
+
+    def _path(self, save_path: Union[str, Path], frame_hash: str) -> Path:
+        return self.root / f'{Path(save_path).name}.{frame_hash[:16]}'
+
+    def claim(self, save_path: Union[str, Path], frame_hash: str) -> bool:
+        """
+        Take the frame for render. False if the frame is rendered or is rendering by other process
+        """
+        path = self._path(save_path, frame_hash)
+        if self._create(path):
+            return True
+        if not self._is_stale(path, save_path):
+            return False
+        # other process may take over the same claim, it is checked again under the lock
+        with FileLock(path.with_name(path.name + '.lock')):
+            if not self._is_stale(path, save_path):
+                return False
+            logger.warning('Take over stale claim %s', path)
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            return self._create(path)
+
+    def _create(self, path: Path) -> bool:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({**_owner(), 'run': self.run_id, 'state': 'claimed'}, f)
+        return True
+
+    def _is_stale(self, path: Path, save_path: Union[str, Path]) -> bool:
+        try:
+            data = json.loads(path.read_text())
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return True
+        except (OSError, ValueError):
+            # claim is being written
+            return False
+        if data.get('state') == 'done':
+            if self.force and data.get('run') != self.run_id:
+                return True
+            # output removed after render
+            return not Path(save_path).exists()
+        if data.get('host') == self._host and not _pid_exists(data.get('pid', 0)):
+            return True
+        return time.time() - mtime > self.stale_timeout
+
+    def complete(self, save_path: Union[str, Path], frame_hash: str):
+        """
+        Mark claimed frame as rendered
+        """
+        path = self._path(save_path, frame_hash)
+        tmp_path = path.with_name(path.name + f'.{os.getpid()}.tmp')
+        tmp_path.write_text(json.dumps({**_owner(), 'run': self.run_id, 'state': 'done'}))
+        os.replace(tmp_path, path)
+
+    def release(self, save_path: Union[str, Path], frame_hash: str):
+        """
+        Return the frame failed to render, other process can take it
+        """
+        try:
+            self._path(save_path, frame_hash).unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,139 @@
+"""
+Source frame of the render.
+
+Size of the frame is read from the file header when the source is bound, so unit variables
+(unt, pnt, source_width...) and layout of shapes are computed without pixels.
+Pixels are decoded once, on first access of the canvas, and converted to RGBA with one conversion
+for RGB files. The canvas is rendered in place.
+
+Image shapes with "$source" need pixels of the frame before render (raw image).
+When the template refers to $source, raw image is copied from the canvas right after decode,
+before any shape is drawn. Otherwise no copy is made, and if raw image is still requested
+(source name built by expression) it is decoded again.
+
+    >>> frame = SourceFrame('plate.0001.exr', keep_raw=refers_to_source(template))
+    >>> frame.size      # header only
+    >>> frame.canvas    # decoded
+"""
+import logging
+import re
+from pathlib import Path
+from typing import Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+SOURCE_PATTERN = re.compile(r'\$source\b')
+
+
+def refers_to_source(value) -> bool:
+    """
+    Any string of the template refers to the source frame image
+    """
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            if SOURCE_PATTERN.search(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+def _to_rgba(img: Image.Image) -> Image.Image:
+    # alpha of the source file is dropped
+    if img.mode == 'RGB':
+        return img.convert('RGBA')
+    return img.convert('RGB').convert('RGBA')
+
+
+class SourceFrame(object):
+    """
+    Source image, its size and pixels
+
+    image       : path, PIL image or (width, height) of transparent canvas
+    keep_raw    : copy raw image from the canvas after decode
+    """
+    __slots__ = ('size', 'is_canvas', '_input', '_path', '_canvas', '_raw', '_keep_raw')
+
+    def __init__(self, image: Union[str, Path, Image.Image, tuple[int, int]], keep_raw: bool = True):
+        self._input = image
+        self._path = None
+        self._canvas = None
+        self._raw = None
+        self._keep_raw = keep_raw
+        self.is_canvas = False
+        if isinstance(image, (tuple, list)):
+            size = tuple(int(x) for x in image)
+            if len(size) != 2 or min(size) <= 0:
+                raise ValueError(f'Invalid canvas size: {image}')
+            self.size = size
+            self.is_canvas = True
+        elif isinstance(image, Image.Image):
+            self.size = image.size
+        elif isinstance(image, (str, Path)):
+            # header only, pixels are not decoded
+            self._path = image
+            self._input = Image.open(image)
+            self.size = self._input.size
+        else:
+            raise TypeError('Source image must be string, PIL.Image or canvas size')
+
+    def __repr__(self):
+        return '<{} {}x{}>'.format(self.__class__.__name__, *self.size)
+
+    @property
+    def is_decoded(self) -> bool:
+        return self._canvas is not None
+
+    @property
+    def canvas(self) -> Image.Image:
+        """
+        RGBA image rendered in place
+        """
+        if self._canvas is None:
+            self._canvas = self._decode()
+            if self._keep_raw and not self.is_canvas:
+                self._raw = self._canvas.copy()
+        return self._canvas
+
+    @property
+    def raw(self) -> Image.Image:
+        """
+        Source pixels before render, don't modify
+        """
+        if self._raw is None:
+            pristine = self._canvas is None
+            canvas = self.canvas
+            if self._raw is None:
+                if pristine:
+                    self._raw = canvas.copy()
+                else:
+                    logger.debug('Raw source is not kept, decode it again')
+                    self._raw = self._decode()
+        return self._raw
+
+    def renew(self) -> 'SourceFrame':
+        """
+        Frame of the same source for the next render, rendered canvas is decoded again
+        """
+        if self._canvas is None:
+            return self
+        return SourceFrame(self._path if self._path is not None else self._input, keep_raw=self._keep_raw)
+
+    def _decode(self) -> Image.Image:
+        if self.is_canvas:
+            return Image.new('RGBA', self.size, (0, 0, 0, 0))
+        if self._path is None:
+            return self._input.convert('RGBA')
+        if self._input is None:
+            img = Image.open(self._path)
+        else:
+            # file opened for header is decoded and closed
+            img, self._input = self._input, None
+        with img:
+            return _to_rgba(img)
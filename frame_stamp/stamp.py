@@ -1,45 +1,79 @@
 from __future__ import absolute_import
 
+import copy
 import logging
+import threading
+from functools import partial
 from pathlib import Path
-from typing import Union
+from typing import Callable, Union
 
 from PIL import Image, ImageFile
 
+from .layers import StaticLayers
+from .parallel import render_units
 from .shape import base_shape
 from .shape import get_shape_class
-from .utils import exceptions
+from .source import SourceFrame, refers_to_source
+from .utils import READS_FILES, exceptions, expressions
 from .utils.exceptions import PresetError
+from .utils.image_tools import OverlayLayer, alpha_composite_clipped, paste_trimmed
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 logger = logging.getLogger(__name__)
+MISSING = object()
 
 
 class FrameStamp(object):
+    """
+    Render of the template over one frame.
+
+    image       : source image path, PIL image or (width, height) of transparent canvas.
+                  With canvas size only the overlay is rendered (see is_overlay), no source is decoded
+    """
     class FORMAT:
         # must be matched with list of formats from Image.SAVE
         JPG = "JPEG"
         PNG = "PNG"
 
-    def __init__(self, image: Union[str, Path], template: dict, variables: dict, **kwargs):
+    def __init__(self, image: Union[str, Path, Image.Image, tuple[int, int]], template: Union[dict, 'CompiledTemplate'], variables: dict, **kwargs):
+        if isinstance(template, CompiledTemplate):
+            self._compiled = template
+            template = template.template
+        else:
+            self._compiled = None
         self._template = template
         self._variables = variables or {}
+        self._frame = None
+        state = self._compiled.state if self._compiled else None
+        if state is not None:
+            # reuse shapes created for previous frame
+            self._shapes, self._scope, self._shared_context = state
+            self._shared_context.update(
+                variables=self.variables,
+                defaults=self.defaults,
+                add_shape=self._add_shape_to_scope
+            )
+            self.set_source(image)
+            self._reset_shapes()
+            self._compiled.bound = self
+            return
         self._shapes = []
         self._scope = {}
-        self._source = None
         self._shared_context = dict(
             variables=self.variables,           # variables for rendering
-            source_image=self._source,          # source image. For getting original size and other parameters
-            source_image_raw=self._source,              # source image raw data
+            source_image=self._frame,           # source frame. For getting original size and other parameters
             source_image_path=None,             # source image path
             defaults=self.defaults,             # default values from template
             scope=self._scope,                  # list of all available shapes. Needed for queries from other shapes
             add_shape=self._add_shape_to_scope  # reference to function to add shapes, needed for combined shapes
         )
         self.set_source(image)
-        if self._source is None:
+        if self._frame is None:
             raise PresetError('Source image not set')
         self._create_shapes_from_template(**kwargs)
+        if self._compiled:
+            self._compiled.state = (self._shapes, self._scope, self._shared_context)
+            self._compiled.bound = self
 
     def _create_shapes_from_template(self, **kwargs):
         for i, shape_config in enumerate(self.template['shapes']):
@@ -88,6 +122,109 @@ class FrameStamp(object):
                 raise exceptions.PresetError('Duplicate shape ID: {}'.format(shape.id))
             self._scope[shape.id] = shape
 
+    def _check_bound(self):
+        """
+        Shapes of compiled template are shared by frames bound in the same thread,
+        only the last bound frame stamp can use them
+        """
+        if self._compiled is not None and self._compiled.bound is not self:
+            raise RuntimeError('Shapes of frame stamp are rebound by later bind of compiled template')
+
+    def _reset_shapes(self):
+        """
+        Drop computed values of all shapes. Combined shapes update layout after all shapes reset.
+        """
+        for shape in self._shapes:
+            shape.reset()
+        for shape in self._shapes:
+            shape.update_layout()
+
+    def rebind(self, image: Union[str, Path, Image.Image, tuple[int, int]] = None,
+               variables: dict = None) -> 'FrameStamp':
+        """
+        Swap source image and/or variables and keep shapes for the next render.
+        Without image the same source is rendered again.
+
+        Only shapes which read changed variables are reset, together with shapes depending on them:
+        referring to them, children and combined parents. Shapes with random values, current time
+        or source pixels are always reset. New size of the source resets all shapes.
+        Values of other shapes, fonts, rendered labels and resource images are kept, modified resource files
+        are read again.
+
+            >>> stamp = FrameStamp(files[0], template, {'frame': 0})
+            >>> for i, path in enumerate(files):
+            >>>     stamp.rebind(path, {'frame': i}).render(save_path=...)
+        """
+        self._check_bound()
+        size = self._frame.size
+        previous = self._shared_context['variables']
+        if variables is not None:
+            self._variables = variables
+        current = self.variables
+        self._shared_context['variables'] = current
+        if image is not None:
+            self.set_source(image)
+        else:
+            self._frame = self._frame.renew()
+            self._shared_context['source_image'] = self._frame
+        if self._frame.size != size:
+            self._reset_shapes()
+            return self
+        changed = {name for name in previous.keys() | current.keys()
+                   if previous.get(name, MISSING) != current.get(name, MISSING)}
+        self._invalidate_shapes(changed)
+        return self
+
+    def _iter_all_shapes(self):
+        """
+        All created shapes with children of combined shapes and their cells
+        """
+        seen = set()
+        stack = list(self._shapes)
+        while stack:
+            shape = stack.pop()
+            if shape in seen:
+                continue
+            seen.add(shape)
+            yield shape
+            stack.extend(shape.iter_child_shapes())
+            parent = shape._parent
+            if parent is not None and not isinstance(parent, base_shape.RootParent):
+                stack.append(parent)
+
+    def _invalidate_shapes(self, changed: set):
+        """
+        Reset shapes depending on changed variables, other shapes only take new variables
+        and drop cached values which read resource files
+        """
+        shapes = list(self._iter_all_shapes())
+        invalid = {shape for shape in shapes if shape._volatile or not changed.isdisjoint(shape._variable_deps)}
+        dependencies = {}
+        for shape in shapes:
+            deps = set(shape._shape_deps)
+            deps.update(shape.iter_child_shapes())
+            if shape._parent is not None and not isinstance(shape._parent, base_shape.RootParent):
+                deps.add(shape._parent)
+            dependencies[shape] = deps
+        grown = bool(invalid)
+        while grown:
+            grown = False
+            for shape in shapes:
+                if shape not in invalid and not invalid.isdisjoint(dependencies[shape]):
+                    invalid.add(shape)
+                    grown = True
+        for shape in shapes:
+            if shape in invalid:
+                # values computed from layout of other shapes don't record variables the layout read
+                shape.reset()
+            else:
+                shape.refresh_variables()
+                # resource files are checked again
+                shape.invalidate_cache({READS_FILES})
+        for shape in self._shapes:
+            if shape in invalid:
+                shape.update_layout()
+
     def get_shapes(self) -> list:
         """
         All shapes
@@ -96,45 +233,97 @@ class FrameStamp(object):
 
     @property
     def source(self) -> Image.Image:
-        return self._source
+        """
+        Canvas of the render, source image is decoded on first access
+        """
+        return self._frame.canvas if self._frame else None
+
+    @property
+    def source_size(self) -> tuple[int, int]:
+        return self._frame.size
+
+    @property
+    def is_overlay(self) -> bool:
+        """
+        Overlay-only render: shapes are composited onto transparent canvas instead of the source.
+        Source of image shapes ($source) is the same empty canvas
+        """
+        return self._frame.is_canvas
 
     def set_source(self, input_image):
-        if isinstance(input_image, Image.Image):
-            self._source: Image.Image = input_image.convert('RGBA')
-            self._shared_context['source_image_raw']= input_image.convert('RGBA')
-        elif isinstance(input_image, (str, Path)):
-            self._source = Image.open(input_image).convert('RGB').convert('RGBA')
-            self._shared_context['source_image_raw'] = Image.open(input_image).convert('RGB').convert('RGBA')
-        else:
-            raise TypeError('Source image must be string or PIL.Image')
-        self._shared_context['source_image'] = self._source
+        """
+        Bind source image. Only size is read here, pixels are decoded on first access of the canvas (see SourceFrame)
+        """
+        keep_raw = self._compiled.uses_source if self._compiled else refers_to_source(self.template)
+        self._frame = SourceFrame(input_image, keep_raw=keep_raw)
+        self._shared_context['source_image'] = self._frame
 
-    def render(self, input_image: str = None, save_path: str = None, **kwargs) -> Image.Image:
+    def render(self, input_image: str = None, save_path: str = None, single_layer: bool = None,
+               shape_workers: int = None, **kwargs) -> Image.Image:
         """
         Render all shapes
+
+        With single_layer=True all overlays are accumulated into one layer with straight (not premultiplied)
+        alpha which is composited onto the source once. Default value is taken from compiled template.
+        With shape_workers > 1 shapes are rasterized on a thread pool after layout is resolved
+        and composited in z-order, result is the same (see frame_stamp.parallel).
+        Frames of compiled template with static layers are rendered sequentially.
+        Overlay-only render composites shapes onto the canvas with "over" operator and saves RGBA.
         """
+        self._check_bound()
         if input_image:
             self.set_source(input_image)
-        if not self.source:
+        if not self._frame:
             raise RuntimeError('Source image not set')
-        img_size = self.source.size
+        img_size = self._frame.size
+        layers = self._compiled.layers if self._compiled else None
+        if single_layer is None:
+            single_layer = self._compiled.single_layer if self._compiled else False
+        if shape_workers is None:
+            shape_workers = self._compiled.shape_workers if self._compiled else 0
+        if layers is not None and not kwargs:
+            units = [unit for shape in self.get_shapes() if not shape.skip for unit in shape.iter_render_units()]
+            layers.render(self.source, units, composite=alpha_composite_clipped if self.is_overlay else None)
+        elif self.is_overlay:
+            # canvas is a layer itself
+            self._render_shapes(img_size, partial(alpha_composite_clipped, self.source), shape_workers, **kwargs)
+        elif single_layer:
+            layer = OverlayLayer(img_size)
+            self._render_shapes(img_size, layer.add, shape_workers, **kwargs)
+            layer.composite(self.source)
+        else:
+            self._render_shapes(img_size, shape_workers=shape_workers, **kwargs)
+        if save_path:
+            # save rendered file to RGB, overlay keeps alpha
+            frmt = self._get_output_format(save_path)
+            logger.debug('Save format %s to file %s', frmt, save_path)
+            img = self.source if self.is_overlay else self.source.convert("RGB")
+            img.save(save_path, frmt, quality=100)
+        return self.source
+
+    def _render_shapes(self, img_size: tuple[int, int], composite: Callable = None, shape_workers: int = 0,
+                       **kwargs):
+        """
+        Render shapes in z-order and composite every overlay with composite(overlay, pos).
+        By default overlays are pasted to the source
+        """
+        if composite is None:
+            composite = partial(paste_trimmed, self.source)
+        if shape_workers and shape_workers > 1:
+            units = [unit for shape in self.get_shapes() if not shape.skip for unit in shape.iter_render_units()]
+            render_units(units, img_size, composite, shape_workers, **kwargs)
+            return
         for shape in self.get_shapes():
             shape: base_shape.BaseShape
             if shape.skip:
                 continue
             try:
                 for overlay, pos in shape.render(img_size, **kwargs):
-                    self._source.paste(overlay, tuple(pos), overlay)
+                    composite(overlay, tuple(pos))
                     del overlay
             except Exception as e:
                 logger.error('Error rendering shape %s: %s', shape, e)
                 raise
-        if save_path:
-            # save rendered file to RGB
-            frmt = self._get_output_format(save_path)
-            logger.debug('Save format %s to file %s', frmt, save_path)
-            self._source.convert("RGB").save(save_path, frmt, quality=100)
-        return self._source
 
     def _get_output_format(self, path: str):
         path = Path(path)
@@ -142,3 +331,141 @@ class FrameStamp(object):
             return self.FORMAT.JPG
         elif path.suffix.strip('.').lower() == 'png':
             return self.FORMAT.PNG
+
+
+class CompiledTemplate(object):
+    """
+    Template prepared once for rendering of many frames.
+
+    All shape types are checked and all parameter values are compiled on creation.
+    Shapes are created for the first frame and reused for all next frames,
+    only computed values are reset when new source image and variables are bound.
+
+        >>> compiled = CompiledTemplate(template)
+        >>> for path in files:
+        >>>     compiled.bind(path, {'frame': ...}).render(save_path=...)
+
+    Compiled template can be used everywhere instead of template dict.
+
+    With static_layers=True shapes which give the same result on each frame are composed
+    into cached layers and are not rendered again (see frame_stamp.layers).
+    With single_layer=True overlays of each frame are composited onto the source once (see FrameStamp.render).
+    With shape_workers > 1 shapes of each frame are rasterized on a thread pool (see frame_stamp.parallel).
+
+    Compiled template is re-entrant: each thread gets own set of shapes and static layers
+    on its first frame, so one template renders frames concurrently in a thread pool.
+    """
+    def __init__(self, template: dict, static_layers: bool = False, single_layer: bool = False,
+                 shape_workers: int = 0, **kwargs):
+        # shapes can modify own data, keep original template untouched
+        self._template = copy.deepcopy(template)
+        self._kwargs = kwargs
+        self._static_layers = static_layers
+        self.single_layer = single_layer
+        self.shape_workers = shape_workers
+        # raw source image is kept for image shapes with $source only
+        self.uses_source = refers_to_source(self._template)
+        # shapes and layers are mutated by render, they are never shared between threads
+        self._local = threading.local()
+        self._check_shapes(self._template.get('shapes', []))
+        self._compile_values(self._template)
+
+    @classmethod
+    def from_template(cls, template: Union[dict, 'CompiledTemplate'], **kwargs) -> 'CompiledTemplate':
+        """
+        Compile template dict. Already compiled template returned as is
+        """
+        if isinstance(template, cls):
+            return template
+        return cls(template, **kwargs)
+
+    def __getstate__(self):
+        # created shapes are not picklable and must be recreated in other process
+        return {'_template': self._template, '_kwargs': self._kwargs, '_static_layers': self._static_layers,
+                'single_layer': self.single_layer, 'shape_workers': self.shape_workers, 'uses_source': self.uses_source}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def state(self) -> Union[tuple, None]:
+        """
+        Shapes, scope and shared context created for the first frame of current thread
+        """
+        return getattr(self._local, 'state', None)
+
+    @state.setter
+    def state(self, value: Union[tuple, None]):
+        self._local.state = value
+
+    @property
+    def bound(self) -> Union[FrameStamp, None]:
+        """
+        Frame stamp last bound in current thread, earlier frame stamps of the thread can't be rendered
+        """
+        return getattr(self._local, 'bound', None)
+
+    @bound.setter
+    def bound(self, value: Union[FrameStamp, None]):
+        self._local.bound = value
+
+    @property
+    def layers(self) -> Union[StaticLayers, None]:
+        """
+        Static layers of current thread
+        """
+        if not self._static_layers:
+            return None
+        layers = getattr(self._local, 'layers', None)
+        if layers is None:
+            layers = self._local.layers = StaticLayers()
+        return layers
+
+    @property
+    def template(self) -> dict:
+        return self._template
+
+    def bind(self, image: Union[str, Path, Image.Image, tuple[int, int]], variables: dict) -> FrameStamp:
+        """
+        Prepare template for rendering of new frame, canvas size for overlay-only render.
+        Shapes are reused, so frame stamp returned by previous bind in this thread is no longer valid
+        """
+        return FrameStamp(image, self, variables, **self._kwargs)
+
+    def warm_up(self, size: tuple[int, int], variables: dict = None) -> bool:
+        """
+        Render blank frame to create shapes and fill fonts, images and labels caches.
+        Errors are ignored, variables of real frames can be required by the template
+        """
+        try:
+            self.bind(Image.new('RGB', tuple(size)), variables or {}).render()
+        except Exception as e:
+            logger.debug('Template warm up failed: %s', e)
+            return False
+        return True
+
+    def _check_shapes(self, shapes: list):
+        for shape_config in shapes:
+            if not shape_config:
+                continue
+            shape_type = shape_config.get('type')
+            if shape_type is None:
+                raise PresetError('Shape type not defined in template element: {}'.format(shape_config))
+            if not get_shape_class(shape_type):
+                raise TypeError(f'Shape type "{shape_type}" not found')
+            self._check_shapes(shape_config.get('shapes') or [])
+
+    def _compile_values(self, value):
+        if isinstance(value, str):
+            try:
+                expressions.compile_value(value)
+            except Exception:
+                # error will be raised on render with full shape info
+                pass
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self._compile_values(item)
+        elif isinstance(value, dict):
+            for item in value.values():
+                self._compile_values(item)
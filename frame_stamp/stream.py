@@ -0,0 +1,452 @@
+"""
+Render of raw video streams.
+
+Frames are read from a pipe or file descriptor, rendered with the compiled template and written
+to an output pipe, so frame stamp sits between any decoder and encoder without image files:
+
+    $ ffmpeg -i input.mov -f rawvideo -pix_fmt rgb24 - \\
+        | python -m frame_stamp.stream template.json --size 1920x1080 \\
+        | ffmpeg -f rawvideo -pix_fmt rgb24 -s 1920x1080 -r 24 -i - output.mov
+
+    $ ffmpeg -i input.mov -f yuv4mpegpipe - | python -m frame_stamp.stream template.json -f y4m | ffmpeg -i - output.mp4
+
+Formats:
+
+    rgb, rgba   : raw frames of the given size, 8 bits per channel
+    y4m         : YUV4MPEG2 stream with mono, 4:2:0, 4:2:2 or 4:4:4 planes. Size, frame rate and
+                  pixel format are taken from stream header. Limited range is expected unless the header
+                  has XCOLORRANGE=FULL, BT.601 matrix is used for conversion to RGB
+
+Reading, rendering and writing run in parallel threads with `buffers` frames between stages,
+next frame is read and previous one is written while current frame is rendered.
+
+    >>> process_stream(sys.stdin.buffer, sys.stdout.buffer, template, {'shot': 'sh010'}, size=(1920, 1080))
+"""
+import argparse
+import logging
+import os
+import queue
+import sys
+import threading
+from typing import BinaryIO, Callable, Iterator, Union
+
+import numpy as np
+from PIL import Image
+
+from .stamp import CompiledTemplate
+from .utils.templates import load_template_file, parse_variables
+
+logger = logging.getLogger(__name__)
+
+RAW_MODES = {'rgb': 'RGB', 'rgba': 'RGBA'}
+FORMATS = (*RAW_MODES, 'y4m')
+Y4M_MAGIC = b'YUV4MPEG2'
+# chroma subsampling of Y4M colorspaces: (horizontal, vertical) divisor, None for mono
+Y4M_CHROMA = {'420': (2, 2), '420jpeg': (2, 2), '420paldv': (2, 2), '420mpeg2': (2, 2),
+              '422': (2, 1), '444': (1, 1), 'mono': None}
+
+
+def open_stream(target: Union[int, str, BinaryIO], mode: str = 'rb') -> BinaryIO:
+    """
+    Binary stream of file descriptor, file path, "-" for stdin/stdout or existing stream
+    """
+    if target == '-':
+        return sys.stdin.buffer if 'r' in mode else sys.stdout.buffer
+    if isinstance(target, int):
+        return open(target, mode, closefd=False)
+    if isinstance(target, (str, os.PathLike)):
+        return open(target, mode)
+    return target
+
+
+def read_exactly(stream: BinaryIO, size: int) -> Union[bytearray, None]:
+    """
+    Next `size` bytes of the stream, None at the end of stream. Incomplete data raises EOFError
+    """
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        count = stream.readinto(view[pos:])
+        if not count:
+            if pos == 0:
+                return None
+            raise EOFError(f'Stream ended in the middle of frame: {pos} of {size} bytes')
+        pos += count
+    return buf
+
+
+def _read_line(stream: BinaryIO, limit: int = 4096) -> bytes:
+    line = bytearray()
+    while not line.endswith(b'\n'):
+        char = stream.read(1)
+        if not char:
+            break
+        line += char
+        if len(line) > limit:
+            raise ValueError('Y4M header is too long')
+    return bytes(line)
+
+
+class RawFrameReader(object):
+    """
+    Raw frames of fixed size and mode
+    """
+    def __init__(self, stream: BinaryIO, size: tuple[int, int], mode: str = 'RGB'):
+        self.stream = stream
+        self.size = tuple(size)
+        self.mode = mode
+        self.frame_bytes = self.size[0] * self.size[1] * len(mode)
+
+    def __iter__(self) -> Iterator[Image.Image]:
+        while True:
+            data = read_exactly(self.stream, self.frame_bytes)
+            if data is None:
+                return
+            yield Image.frombuffer(self.mode, self.size, data, 'raw', self.mode, 0, 1)
+
+
+class RawFrameWriter(object):
+    """
+    Frames written as raw bytes of given mode
+    """
+    def __init__(self, stream: BinaryIO, mode: str = 'RGB'):
+        self.stream = stream
+        self.mode = mode
+
+    def write(self, img: Image.Image):
+        if img.mode != self.mode:
+            img = img.convert(self.mode)
+        self.stream.write(img.tobytes())
+
+    def close(self):
+        self.stream.flush()
+
+
+class Y4MHeader(object):
+    """
+    Parameters of YUV4MPEG2 stream
+    """
+    def __init__(self, width: int, height: int, fps: str = '25:1', interlace: str = 'p', aspect: str = '1:1',
+                 colorspace: str = '420jpeg', extensions: list[str] = None):
+        if colorspace not in Y4M_CHROMA:
+            raise ValueError(f'Unsupported Y4M colorspace: {colorspace}')
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.interlace = interlace
+        self.aspect = aspect
+        self.colorspace = colorspace
+        self.extensions = list(extensions or [])
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    @property
+    def full_range(self) -> bool:
+        return 'XCOLORRANGE=FULL' in self.extensions
+
+    @property
+    def chroma_size(self) -> Union[tuple[int, int], None]:
+        sub = Y4M_CHROMA[self.colorspace]
+        if sub is None:
+            return None
+        return -(-self.width // sub[0]), -(-self.height // sub[1])
+
+    @property
+    def frame_bytes(self) -> int:
+        chroma = self.chroma_size
+        return self.width * self.height + (chroma[0] * chroma[1] * 2 if chroma else 0)
+
+    @classmethod
+    def parse(cls, line: bytes) -> 'Y4MHeader':
+        parts = line.decode('ascii').split()
+        if not parts or parts[0] != Y4M_MAGIC.decode():
+            raise ValueError('Stream is not YUV4MPEG2')
+        params = dict(width=None, height=None, extensions=[])
+        for part in parts[1:]:
+            key, value = part[0], part[1:]
+            if key == 'W':
+                params['width'] = int(value)
+            elif key == 'H':
+                params['height'] = int(value)
+            elif key == 'F':
+                params['fps'] = value
+            elif key == 'I':
+                params['interlace'] = value
+            elif key == 'A':
+                params['aspect'] = value
+            elif key == 'C':
+                params['colorspace'] = value
+            elif key == 'X':
+                params['extensions'].append(part)
+        if not params['width'] or not params['height']:
+            raise ValueError('Y4M header has no frame size')
+        return cls(**params)
+
+    def to_bytes(self) -> bytes:
+        parts = [Y4M_MAGIC.decode(), f'W{self.width}', f'H{self.height}', f'F{self.fps}', f'I{self.interlace}',
+                 f'A{self.aspect}', f'C{self.colorspace}', *self.extensions]
+        return ' '.join(parts).encode('ascii') + b'\n'
+
+
+# BT.601 limited range <> full range of PIL YCbCr conversion
+def _expand_range(planes: np.ndarray) -> np.ndarray:
+    luma = (planes[..., 0].astype(np.float32) - 16) * (255 / 219)
+    chroma = (planes[..., 1:].astype(np.float32) - 128) * (255 / 224) + 128
+    return np.clip(np.dstack([luma, chroma]) + 0.5, 0, 255).astype(np.uint8)
+
+
+def _compress_range(planes: np.ndarray) -> np.ndarray:
+    luma = planes[..., 0].astype(np.float32) * (219 / 255) + 16
+    chroma = (planes[..., 1:].astype(np.float32) - 128) * (224 / 255) + 128
+    return np.clip(np.dstack([luma, chroma]) + 0.5, 0, 255).astype(np.uint8)
+
+
+class Y4MReader(object):
+    """
+    RGB frames of YUV4MPEG2 stream. Header is read on creation
+    """
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.header = Y4MHeader.parse(_read_line(stream))
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.header.size
+
+    def __iter__(self) -> Iterator[Image.Image]:
+        header = self.header
+        luma_bytes = header.width * header.height
+        while True:
+            line = _read_line(self.stream)
+            if not line:
+                return
+            if not line.startswith(b'FRAME'):
+                raise ValueError(f'Invalid Y4M frame header: {line[:32]!r}')
+            data = read_exactly(self.stream, header.frame_bytes)
+            if data is None:
+                raise EOFError('Stream ended after frame header')
+            luma = Image.frombuffer('L', header.size, data[:luma_bytes], 'raw', 'L', 0, 1)
+            chroma = header.chroma_size
+            if chroma is None:
+                yield self._to_rgb(Image.merge('YCbCr', (luma, Image.new('L', header.size, 128),
+                                                         Image.new('L', header.size, 128))))
+                continue
+            chroma_bytes = chroma[0] * chroma[1]
+            planes = [luma]
+            for offset in (luma_bytes, luma_bytes + chroma_bytes):
+                plane = Image.frombuffer('L', chroma, data[offset:offset + chroma_bytes], 'raw', 'L', 0, 1)
+                if chroma != header.size:
+                    plane = plane.resize(header.size, Image.BILINEAR)
+                planes.append(plane)
+            yield self._to_rgb(Image.merge('YCbCr', planes))
+
+    def _to_rgb(self, img: Image.Image) -> Image.Image:
+        if not self.header.full_range:
+            img = Image.fromarray(_expand_range(np.asarray(img)), 'YCbCr')
+        return img.convert('RGB')
+
+
+class Y4MWriter(object):
+    """
+    Frames written as YUV4MPEG2 stream with given header
+    """
+    def __init__(self, stream: BinaryIO, header: Y4MHeader):
+        self.stream = stream
+        self.header = header
+        self.stream.write(header.to_bytes())
+
+    def write(self, img: Image.Image):
+        header = self.header
+        if img.size != header.size:
+            raise ValueError(f'Frame size {img.size} does not match stream size {header.size}')
+        ycbcr = img.convert('RGB').convert('YCbCr')
+        if not header.full_range:
+            ycbcr = Image.fromarray(_compress_range(np.asarray(ycbcr)), 'YCbCr')
+        luma, cb, cr = ycbcr.split()
+        self.stream.write(b'FRAME\n')
+        self.stream.write(luma.tobytes())
+        chroma = header.chroma_size
+        if chroma is None:
+            return
+        for plane in (cb, cr):
+            if chroma != header.size:
+                plane = plane.resize(chroma, Image.BOX)
+            self.stream.write(plane.tobytes())
+
+    def close(self):
+        self.stream.flush()
+
+
+class _End(object):
+    """
+    Last item of stage queue
+    """
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _End()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def process_stream(input_stream: Union[int, str, BinaryIO], output_stream: Union[int, str, BinaryIO],
+                   template: Union[dict, CompiledTemplate], context: dict, size: tuple[int, int] = None,
+                   input_format: str = 'rgb', output_format: str = None, fps: str = '25:1',
+                   context_callback: Callable[[int], dict] = None, buffers: int = 2) -> int:
+    """
+    Render all frames of the input stream and write them to the output stream.
+
+    input_stream    : binary stream, file descriptor, path or "-" for stdin
+    output_stream   : binary stream, file descriptor, path or "-" for stdout
+    size            : frame size of raw input
+    input_format    : "rgb", "rgba" or "y4m"
+    output_format   : format of output frames, the same as input by default. Y4M output of Y4M input
+                      keeps input header
+    fps             : frame rate of Y4M output of raw input, "num:den"
+    context_callback: function of frame index returning variables of the frame
+    buffers         : frames between read, render and write stages
+
+    Variable "frame" is index of the frame in the stream. Returns number of frames
+    """
+    output_format = output_format or input_format
+    for fmt in (input_format, output_format):
+        if fmt not in FORMATS:
+            raise ValueError(f'Unknown stream format: {fmt}')
+    template = CompiledTemplate.from_template(template)
+    src = open_stream(input_stream, 'rb')
+    try:
+        dst = open_stream(output_stream, 'wb')
+        try:
+            return _process(src, dst, template, context, size, input_format, output_format, fps,
+                            context_callback, buffers)
+        finally:
+            if dst is not output_stream and dst is not sys.stdout.buffer:
+                dst.close()
+    finally:
+        if src is not input_stream and src is not sys.stdin.buffer:
+            src.close()
+
+
+def _process(src: BinaryIO, dst: BinaryIO, template: CompiledTemplate, context: dict, size: tuple[int, int],
+             input_format: str, output_format: str, fps: str, context_callback: Callable[[int], dict],
+             buffers: int) -> int:
+    if input_format == 'y4m':
+        reader = Y4MReader(src)
+        size = reader.size
+    else:
+        if not size:
+            raise ValueError('Frame size of raw stream is required')
+        reader = RawFrameReader(src, size, RAW_MODES[input_format])
+    if output_format == 'y4m':
+        header = reader.header if input_format == 'y4m' else Y4MHeader(size[0], size[1], fps=fps)
+        writer = Y4MWriter(dst, header)
+    else:
+        writer = RawFrameWriter(dst, RAW_MODES[output_format])
+
+    decoded = queue.Queue(maxsize=max(1, buffers))
+    rendered = queue.Queue(maxsize=max(1, buffers))
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            for img in reader:
+                _put(decoded, img, stop)
+                if stop.is_set():
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            _put(decoded, _End(), stop)
+
+    def write():
+        try:
+            while True:
+                img = rendered.get()
+                if isinstance(img, _End):
+                    break
+                writer.write(img)
+            writer.close()
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    reader_thread = threading.Thread(target=read, name='frame-stamp-stream-read', daemon=True)
+    writer_thread = threading.Thread(target=write, name='frame-stamp-stream-write', daemon=True)
+    reader_thread.start()
+    writer_thread.start()
+    count = 0
+    try:
+        while not stop.is_set():
+            img = _get(decoded, stop)
+            if isinstance(img, _End):
+                break
+            variables = {**context, 'frame': count}
+            if context_callback:
+                variables.update(context_callback(count))
+            _put(rendered, template.bind(img, variables).render(), stop)
+            count += 1
+    finally:
+        # writer gets all rendered frames, reader is stopped. Reader blocked by silent input is left
+        _put_end(rendered, writer_thread)
+        stop.set()
+        reader_thread.join(timeout=1)
+    if errors:
+        raise errors[0]
+    return count
+
+
+def _put_end(q: queue.Queue, writer_thread: threading.Thread):
+    # writer takes the end marker after all frames, or it is already stopped by error
+    while writer_thread.is_alive():
+        try:
+            q.put(_End(), timeout=0.1)
+            break
+        except queue.Full:
+            continue
+    writer_thread.join()
+
+
+def _parse_size(value: str) -> tuple[int, int]:
+    width, _, height = value.lower().partition('x')
+    return int(width), int(height)
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(prog='python -m frame_stamp.stream',
+                                     description='Render frames of raw video stream from stdin to stdout')
+    parser.add_argument('template', help='template file')
+    parser.add_argument('-n', '--name', help='name of template in template file, first template by default')
+    parser.add_argument('-s', '--size', type=_parse_size, help='frame size of raw input, WIDTHxHEIGHT')
+    parser.add_argument('-f', '--format', default='rgb', choices=FORMATS, help='input format')
+    parser.add_argument('-o', '--output-format', choices=FORMATS, help='output format, the same as input by default')
+    parser.add_argument('-i', '--input', default='-', help='input file, stdin by default')
+    parser.add_argument('--output', default='-', help='output file, stdout by default')
+    parser.add_argument('-r', '--fps', default='25:1', help='frame rate of Y4M output of raw input')
+    parser.add_argument('-v', '--variable', action='append', default=[], help='name=value, value is JSON or text')
+    args = parser.parse_args(argv)
+    variables = parse_variables(args.variable)
+    template = load_template_file(args.template, args.name)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    count = process_stream(args.input, args.output, template, variables, size=args.size, input_format=args.format,
+                           output_format=args.output_format, fps=args.fps)
+    logger.info('Rendered %s frames', count)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
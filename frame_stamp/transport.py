@@ -0,0 +1,139 @@
+"""
+Shared memory transport of frames between pipeline stages running in different processes.
+
+Decode stage copies the frame into a free slot of SharedFrameRing and sends only SharedFrame
+descriptor (slot name and frame size) to render process. Render process wraps the slot
+without copy as PIL image or NumPy array, renders the frame and writes result back to the same slot.
+Encode stage saves the image directly from the slot and the slot returns to the ring.
+
+    >>> ring = SharedFrameRing(slots=8, slot_bytes=3840 * 2160 * 4)
+    >>> frame = ring.acquire((3840, 2160))
+    >>> frame.write(image)
+    >>> ...
+    >>> ring.release(frame)
+    >>> ring.close()
+
+Slots are allocated once and reused for all frames.
+"""
+import queue
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+# shared memory blocks opened by current process
+_attached = {}
+_attached_lock = threading.Lock()
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Shared memory block by name, opened once per process
+    """
+    with _attached_lock:
+        shm = _attached.get(name)
+        if shm is None:
+            shm = _attached[name] = shared_memory.SharedMemory(name=name)
+        return shm
+
+
+class SharedFrame(object):
+    """
+    RGBA frame in shared memory slot. Pickled as slot name and frame size
+    """
+    __slots__ = ('name', 'size')
+
+    def __init__(self, name: str, size: tuple[int, int]):
+        self.name = name
+        self.size = tuple(size)
+
+    def __getstate__(self):
+        return self.name, self.size
+
+    def __setstate__(self, state):
+        self.name, self.size = state
+
+    @property
+    def nbytes(self) -> int:
+        return self.size[0] * self.size[1] * 4
+
+    def array(self) -> np.ndarray:
+        """
+        Writable view of the slot, shape (height, width, 4)
+        """
+        buf = attach(self.name).buf
+        return np.ndarray((self.size[1], self.size[0], 4), dtype=np.uint8, buffer=buf)
+
+    def image(self) -> Image.Image:
+        """
+        Read-only RGBA image sharing memory with the slot. Delete it before the slot is reused
+        """
+        buf = attach(self.name).buf[:self.nbytes]
+        return Image.frombuffer('RGBA', self.size, buf, 'raw', 'RGBA', 0, 1)
+
+    def write(self, img: Image.Image):
+        """
+        Copy image pixels to the slot
+        """
+        if img.size != self.size:
+            raise ValueError(f'Image size {img.size} does not match frame size {self.size}')
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+        attach(self.name).buf[:self.nbytes] = img.tobytes()
+
+    def __repr__(self):
+        return f'<SharedFrame {self.name} {self.size[0]}x{self.size[1]}>'
+
+
+class SharedFrameRing(object):
+    """
+    Fixed set of shared memory slots owned by the current process.
+
+    slots       : number of slots, max number of frames in flight
+    slot_bytes  : size of each slot, frames bigger than the slot can't be placed
+    """
+    def __init__(self, slots: int, slot_bytes: int):
+        self.slot_bytes = slot_bytes
+        self._blocks = []
+        self._free = queue.Queue()
+        try:
+            for _ in range(slots):
+                shm = shared_memory.SharedMemory(create=True, size=slot_bytes)
+                self._blocks.append(shm)
+                with _attached_lock:
+                    _attached[shm.name] = shm
+                self._free.put(shm.name)
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def fits(self, size: tuple[int, int]) -> bool:
+        return size[0] * size[1] * 4 <= self.slot_bytes
+
+    def acquire(self, size: tuple[int, int], timeout: float = None) -> SharedFrame:
+        """
+        Free slot for frame of given size, waits until one of slots is released
+        """
+        if not self.fits(size):
+            raise ValueError(f'Frame {size} does not fit slot of {self.slot_bytes} bytes')
+        return SharedFrame(self._free.get(timeout=timeout), size)
+
+    def release(self, frame: SharedFrame):
+        self._free.put(frame.name)
+
+    def close(self):
+        """
+        Free all slots. Images and arrays of the slots must be deleted before
+        """
+        for shm in self._blocks:
+            with _attached_lock:
+                _attached.pop(shm.name, None)
+            try:
+                shm.close()
+            finally:
+                shm.unlink()
+        self._blocks = []
@@ -1,36 +1,134 @@
 import os
+import threading
+from collections import defaultdict
 from functools import wraps
 import subprocess
 from pydoc import locate
 
 USE_CACHE = not bool(os.getenv('NO_CACHE'))
+# per-attribute hit/miss counters of cached_result, see enable_cache_stats
+CACHE_STATS = bool(os.getenv('FRAMESTAMP_CACHE_STATS'))
+
+# inputs recorded by cached values besides variable names
+READS_PARENT = ':parent'        # parent shape of the instance
+READS_VOLATILE = ':volatile'    # random, current time, source pixels: different on each render
+READS_FILES = ':files'          # resource files, can be modified between frames
+
+_stats = defaultdict(lambda: [0, 0])
+
+
+class _Reads(threading.local):
+    """
+    Inputs of cached values computed in current thread, innermost value is the last
+    """
+    def __init__(self):
+        self.stack = []
+
+
+_reads = _Reads()
+
+
+def record_read(name: str):
+    """
+    Cached values being computed depend on the input: variable name or one of READS_* tokens
+    """
+    stack = _reads.stack
+    if stack:
+        stack[-1].add(name)
 
 
 def cached_result(func):
     """
-    Кеширование значения для шейп
+    Кеширование значения для шейп.
+
+    Value is stored in instance __cache__ by qualified name of the function, None is not cached.
+    Inputs read while computing (see record_read), including inputs of other cached values it reads,
+    are stored in __cache_reads__, so invalidate_cached drops only values depending on changed inputs.
     """
+    key = func.__qualname__
+    counters = _stats[key]
+
     @wraps(func)
-    def wrapped(*args, **kwargs):
-        if USE_CACHE:
-            inst = args[0]
-            cache_key = f'{func.__qualname__}'
-            try:
-                result = getattr(inst, '__cache__', {})[cache_key]
-            except AttributeError:  # no cache
-                result = func(*args, **kwargs)
-                if result is not None:
-                    inst.__cache__ = {cache_key: result}
-            except KeyError:    # not saved yet
-                result = func(*args, **kwargs)
-                if result is not None:
-                    inst.__cache__[cache_key] = result
+    def wrapped(inst, *args, **kwargs):
+        if not USE_CACHE:
+            return func(inst, *args, **kwargs)
+        try:
+            cache = inst.__cache__
+        except AttributeError:
+            cache = inst.__cache__ = {}
+        stack = _reads.stack
+        try:
+            result = cache[key]
+        except KeyError:    # not saved yet
+            pass
         else:
-            result = func(*args, **kwargs)
+            if CACHE_STATS:
+                counters[0] += 1
+            if stack:
+                reads = inst.__dict__.get('__cache_reads__', {}).get(key)
+                if reads:
+                    stack[-1].update(reads)
+            return result
+        if CACHE_STATS:
+            counters[1] += 1
+        reads = set()
+        stack.append(reads)
+        try:
+            result = func(inst, *args, **kwargs)
+        finally:
+            stack.pop()
+        if result is not None:
+            cache[key] = result
+            if reads:
+                try:
+                    inst.__cache_reads__[key] = reads
+                except AttributeError:
+                    inst.__cache_reads__ = {key: reads}
+        if stack and reads:
+            stack[-1].update(reads)
         return result
     return wrapped
 
 
+def invalidate_cached(inst, names: set) -> bool:
+    """
+    Drop cached values of the instance depending on any of the inputs and volatile values.
+    Returns True if any value is dropped
+    """
+    cache = inst.__dict__.get('__cache__')
+    if not cache:
+        return False
+    all_reads = inst.__dict__.get('__cache_reads__') or {}
+    dropped = False
+    for key, reads in list(all_reads.items()):
+        if READS_VOLATILE in reads or not reads.isdisjoint(names):
+            cache.pop(key, None)
+            del all_reads[key]
+            dropped = True
+    return dropped
+
+
+def enable_cache_stats(enabled: bool = True):
+    """
+    Count hits and misses of each cached attribute. Also enabled by FRAMESTAMP_CACHE_STATS environment variable
+    """
+    global CACHE_STATS
+    CACHE_STATS = enabled
+
+
+def cache_stats() -> dict:
+    """
+    Hits and misses of cached attributes: {qualified name: {"hits": int, "misses": int}}.
+    Counters are approximate when shapes are rendered in several threads
+    """
+    return {key: {'hits': hits, 'misses': misses} for key, (hits, misses) in _stats.items() if hits or misses}
+
+
+def reset_cache_stats():
+    for counters in _stats.values():
+        counters[0] = counters[1] = 0
+
+
 def load_from_dotted(name):
     """
     Импорт модуля по имени
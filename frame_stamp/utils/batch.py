@@ -1,10 +1,11 @@
 from pathlib import Path
+from typing import Union
 
-from frame_stamp.stamp import FrameStamp
+from frame_stamp.stamp import CompiledTemplate
 
 
 def batch_with_sequences(source_images: list[str],
-                         template: dict,
+                         template: Union[dict, CompiledTemplate],
                          variables: dict,
                          output_file_name: str,
                          output_path: str) -> None:
@@ -20,6 +21,7 @@ def batch_with_sequences(source_images: list[str],
             }
         }
     """
+    template = CompiledTemplate.from_template(template)
     for i, image in enumerate(source_images):
         _variables = {}
         for key, value in variables.items():
@@ -27,6 +29,6 @@ def batch_with_sequences(source_images: list[str],
                 _variables[key] = value[i]
             else:
                 _variables[key] = value
-        stamp = FrameStamp(image, template, _variables)
+        stamp = template.bind(image, _variables)
         stamp.render(save_path=Path(output_path, f'{output_file_name}'+str(i).zfill(3)).with_suffix('.png'))
 
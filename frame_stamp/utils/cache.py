@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from frame_stamp.utils import USE_CACHE
+
+
+class LRUCache(object):
+    """
+    Thread safe LRU cache limited by number of items and optionally by total size of items.
+
+        >>> cache = LRUCache(maxsize=32, max_bytes=2**20, sizeof=len)
+        >>> value = cache.get_or_create(key, lambda: compute(key))
+
+    Caching is disabled with NO_CACHE environment variable.
+    """
+    def __init__(self, maxsize: int = 128, max_bytes: int = None, sizeof: Callable[[Any], int] = None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._items = OrderedDict()   # key > (value, size)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key: Hashable):
+        return key in self._items
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            try:
+                value, _ = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value):
+        if not USE_CACHE:
+            return
+        size = self._sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # never fits
+            return
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while len(self._items) > self.maxsize or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, (_, removed_size) = self._items.popitem(last=False)
+                self._bytes -= removed_size
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]):
+        """
+        Cached value or new value from factory. Factory is called without lock
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+            self.hits = self.misses = 0
+
+    def info(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, size=len(self._items), bytes=self._bytes)
+
+
+_MISSING = object()
+
+
+def freeze(value):
+    """
+    Hashable copy of value from template: lists to tuples, dicts to sorted tuples of items
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(x) for x in value)
+    return value
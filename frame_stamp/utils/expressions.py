@@ -0,0 +1,225 @@
+"""
+Compiled parameter values.
+
+Every string value of a template parameter is parsed once into a small node object
+and the node is cached process-wide by its source string. Evaluation of a node only
+asks the shape (resolver) for the current values of variables, units and scope shapes.
+
+Supported forms (same priority as before):
+
+    "10"            : int
+    "1.5"           : float
+    "10u" / "10p"   : unit / point literal
+    "50%"           : percent of default value
+    "shape.attr"    : attribute of other shape
+    "$variable"     : variable from context or defaults
+    "=expression"   : python expression with operands from all above
+"""
+import logging
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+EXPRESSION_CACHE_SIZE = 4096
+
+FLOAT_PATTERN = re.compile(r"^\d*\.\d*$")
+UNIT_PATTERN = re.compile(r"-?[\d.]+u")
+POINT_PATTERN = re.compile(r"-?[\d.]+p")
+PERCENT_PATTERN = re.compile(r'^(\d+)%$')
+SCOPE_PATTERN = re.compile(r'^(\w+)\.(\w+)$')
+VARIABLE_PATTERN = re.compile(r"\$([\w\d_]+)")
+OPERAND_PATTERN = re.compile(r"[\w\d.%$]+")
+NAME_PATTERN = re.compile(r"[A-Za-z_]\w*")
+# functions from render globals that give new result on each call
+VOLATILE_NAMES = frozenset(('random', 'uniform', 'randint', 'random_seed'))
+
+
+class Node:
+    """
+    Compiled parameter value
+    """
+    __slots__ = ('source',)
+
+    def __init__(self, source: str):
+        self.source = source
+
+    def __repr__(self):
+        return '<{} {!r}>'.format(self.__class__.__name__, self.source)
+
+    def evaluate(self, shape, key: str, kwargs: dict):
+        raise NotImplementedError
+
+
+class Text(Node):
+    """Plain string without any special meaning"""
+    __slots__ = ()
+
+    def evaluate(self, shape, key, kwargs):
+        return self.source
+
+
+class Constant(Node):
+    """Int or float literal"""
+    __slots__ = ('value',)
+
+    def __init__(self, source, value):
+        super().__init__(source)
+        self.value = value
+
+    def evaluate(self, shape, key, kwargs):
+        return self.value
+
+
+class UnitValue(Node):
+    """Number multiplied to unit: "10u" """
+    __slots__ = ('factor',)
+
+    def __init__(self, source, factor):
+        super().__init__(source)
+        self.factor = factor
+
+    def evaluate(self, shape, key, kwargs):
+        return self.factor * shape.unit
+
+
+class PointValue(UnitValue):
+    """Number multiplied to point: "10p" """
+    __slots__ = ()
+
+    def evaluate(self, shape, key, kwargs):
+        return self.factor * shape.point
+
+
+class Percent(Node):
+    """Percent of default value: "50%" """
+    __slots__ = ('percent',)
+
+    def __init__(self, source, percent):
+        super().__init__(source)
+        self.percent = percent
+
+    def evaluate(self, shape, key, kwargs):
+        try:
+            res = shape._resolve_percent(key, self.percent, **kwargs)
+        except KeyError:
+            return self.source
+        return self.source if res is None else res
+
+
+class ScopeReference(Node):
+    """Attribute of other shape: "shape_id.x" """
+    __slots__ = ('name', 'attr')
+
+    def __init__(self, source, name, attr):
+        super().__init__(source)
+        self.name = name
+        self.attr = attr
+
+    def evaluate(self, shape, key, kwargs):
+        try:
+            res = shape._resolve_scope_attr(self.name, self.attr)
+        except KeyError:
+            return self.source
+        return self.source if res is None else res
+
+
+class VariableReference(Node):
+    """Value from variables or defaults: "$name" """
+    __slots__ = ('name',)
+
+    def __init__(self, source, name):
+        super().__init__(source)
+        self.name = name
+
+    def evaluate(self, shape, key, kwargs):
+        try:
+            res = shape._resolve_variable(key, self.name)
+        except KeyError:
+            return self.source
+        return self.source if res is None else res
+
+
+class Expression(Node):
+    """
+    Python expression: "=$value*2+other.x"
+
+    Operands are substituted into the expression text as before, but every operand is compiled once
+    and the resulting python code is cached by the final text, so frames with the same operand values
+    never compile the code again.
+    """
+    __slots__ = ('body', 'operands', 'volatile')
+
+    def __init__(self, source, body, operands):
+        super().__init__(source)
+        self.body = body
+        self.operands = operands
+        self.volatile = not VOLATILE_NAMES.isdisjoint(NAME_PATTERN.findall(body))
+
+    def evaluate(self, shape, key, kwargs):
+        if self.volatile:
+            shape._track_volatile()
+        expr = self.body
+        for op, node in self.operands:
+            val = node.evaluate(shape, key, {})
+            if val is None:
+                val = op
+            expr = expr.replace(op, str(val if not callable(val) else val()))
+        try:
+            return eval(compile_code(expr), {'self': shape, 'key': key, 'expr': expr, 'kwargs': kwargs,
+                                             **shape.render_globals()})
+        except Exception:
+            logger.exception('Evaluate expression error in field {}/{}: {}'.format(shape, key, expr))
+            raise
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_value(source: str) -> Node:
+    """
+    Parse string parameter value to node. Result is cached by source string.
+    """
+    if source.isdigit():
+        return Constant(source, int(source))
+    elif FLOAT_PATTERN.match(source):
+        return Constant(source, float(source))
+    if UNIT_PATTERN.match(source):
+        return UnitValue(source, float(source.rstrip('u')))
+    if POINT_PATTERN.match(source):
+        return PointValue(source, float(source.rstrip('p')))
+    match = PERCENT_PATTERN.match(source)
+    if match:
+        return Percent(source, float(match.group(1)))
+    match = SCOPE_PATTERN.match(source)
+    if match:
+        return ScopeReference(source, *match.groups())
+    match = VARIABLE_PATTERN.match(source)
+    if match:
+        return VariableReference(source, match.group(1))
+    expr = source.strip('`')
+    if expr.startswith('='):
+        return compile_expression(source, expr.lstrip('='))
+    return Text(source)
+
+
+def compile_expression(source: str, body: str) -> Expression:
+    operands = []
+    for op in OPERAND_PATTERN.findall(body):
+        node = compile_value(op)
+        if isinstance(node, Text) or (isinstance(node, Constant) and str(node.value) == op):
+            # replacing the operand with itself changes nothing
+            continue
+        operands.append((op, node))
+    return Expression(source, body, tuple(operands))
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_code(expr: str):
+    return compile(expr, '<expression>', 'eval')
+
+
+def clear_cache():
+    """
+    Drop all compiled values
+    """
+    compile_value.cache_clear()
+    compile_code.cache_clear()
@@ -1,7 +1,13 @@
 import math
 from typing import Callable
 
-from PIL import Image, ImageDraw
+import numpy as np
+from PIL import Image
+
+from frame_stamp.utils.cache import LRUCache, freeze
+
+GRADIENT_CACHE_BYTES = 256 * 2**20
+_gradient_cache = LRUCache(maxsize=64, max_bytes=GRADIENT_CACHE_BYTES, sizeof=lambda img: img.width * img.height * 4)
 
 
 def linear_gradient(size: tuple[int, int], point1: tuple[int, int, int], point2: tuple[int, int, int],
@@ -17,8 +23,6 @@ def linear_gradient(size: tuple[int, int], point1: tuple[int, int, int], point2:
     if not len(color2) == 4:
         raise ValueError("Color2 must be a tuple of (r, g, b, a)")
 
-    img = Image.new('RGBA', size)
-    draw = ImageDraw.Draw(img)
     width, height = size
     x1, y1 = max(0, min(point1[0], width - 1)), max(0, min(point1[1], height - 1))
     x2, y2 = max(0, min(point2[0], width - 1)), max(0, min(point2[1], height - 1))
@@ -26,17 +30,14 @@ def linear_gradient(size: tuple[int, int], point1: tuple[int, int, int], point2:
     dy = y2 - y1
     length = math.sqrt(dx * dx + dy * dy)
     if length == 0:
-        return img
-    for y in range(height):
-        for x in range(width):
-            t = ((x - x1) * dx + (y - y1) * dy) / (length * length)
-            t = max(0, min(t, 1))
-            r = int(color1[0] + (color2[0] - color1[0]) * t)
-            g = int(color1[1] + (color2[1] - color1[1]) * t)
-            b = int(color1[2] + (color2[2] - color1[2]) * t)
-            a = int(color1[3] + (color2[3] - color1[3]) * t)
-            draw.point((x, y), (r, g, b, a))
-    return img
+        return Image.new('RGBA', size)
+    y, x = np.ogrid[:height, :width]
+    t = ((x - x1) * dx + (y - y1) * dy) / (length * length)
+    t = np.clip(t, 0, 1)[..., np.newaxis]
+    color1 = np.array(color1, dtype=np.float64)
+    color2 = np.array(color2, dtype=np.float64)
+    pixels = color1 + (color2 - color1) * t
+    return Image.fromarray(pixels.astype(np.uint8), 'RGBA')
 
 
 def radial_gradient(size: tuple[int, int], center: tuple[int, int], radius: int,
@@ -52,24 +53,15 @@ def radial_gradient(size: tuple[int, int], center: tuple[int, int], radius: int,
     if not radius > 0:
         raise ValueError("Radius must be greater than 0")
 
-    img = Image.new('RGBA', size)
-    draw = ImageDraw.Draw(img)
     width, height = size
     cx, cy = center
-    for y in range(height):
-        for x in range(width):
-            dist = math.hypot(x - cx, y - cy)
-            if dist >= radius:
-                r, g, b, a = color2
-            else:
-                norm_dist = dist / radius
-                r = int(color1[0] + (color2[0] - color1[0]) * norm_dist)
-                g = int(color1[1] + (color2[1] - color1[1]) * norm_dist)
-                b = int(color1[2] + (color2[2] - color1[2]) * norm_dist)
-                a = int(color1[3] + (color2[3] - color1[3]) * norm_dist)
-            final_alpha = int(a * 255 / 255)
-            draw.point((x, y), (r, g, b, final_alpha))
-    return img
+    y, x = np.ogrid[:height, :width]
+    dist = np.hypot(x - cx, y - cy)[..., np.newaxis]
+    color1 = np.array(color1, dtype=np.float64)
+    color2 = np.array(color2, dtype=np.float64)
+    pixels = color1 + (color2 - color1) * (dist / radius)
+    pixels = np.where(dist >= radius, color2, pixels)
+    return Image.fromarray(pixels.astype(np.uint8), 'RGBA')
 
 
 def get_gradient_renderer(gradient_type: str) -> Callable:
@@ -81,10 +73,23 @@ def get_gradient_renderer(gradient_type: str) -> Callable:
         raise ValueError(f"Unknown gradient type: {gradient_type}")
 
 
+def get_gradient(gradient_type: str, size: tuple[int, int], **kwargs) -> Image.Image:
+    """
+    Cached gradient image. Same image is returned for same type, size, points and colors, don't modify it
+    """
+    if gradient_type == 'linear':
+        params = ('point1', 'point2', 'color1', 'color2')
+    else:
+        params = ('center', 'radius', 'color1', 'color2')
+    key = (gradient_type, tuple(size)) + tuple(freeze(kwargs.get(name)) for name in params)
+    render = get_gradient_renderer(gradient_type)
+    return _gradient_cache.get_or_create(key, lambda: render(size=size, **kwargs))
+
+
 def mix_alpha_channels(img1: Image.Image, img2: Image.Image) -> None:
     """
     Mix alpha img1 > img2
-    img2 will be changed
+    img2 will be changed. Only bounding box of img2 visible pixels is computed
     """
     if img1.mode == 'L':
         alpha = img1
@@ -98,14 +103,97 @@ def mix_alpha_channels(img1: Image.Image, img2: Image.Image) -> None:
     if img2.mode != 'RGBA':
         img2 = img2.convert('RGBA')
 
-    width, height = img2.size
-    alpha_data = alpha.load()
-    img2_data = img2.load()
-    for y in range(height):
-        for x in range(width):
-            pixel1 = alpha_data[x, y]
-            pixel2 = img2_data[x, y]
-            alpha1 = pixel1 / 255
-            alpha2 = pixel2[3] / 255
-            new_alpha = int(alpha1 * alpha2 * 255)
-            img2_data[x, y] = (pixel2[0], pixel2[1], pixel2[2], new_alpha)
+    alpha2 = img2.getchannel('A')
+    # pixels outside of visible part of img2 stay transparent
+    box = alpha2.getbbox()
+    if not box:
+        return
+    alpha1 = np.asarray(alpha.crop(box), dtype=np.float64) / 255
+    mixed = alpha1 * (np.asarray(alpha2.crop(box), dtype=np.float64) / 255) * 255
+    alpha2.paste(Image.fromarray(mixed.astype(np.uint8), 'L'), box)
+    img2.putalpha(alpha2)
+
+
+def alpha_composite_clipped(dst: Image.Image, overlay: Image.Image, pos: tuple[int, int]) -> None:
+    """
+    Alpha composite overlay over dst in place.
+    Unlike Image.alpha_composite position can be negative, overlay is clipped by dst bounds.
+    """
+    if overlay.mode != 'RGBA':
+        overlay = overlay.convert('RGBA')
+    x, y = pos
+    left, top = max(0, -x), max(0, -y)
+    right = min(overlay.width, dst.width - x)
+    bottom = min(overlay.height, dst.height - y)
+    if right <= left or bottom <= top:
+        return
+    dst.alpha_composite(overlay, (x + left, y + top), (left, top, right, bottom))
+
+
+def paste_trimmed(dst: Image.Image, overlay: Image.Image, pos: tuple[int, int]) -> None:
+    """
+    Paste overlay with own alpha, only visible part of the overlay is composited.
+    Result is the same as dst.paste(overlay, pos, overlay)
+    """
+    # bounds of non-transparent pixels of RGBA image
+    box = overlay.getbbox()
+    if not box:
+        return
+    if (box[2] - box[0]) * (box[3] - box[1]) * 2 > overlay.width * overlay.height:
+        # copy of the visible part costs more than paste of transparent pixels
+        dst.paste(overlay, tuple(pos), overlay)
+        return
+    overlay = overlay.crop(box)
+    dst.paste(overlay, (pos[0] + box[0], pos[1] + box[1]), overlay)
+
+
+class OverlayLayer(object):
+    """
+    Accumulates overlays into one transparent layer to composite it onto the image with single paste.
+
+        >>> layer = OverlayLayer(image.size)
+        >>> layer.add(overlay, pos)
+        >>> layer.composite(image)
+
+    Overlays are accumulated with alpha_composite, "over" operator computed in premultiplied alpha,
+    layer is kept in straight alpha because PIL paste takes mask from the same image.
+    RGB result is the same as sequential paste of overlays up to rounding, 1-2 LSB where overlays overlap.
+    """
+    def __init__(self, size: tuple[int, int]):
+        self.size = size
+        self._layer = None
+        self._bbox = None
+
+    @property
+    def bbox(self):
+        """
+        Bounds of all added visible pixels
+        """
+        return self._bbox
+
+    def add(self, overlay: Image.Image, pos: tuple[int, int]) -> None:
+        if overlay.mode != 'RGBA':
+            overlay = overlay.convert('RGBA')
+        box = overlay.getbbox()
+        if not box:
+            return
+        x, y = pos
+        box = (max(0, x + box[0]), max(0, y + box[1]), min(self.size[0], x + box[2]), min(self.size[1], y + box[3]))
+        if box[2] <= box[0] or box[3] <= box[1]:
+            return
+        if self._layer is None:
+            self._layer = Image.new('RGBA', self.size, (0, 0, 0, 0))
+            self._bbox = box
+        else:
+            self._bbox = (min(self._bbox[0], box[0]), min(self._bbox[1], box[1]),
+                          max(self._bbox[2], box[2]), max(self._bbox[3], box[3]))
+        alpha_composite_clipped(self._layer, overlay, pos)
+
+    def composite(self, dst: Image.Image) -> None:
+        """
+        Paste accumulated layer onto image in place
+        """
+        if self._bbox is None:
+            return
+        layer = self._layer.crop(self._bbox)
+        dst.paste(layer, self._bbox[:2], layer)
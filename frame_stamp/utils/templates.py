@@ -0,0 +1,45 @@
+"""
+Template files and variables of command line tools
+"""
+import json
+from pathlib import Path
+from typing import Union
+
+from frame_stamp.utils import jsonc
+
+
+def template_from_data(data: dict, name: str = None) -> dict:
+    """
+    Template from data of template file: {"templates": [...]} or single template.
+    First template of the file is used if name is not set
+    """
+    if 'templates' not in data:
+        return data
+    templates = data['templates']
+    if not templates:
+        raise ValueError('Template file has no templates')
+    if name is None:
+        return templates[0]
+    for template in templates:
+        if template.get('name') == name:
+            return template
+    raise ValueError(f'Template {name} not found')
+
+
+def load_template_file(path: Union[str, Path], name: str = None) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return template_from_data(jsonc.load(f), name)
+
+
+def parse_variables(items: list[str]) -> dict:
+    """
+    Variables from "name=value" items, value is parsed as JSON or kept as string
+    """
+    variables = {}
+    for item in items:
+        name, _, value = item.partition('=')
+        try:
+            variables[name] = json.loads(value)
+        except ValueError:
+            variables[name] = value
+    return variables
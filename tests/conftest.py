@@ -31,6 +31,16 @@ def temp_image() -> Path:
     return img_path
 
 
+@pytest.fixture
+def sequence_dir(tmp_path) -> Path:
+    """Directory of 12 frames"""
+    src = tmp_path / "src"
+    src.mkdir()
+    for i in range(12):
+        Image.new("RGB", (120, 60), (i * 20, 50, 100)).save(src / f"frame.{i:04d}.png")
+    return src
+
+
 @pytest.fixture
 def rect_template():
     """Минимальный шаблон с одной rect-формой"""
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from frame_stamp import CompiledTemplate, FrameStamp
+from frame_stamp.aio import process_sequence_async, render_async
+
+TEMPLATE = {
+    "shapes": [
+        {"type": "rect", "x": 5, "y": 5, "width": 40, "height": 10, "color": [255, 0, 0, 200]},
+        {"type": "label", "text": "frame $frame", "x": 5, "y": 20},
+    ]
+}
+
+
+def test_render_async(sequence_dir, tmp_path):
+    source = sequence_dir / "frame.0003.png"
+    expected = FrameStamp(Image.open(source), TEMPLATE, {"frame": 3}).render()
+    compiled = CompiledTemplate(TEMPLATE)
+
+    async def main():
+        with ThreadPoolExecutor(4) as pool:
+            images = await asyncio.gather(*[render_async(source, compiled, {"frame": 3}, executor=pool)
+                                            for _ in range(8)])
+        with ProcessPoolExecutor(1) as pool:
+            path = await render_async(source, TEMPLATE, {"frame": 3}, tmp_path / "out.png", executor=pool)
+        return images, path
+
+    images, path = asyncio.run(main())
+    assert all(img.tobytes() == expected.tobytes() for img in images)
+    assert path == tmp_path / "out.png"
+    assert Image.open(path).tobytes() == expected.tobytes()
+
+
+def test_render_async_limit(sequence_dir):
+    source = sequence_dir / "frame.0000.png"
+    lock = threading.Lock()
+    active = peak = 0
+
+    def track(fn, *args):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        try:
+            time.sleep(0.01)
+            return fn(*args)
+        finally:
+            with lock:
+                active -= 1
+
+    class TrackingPool(ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            return super().submit(track, fn, *args)
+
+    async def main():
+        limit = asyncio.Semaphore(2)
+        with TrackingPool(8) as pool:
+            await asyncio.gather(*[render_async(source, TEMPLATE, {"frame": 0}, executor=pool, limit=limit)
+                                   for _ in range(6)])
+
+    asyncio.run(main())
+    assert peak == 2
+
+
+def test_process_sequence_async(sequence_dir, tmp_path):
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        task = asyncio.create_task(ticker())
+        results = [r async for r in process_sequence_async(sequence_dir, tmp_path / "out", TEMPLATE, {},
+                                                           multithread=False)]
+        task.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(main())
+    assert sorted(r.index for r in results) == list(range(12))
+    assert all(r.ok for r in results)
+    # loop was not blocked by render
+    assert ticks > 1
+
+
+def test_process_sequence_async_cancel(sequence_dir, tmp_path):
+    out = tmp_path / "out"
+
+    async def main():
+        results = []
+        sequence = process_sequence_async(sequence_dir, out, TEMPLATE, {}, multithread=False, depth=2)
+        async for result in sequence:
+            results.append(result)
+            if len(results) == 3:
+                break
+        await sequence.aclose()
+        return results
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    assert len(results) == 3
+    assert time.perf_counter() - start < 10
+    # frames in flight are finished, the rest are not taken
+    assert 3 <= len(list(out.glob("*.png"))) < 12
+    # manifest is saved, rerun renders only remaining frames
+    rendered = len(list(out.glob("*.png")))
+
+    async def rerun():
+        return [r async for r in process_sequence_async(sequence_dir, out, TEMPLATE, {}, multithread=False)]
+
+    results = asyncio.run(rerun())
+    assert sum(not r.skipped for r in results) == 12 - rendered
+
+
+def test_process_sequence_async_error(tmp_path):
+    async def main():
+        return [r async for r in process_sequence_async(tmp_path / "missing", tmp_path / "out", TEMPLATE, {})]
+
+    with pytest.raises(IOError):
+        asyncio.run(main())
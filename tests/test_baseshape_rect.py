@@ -90,3 +90,76 @@ def test_raw_rect(rect_shape):
 
 def test_gradient_default(rect_shape):
     assert rect_shape.gradient is None
+
+
+# CANVAS
+
+
+@pytest.mark.parametrize("shape_data", [
+    {"type": "rect", "x": 10.5, "y": 20, "width": 300, "height": 20, "border": {"width": 4, "color": "red"}},
+    {"type": "label", "x": -5, "y": 30.3, "text": "Burn-in Ag qp label bar, frame 0001 of 0100", "font_size": 20, "outline": 2, "backdrop": "blue"},
+    {"type": "circle", "x": 50.5, "y": 40, "radius": 60, "outline": {"width": 6, "color": "red"}},
+])
+def test_tight_canvas_matches_square_canvas(shape_data, monkeypatch):
+    from PIL import Image
+    from frame_stamp import FrameStamp
+    from frame_stamp.shape import base_shape
+    temp_image = Image.new("RGB", (400, 300), (20, 40, 60))
+    results = []
+    sizes = []
+    for strategy in ("square", "tight"):
+        monkeypatch.setattr(base_shape, "CANVAS_STRATEGY", strategy)
+        stamp = FrameStamp(temp_image, {"shapes": [dict(shape_data)]}, {})
+        sizes.append(next(stamp._shapes[0].render(temp_image.size))[0].size)
+        results.append(stamp.render())
+    assert results[0].tobytes() == results[1].tobytes()
+    assert sizes[1][0] * sizes[1][1] < sizes[0][0] * sizes[0][1]
+
+
+@pytest.mark.parametrize("shape_data", [
+    {"type": "rect", "x": 10.5, "y": 20, "width": 300, "height": 20, "rotate": 17, "border": {"width": 4, "color": "red"}},
+    {"type": "label", "x": 40, "y": 30.3, "text": "Rotated label", "font_size": 20, "rotate": -33.3, "outline": 2},
+    {"type": "row", "x": 20, "y": 50, "width": 200, "height": 40, "rotate": 45, "shapes": [
+        {"type": "rect", "color": "red"}, {"type": "label", "text": "cell", "rotate": 10}]},
+])
+def test_rotated_shapes_match_square_canvas(shape_data, monkeypatch):
+    from PIL import Image
+    from frame_stamp import FrameStamp
+    from frame_stamp.shape import base_shape
+    temp_image = Image.new("RGB", (400, 300), (20, 40, 60))
+    results = []
+    for strategy in ("square", "tight"):
+        monkeypatch.setattr(base_shape, "CANVAS_STRATEGY", strategy)
+        results.append(FrameStamp(temp_image, {"shapes": [dict(shape_data)]}, {}).render())
+    assert results[0].tobytes() == results[1].tobytes()
+
+
+@pytest.mark.parametrize("size", [(999, 858), (1920, 1080)])
+def test_example_templates_match_square_canvas(size, monkeypatch):
+    from pathlib import Path
+    import json
+    from PIL import Image
+    from frame_stamp import FrameStamp
+    from frame_stamp.shape import base_shape
+    from frame_stamp.utils import jsonc
+    examples = sorted(Path(__file__).parent.parent.joinpath("examples").glob("*.json"))
+    assert examples
+    rotated = 0
+    for path in examples:
+        with path.open(encoding="utf-8") as f:
+            templates = jsonc.load(f)["templates"]
+        for template in templates:
+            results = []
+            for strategy in ("square", "tight"):
+                monkeypatch.setattr(base_shape, "CANVAS_STRATEGY", strategy)
+                try:
+                    results.append(FrameStamp(Image.new("RGB", size, "white"), template, {"frame": 3, "timeline_value": 17}).render())
+                except OSError:
+                    # svg images need cairo
+                    break
+            if len(results) == 2:
+                assert results[0].tobytes() == results[1].tobytes(), (path.name, template.get("name"))
+                if '"rotate"' in json.dumps(template):
+                    rotated += 1
+    # rotation-offset, tiles
+    assert rotated
@@ -0,0 +1,65 @@
+from PIL import Image
+
+from frame_stamp import FrameStamp
+from frame_stamp.utils import READS_PARENT, cache_stats, enable_cache_stats, reset_cache_stats
+
+TEMPLATE = {"shapes": [
+    {"type": "rect", "id": "back", "x": 10, "y": 10, "width": 200, "height": 40},
+    {"type": "label", "id": "shot", "parent": "back", "x": 5, "y": 5, "text": "shot $shot"},
+    {"type": "label", "id": "frame", "x": "=shot.right+10", "y": 60, "text": "frame $frame"},
+]}
+
+
+def make_stamp():
+    return FrameStamp(Image.new("RGB", (400, 300)), TEMPLATE, {"frame": 1, "shot": "sh010"})
+
+
+def test_reads_of_cached_values():
+    stamp = make_stamp()
+    stamp.render()
+    label = stamp.scope["frame"]
+    reads = label.__cache_reads__
+    assert "frame" in reads["LabelShape.text"] and "shot" not in reads["LabelShape.text"]
+    # reads of other cached values are inherited
+    assert "shot" in reads["BaseShape.x"] and "frame" not in reads["BaseShape.x"]
+    assert READS_PARENT in stamp.scope["shot"].__cache_reads__["BaseShape.x"]
+
+
+def test_targeted_invalidation():
+    stamp = make_stamp()
+    stamp.render()
+    label = stamp.scope["frame"]
+    x = label.__cache__["BaseShape.x"]
+    assert label.invalidate_cache({"frame"})
+    assert "LabelShape.text" not in label.__cache__
+    assert label.__cache__["BaseShape.x"] == x
+    assert not label.invalidate_cache({"unknown"})
+    assert label.invalidate_cache({"shot"})
+    assert "BaseShape.x" not in label.__cache__
+
+
+def test_set_parent_drops_parent_values():
+    stamp = make_stamp()
+    stamp.render()
+    shot, back = stamp.scope["shot"], stamp.scope["back"]
+    text = shot.__cache__["LabelShape.text"]
+    shot.set_parent(stamp.scope["frame"])
+    assert shot.__cache__["LabelShape.text"] == text
+    assert "BaseShape.x" not in shot.__cache__
+    assert shot.x == stamp.scope["frame"].x + 5 != back.x + 5
+
+
+def test_cache_stats():
+    reset_cache_stats()
+    enable_cache_stats()
+    try:
+        stamp = make_stamp()
+        stamp.render()
+        stamp.scope["frame"].text
+    finally:
+        enable_cache_stats(False)
+    stats = cache_stats()
+    assert stats["LabelShape.text"]["misses"] == 2
+    assert stats["LabelShape.text"]["hits"] >= 1
+    reset_cache_stats()
+    assert cache_stats() == {}
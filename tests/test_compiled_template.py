@@ -0,0 +1,124 @@
+import copy
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from frame_stamp import CompiledTemplate, FrameStamp
+from frame_stamp.utils.exceptions import PresetError
+
+
+@pytest.fixture
+def label_template():
+    return {
+        "variables": {"frame": 0},
+        "shapes": [
+            {"type": "label", "id": "counter", "text": "frame $frame"},
+            {
+                "type": "row", "id": "row", "width": 200, "height": 20,
+                "shapes": [
+                    {"type": "label", "id": "cell", "text": "A"},
+                    {"type": "label", "text": "B", "skip": "=$frame>1"},
+                    {"type": "label", "id": "last", "text": "C"},
+                ]
+            },
+        ]
+    }
+
+
+def test_shapes_reused_between_frames(temp_image, label_template):
+    compiled = CompiledTemplate(label_template)
+    stamp1 = compiled.bind(temp_image, {"frame": 1})
+    shape1 = stamp1.scope["counter"]
+    assert shape1.text == "frame 1"
+    stamp2 = compiled.bind(temp_image, {"frame": 2})
+    assert stamp2.scope["counter"] is shape1
+    assert shape1.text == "frame 2"
+
+
+def test_previous_bind_not_rendered(temp_image, label_template):
+    compiled = CompiledTemplate(label_template)
+    stamp1 = compiled.bind(temp_image, {"frame": 1})
+    stamp2 = compiled.bind(temp_image, {"frame": 2})
+    with pytest.raises(RuntimeError):
+        stamp1.render()
+    with pytest.raises(RuntimeError):
+        stamp1.rebind(variables={"frame": 3})
+    assert stamp2.scope["counter"].text == "frame 2"
+    stamp2.render()
+
+
+def test_grid_layout_updated_on_bind(temp_image, label_template):
+    compiled = CompiledTemplate(label_template)
+    stamp = compiled.bind(temp_image, {"frame": 1})
+    assert len(stamp.scope["row"].get_cell_shapes()) == 3
+    stamp = compiled.bind(temp_image, {"frame": 2})
+    assert len(stamp.scope["row"].get_cell_shapes()) == 2
+    assert stamp.scope["last"]._local_context["cell_index"] == 1
+    stamp = compiled.bind(temp_image, {"frame": 1})
+    assert stamp.scope["last"]._local_context["cell_index"] == 2
+
+
+def test_render_matches_template_dict(temp_image, label_template):
+    compiled = CompiledTemplate(label_template)
+    compiled.bind(temp_image, {"frame": 1}).render()
+    for frame in (2, 3):
+        expected = FrameStamp(temp_image, label_template, {"frame": frame}).render()
+        result = FrameStamp(temp_image, compiled, {"frame": frame}).render()
+        assert result.tobytes() == expected.tobytes()
+
+
+def test_source_size_change(label_template):
+    compiled = CompiledTemplate(label_template)
+    stamp = compiled.bind(Image.new('RGB', (400, 300)), {})
+    assert stamp.scope["counter"].parent.width == 400
+    stamp = compiled.bind(Image.new('RGB', (800, 600)), {})
+    assert stamp.scope["counter"].parent.width == 800
+
+
+def test_template_not_modified(temp_image, label_template):
+    compiled = CompiledTemplate(label_template)
+    compiled.bind(temp_image, {}).render()
+    assert "rows" not in label_template["shapes"][1]
+    assert "parent" not in label_template["shapes"][1]["shapes"][0]
+
+
+def test_unknown_shape_type_raises():
+    with pytest.raises(TypeError):
+        CompiledTemplate({"shapes": [{"type": "row", "shapes": [{"type": "unknown"}]}]})
+    with pytest.raises(PresetError):
+        CompiledTemplate({"shapes": [{"text": "no type"}]})
+
+
+def test_pickle_drops_shapes(temp_image, label_template):
+    compiled = CompiledTemplate(label_template)
+    compiled.bind(temp_image, {})
+    restored = pickle.loads(pickle.dumps(compiled))
+    assert restored.state is None
+    assert restored.bind(temp_image, {"frame": 5}).scope["counter"].text == "frame 5"
+
+
+@pytest.mark.parametrize("static_layers", [False, True])
+def test_concurrent_render_in_threads(temp_image, label_template, static_layers):
+    template = copy.deepcopy(label_template)
+    template["shapes"].append({
+        "type": "tile", "tile_width": 100, "tile_height": 80, "grid_rotate": 15,
+        "shapes": [{"type": "label", "text": "$frame"}, {"type": "rect", "width": 10, "height": 10}],
+    })
+    template["shapes"].append({"type": "column", "x": 250, "width": 100, "height": 60,
+                               "shapes": [{"type": "label", "text": "=$frame*2"}, {"type": "label", "text": "X"}]})
+    frames = list(range(4)) * 3
+    # static layers keep RGB of sequential paste, alpha of the opaque source is not reduced by overlaps
+    expected = {frame: FrameStamp(temp_image, template, {"frame": frame}).render().convert("RGB").tobytes()
+                for frame in range(4)}
+    compiled = CompiledTemplate(template, static_layers=static_layers)
+    compiled_template = copy.deepcopy(compiled.template)
+
+    def render(frame):
+        return frame, compiled.bind(temp_image, {"frame": frame}).render().convert("RGB").tobytes()
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(render, frames))
+    assert all(result == expected[frame] for frame, result in results)
+    assert compiled.template == compiled_template
@@ -0,0 +1,117 @@
+import json
+import threading
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from frame_stamp import FrameStamp
+from frame_stamp.daemon import RenderClient, RenderError, RenderServer, main
+from frame_stamp.utils.templates import template_from_data
+
+EXAMPLE_FILE = Path(__file__).parent.parent / "examples" / "burn-in1.json"
+TEMPLATE = {
+    "shapes": [
+        {"type": "rect", "x": 5, "y": 5, "width": 40, "height": 10, "color": [255, 0, 0, 200]},
+        {"type": "label", "text": "frame $frame", "x": 5, "y": 20},
+    ]
+}
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = RenderServer(str(tmp_path / "fs.sock"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join(10)
+    assert not (tmp_path / "fs.sock").exists()
+
+
+@pytest.fixture
+def client(server):
+    return RenderClient(server.address, timeout=30)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.png"
+    Image.new("RGB", (120, 60), (40, 50, 100)).save(path)
+    return path
+
+
+def test_render_frame(client, source, tmp_path):
+    status = client.render(TEMPLATE, source, tmp_path / "out.png", {"frame": 3})
+    assert status["status"] == "done" and status["duration"] > 0
+    expected = FrameStamp(Image.open(source), TEMPLATE, {"frame": 3}).render()
+    assert Image.open(tmp_path / "out.png").convert("RGB").tobytes() == expected.convert("RGB").tobytes()
+    # compiled template is reused
+    client.render(TEMPLATE, source, tmp_path / "out2.png", {"frame": 4})
+    assert client.stats()["templates"] == {"hits": 1, "misses": 1, "size": 1, "bytes": 0}
+
+
+def test_shapes_kept_between_connections(server, client, source, tmp_path):
+    # each render is a new connection handled by a new thread
+    client.render(TEMPLATE, source, tmp_path / "out.png", {"frame": 1})
+    worker = server.get_template(TEMPLATE)
+    shapes = worker.run(lambda compiled: compiled.state[0])
+    client.render(TEMPLATE, source, tmp_path / "out.png", {"frame": 2})
+    assert worker.run(lambda compiled: compiled.state[0]) is shapes
+    expected = FrameStamp(Image.open(source), TEMPLATE, {"frame": 2}).render()
+    assert Image.open(tmp_path / "out.png").convert("RGB").tobytes() == expected.convert("RGB").tobytes()
+
+
+def test_template_file_reloaded(client, source, tmp_path):
+    template_file = tmp_path / "template.json"
+    template_file.write_text(json.dumps(TEMPLATE))
+    client.render(template_file, source, tmp_path / "out.png", {"frame": 1})
+    template_file.write_text(json.dumps({"shapes": []}))
+    client.render(template_file, source, tmp_path / "out.png", {"frame": 1})
+    assert Image.open(tmp_path / "out.png").convert("RGB").tobytes() == Image.open(source).tobytes()
+
+
+def test_render_sequence(client, tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    for i in range(5):
+        Image.new("RGB", (120, 60), (i * 20, 50, 100)).save(src / f"frame.{i:04d}.png")
+    statuses = list(client.process_sequence(TEMPLATE, src, tmp_path / "out", multithread=False))
+    assert [s["index"] for s in statuses[:-1]] == list(range(5))
+    assert statuses[-1]["status"] == "done" and statuses[-1]["failed"] == 0
+    assert len(list((tmp_path / "out").glob("*.png"))) == 5
+
+
+def test_errors(client, source, tmp_path):
+    with pytest.raises(RenderError, match="not_exists"):
+        client.render(TEMPLATE, tmp_path / "not_exists.png", tmp_path / "out.png")
+    with pytest.raises(RenderError, match="Unknown options"):
+        list(client.process_sequence(TEMPLATE, tmp_path, tmp_path / "out", on_result=None))
+    # server is alive after errors
+    assert client.is_running()
+
+
+def test_cli_render(client, source, tmp_path):
+    template_file = tmp_path / "template.json"
+    template_file.write_text(json.dumps(TEMPLATE))
+    main(["render", str(template_file), str(source), str(tmp_path / "local.png"), "-v", "frame=7"])
+    main(["--address", client.address, "render", str(template_file), str(source), str(tmp_path / "daemon.png"),
+          "-v", "frame=7", "--daemon"])
+    assert Image.open(tmp_path / "local.png").tobytes() == Image.open(tmp_path / "daemon.png").tobytes()
+
+
+def test_template_from_data():
+    data = {"templates": [{"name": "a", "shapes": []}, {"name": "b", "shapes": []}]}
+    assert template_from_data(data)["name"] == "a"
+    assert template_from_data(data, "b")["name"] == "b"
+    assert template_from_data(TEMPLATE) is TEMPLATE
+    with pytest.raises(ValueError):
+        template_from_data(data, "c")
+
+
+def test_example_template_file(client, source, tmp_path):
+    main(["render", str(EXAMPLE_FILE), str(source), str(tmp_path / "local.png")])
+    main(["--address", client.address, "render", str(EXAMPLE_FILE), str(source), str(tmp_path / "daemon.png"),
+          "--daemon", "--name", "new"])
+    assert Image.open(tmp_path / "local.png").tobytes() == Image.open(tmp_path / "daemon.png").tobytes()
+    assert Image.open(tmp_path / "local.png").convert("RGB").tobytes() != Image.open(source).tobytes()
@@ -0,0 +1,74 @@
+import pytest
+
+from frame_stamp.shape import RectShape
+from frame_stamp.utils import expressions
+
+
+# COMPILATION
+
+
+@pytest.mark.parametrize("value, node_type", [
+    ("12", expressions.Constant),
+    ("1.5", expressions.Constant),
+    ("2u", expressions.UnitValue),
+    ("2p", expressions.PointValue),
+    ("50%", expressions.Percent),
+    ("other.x", expressions.ScopeReference),
+    ("$value", expressions.VariableReference),
+    ("=1+2", expressions.Expression),
+    ("`=1+2`", expressions.Expression),
+    ("center", expressions.Text),
+])
+def test_compile_node_type(value, node_type):
+    assert type(expressions.compile_value(value)) is node_type
+
+
+def test_compiled_value_is_cached():
+    assert expressions.compile_value("=$a*2") is expressions.compile_value("=$a*2")
+
+
+def test_expression_skips_constant_operands():
+    node = expressions.compile_value("=parent.width/2+$offset")
+    assert [op for op, _ in node.operands] == ["parent.width", "$offset"]
+
+
+# EVALUATION
+
+
+def test_unit_and_point_values(rect_shape):
+    assert rect_shape._eval_parameter_convert('x', '2u') == 2 * rect_shape.unit
+    assert rect_shape._eval_parameter_convert('x', '-1.5p') == -1.5 * rect_shape.point
+
+
+def test_percent_of_default(rect_shape):
+    assert rect_shape._eval_parameter_convert('w', '50%') == 50
+    assert rect_shape._eval_parameter_convert('unknown', '50%') == '50%'
+
+
+def test_variable_reference(context):
+    context["variables"].update({"size": "=$base*2", "base": 5})
+    shape = RectShape({"width": "$size"}, context)
+    assert shape.width == 10
+
+
+def test_missing_variable_returns_source(context):
+    shape = RectShape({}, context)
+    assert shape._eval_parameter_convert('x', '$no_such_variable') == '$no_such_variable'
+
+
+def test_scope_reference(framestamp):
+    shape = RectShape({"x": "rect1.width", "y": "=rect1.y+self.x"}, framestamp._shared_context)
+    assert shape.x == 100
+    assert shape.y == 120
+
+
+def test_expression_with_string_variable(context):
+    context["variables"]["name"] = "some_name"
+    shape = RectShape({"enabled": "='$name'=='some_name'"}, context)
+    assert shape.is_enabled() is True
+
+
+def test_expression_error_raised(context):
+    shape = RectShape({"x": "=1+"}, context)
+    with pytest.raises(SyntaxError):
+        _ = shape.x
@@ -1,4 +1,10 @@
+import random
+
+from PIL import Image, ImageChops
+
+from frame_stamp import CompiledTemplate, FrameStamp
 from frame_stamp.shape.base_shape import BaseShape
+from frame_stamp.utils.image_tools import paste_trimmed
 
 
 def test_framestamp_creates_shapes(framestamp):
@@ -23,3 +29,117 @@ def test_defaults_accessible(rect_template, framestamp):
 def test_source_image_loaded(framestamp):
     img = framestamp.source
     assert img.size == (400, 300)
+
+
+def overlapping_template():
+    return {"shapes": [
+        {"type": "rect", "x": 10, "y": 10, "width": 200, "height": 100, "color": [255, 0, 0, 120]},
+        {"type": "label", "x": 20, "y": 20, "text": "Overlay", "font_size": 40, "text_color": [0, 255, 0, 200]},
+        {"type": "rect", "x": 50, "y": 40, "width": 300, "height": 50, "color": [0, 0, 255, 60], "rotate": 10},
+    ]}
+
+
+def test_trimmed_paste_matches_full_paste():
+    overlay = Image.new("RGBA", (100, 80), (0, 0, 0, 0))
+    overlay.paste((255, 0, 0, 100), (30, 20, 40, 35))
+    expected = Image.new("RGBA", (120, 90), (20, 40, 60, 255))
+    expected.paste(overlay, (-5, 30), overlay)
+    result = Image.new("RGBA", (120, 90), (20, 40, 60, 255))
+    paste_trimmed(result, overlay, (-5, 30))
+    assert result.tobytes() == expected.tobytes()
+
+    stamp = FrameStamp(Image.new("RGB", (400, 300), (20, 40, 60)), overlapping_template(), {})
+    expected = Image.new("RGBA", (400, 300), (20, 40, 60, 255))
+    stamp._render_shapes((400, 300), lambda overlay, pos: expected.paste(overlay, pos, overlay))
+    assert stamp.render().tobytes() == expected.tobytes()
+
+
+def test_single_layer_render():
+    source = Image.new("RGB", (400, 300), (20, 40, 60))
+    expected = FrameStamp(source, overlapping_template(), {}).render().convert("RGB")
+    result = FrameStamp(source, overlapping_template(), {}).render(single_layer=True).convert("RGB")
+    diff = ImageChops.difference(result, expected)
+    assert max(band[1] for band in diff.getextrema()) <= 2
+    result = CompiledTemplate(overlapping_template(), single_layer=True).bind(source, {}).render()
+    diff = ImageChops.difference(result.convert("RGB"), expected)
+    assert max(band[1] for band in diff.getextrema()) <= 2
+
+
+def test_parallel_shapes_render():
+    template = overlapping_template()
+    template["shapes"][0]["id"] = "back"
+    template["shapes"] += [
+        {"type": "label", "x": "=back.right", "y": "=back.bottom", "text": "after $frame", "rotate": 30},
+        {"type": "row", "x": 10, "y": 200, "width": 300, "height": 40, "border": {"width": 1},
+         "shapes": [{"type": "label", "text": f"cell {i}"} for i in range(4)]},
+        {"type": "tile", "tile_width": 80, "tile_height": 60, "grid_rotate": 20,
+         "shapes": [{"type": "label", "text": "tile", "text_color": [255, 255, 255, 80]}]},
+        {"type": "rect", "x": "=randint(0, 300)", "y": "=randint(0, 200)", "width": 20, "height": 20},
+    ]
+    source = Image.new("RGB", (400, 300), (20, 40, 60))
+    random.seed(3)
+    expected = FrameStamp(source, template, {"frame": 1}).render()
+    random.seed(3)
+    result = FrameStamp(source, template, {"frame": 1}).render(shape_workers=4)
+    assert result.tobytes() == expected.tobytes()
+    random.seed(3)
+    result = CompiledTemplate(template, shape_workers=4).bind(source, {"frame": 1}).render()
+    assert result.tobytes() == expected.tobytes()
+
+
+def rebind_template():
+    return {"shapes": [
+        {"type": "rect", "id": "back", "x": 10, "y": 10, "width": 200, "height": 40, "color": [0, 0, 0, 120]},
+        {"type": "label", "id": "shot", "parent": "back", "x": 5, "y": 5, "text": "shot $shot"},
+        {"type": "label", "x": "=shot.right+10", "y": 60, "text": "frame $frame"},
+        {"type": "row", "x": 10, "y": 200, "width": 300, "height": 40,
+         "shapes": [{"type": "label", "text": "static"}, {"type": "label", "text": "$frame"}]},
+    ]}
+
+
+def test_rebind_matches_new_stamp():
+    sources = [Image.new("RGB", (400, 300), (20, 40, 60)), Image.new("RGB", (400, 300), (90, 10, 10)),
+               Image.new("RGB", (320, 240), (20, 40, 60))]
+    stamp = FrameStamp(sources[0], rebind_template(), {"frame": 0, "shot": "sh010"})
+    frames = [(sources[0], {"frame": 1, "shot": "sh010"}), (sources[1], {"frame": 1, "shot": "sh020_long_name"}),
+              (None, {"frame": 2, "shot": "sh020_long_name"}), (sources[2], {"frame": 3, "shot": "sh030"})]
+    for source, variables in frames:
+        stamp.rebind(source, variables)
+        expected = FrameStamp(source or sources[1], rebind_template(), variables).render()
+        assert stamp.render().tobytes() == expected.tobytes()
+
+
+def test_rebind_scope_reference_into_cell():
+    # label placed by the cell of the column, cell moves when the row above is skipped
+    template = {"shapes": [
+        {"type": "column", "x": 10, "y": 10, "width": 200, "height": 200, "shapes": [
+            {"type": "label", "text": "top"},
+            {"type": "row", "skip": "=$frame%2==0", "shapes": [{"type": "label", "text": "odd"}]},
+            {"type": "label", "id": "cl", "text": "$shot"}]},
+        {"type": "label", "text": "ref", "x": "=cl.right+3", "y": "=cl.y"},
+    ]}
+    source = Image.new("RGB", (300, 250))
+    stamp = FrameStamp(source, template, {"frame": 0, "shot": "sh010"})
+    stamp.render()
+    for frame in range(1, 4):
+        stamp.rebind(source, {"frame": frame, "shot": "sh010"})
+        expected = FrameStamp(source, template, {"frame": frame, "shot": "sh010"}).render()
+        assert stamp.render().tobytes() == expected.tobytes()
+
+
+def test_rebind_keeps_unchanged_shapes():
+    source = Image.new("RGB", (400, 300), (20, 40, 60))
+    stamp = FrameStamp(source, rebind_template(), {"frame": 0, "shot": "sh010"})
+    stamp.render()
+    back, shot = stamp.scope["back"], stamp.scope["shot"]
+    frame_label = list(stamp.get_shapes())[2]
+    cached = dict(shot.__cache__)
+    stamp.rebind(variables={"frame": 1, "shot": "sh010"})
+    # label of the same shot keeps computed values, labels of the frame are reset
+    assert "LabelShape.text" in shot.__cache__ and shot.__cache__["LabelShape.text"] == cached["LabelShape.text"]
+    assert "LabelShape.text" not in frame_label.__cache__
+    assert back.__cache__
+    stamp.rebind(variables={"frame": 1, "shot": "sh020"})
+    assert "LabelShape.text" not in shot.__cache__
+    # shape placed relative to the changed label is reset too
+    assert not frame_label.__cache__ or "BaseShape.x" not in frame_label.__cache__
@@ -0,0 +1,70 @@
+import math
+
+import pytest
+
+from frame_stamp.utils import image_tools
+from frame_stamp.utils.cache import LRUCache
+
+
+def test_linear_gradient_values():
+    img = image_tools.linear_gradient((101, 3), (0, 0), (100, 0), (0, 0, 0, 255), (200, 100, 50, 0))
+    assert img.size == (101, 3)
+    assert img.getpixel((0, 1)) == (0, 0, 0, 255)
+    assert img.getpixel((50, 2)) == (100, 50, 25, 127)
+    assert img.getpixel((100, 0)) == (200, 100, 50, 0)
+
+
+def test_linear_gradient_same_points():
+    img = image_tools.linear_gradient((10, 10), (5, 5), (5, 5), (255, 0, 0, 255), (0, 0, 0, 255))
+    assert img.getbbox() is None
+
+
+def test_radial_gradient_values():
+    img = image_tools.radial_gradient((30, 30), (10, 10), 10, (0, 0, 0, 255), (100, 200, 250, 50))
+    assert img.getpixel((10, 10)) == (0, 0, 0, 255)
+    assert img.getpixel((15, 10)) == (50, 100, 125, 152)
+    assert img.getpixel((29, 29)) == (100, 200, 250, 50)
+    dist = math.hypot(3, 4) / 10
+    assert img.getpixel((13, 14)) == tuple(int(c * dist) for c in (100, 200, 250)) + (int(255 - 205 * dist),)
+
+
+def test_radial_gradient_invalid_radius():
+    with pytest.raises(ValueError):
+        image_tools.radial_gradient((10, 10), (5, 5), 0, (0, 0, 0, 0), (0, 0, 0, 0))
+
+
+def test_gradient_cache():
+    params = dict(point1=[0, 0], point2=[0, 50], color1=[0, 0, 0, 255], color2=[255, 255, 255, 255])
+    img1 = image_tools.get_gradient('linear', (20, 50), **params)
+    img2 = image_tools.get_gradient('linear', (20, 50), **params)
+    assert img1 is img2
+    assert image_tools.get_gradient('linear', (20, 51), **params) is not img1
+    assert image_tools.get_gradient('radial', (20, 50), center=(5, 5), radius=5,
+                                    color1=(0, 0, 0, 255), color2=(0, 0, 0, 0)) is not img1
+
+
+def test_lru_cache_limits():
+    cache = LRUCache(maxsize=3, max_bytes=10, sizeof=len)
+    cache.set('a', 'aaaa')
+    cache.set('b', 'bbbb')
+    assert cache.get('a') == 'aaaa'
+    cache.set('c', 'cccc')
+    # "b" is least recently used
+    assert 'b' not in cache
+    assert cache.bytes == 8
+    cache.set('big', 'x' * 11)
+    assert 'big' not in cache
+    assert cache.get('b') is None
+    assert cache.info() == dict(hits=1, misses=1, size=2, bytes=8)
+
+
+def test_mix_alpha_channels_in_place():
+    from PIL import Image
+    img1 = Image.new('L', (4, 4), 128)
+    img2 = Image.new('RGBA', (4, 4), (0, 0, 0, 0))
+    img2.putpixel((1, 2), (10, 20, 30, 255))
+    img2.putpixel((2, 2), (10, 20, 30, 100))
+    image_tools.mix_alpha_channels(img1, img2)
+    assert img2.getpixel((1, 2)) == (10, 20, 30, 128)
+    assert img2.getpixel((2, 2)) == (10, 20, 30, int(128 / 255 * (100 / 255) * 255))
+    assert img2.getpixel((0, 0)) == (0, 0, 0, 0)
@@ -242,3 +242,74 @@ def test_draw_shape_smoke(image_context, temp_png):
 
     # no exception = success
     assert True
+
+
+# RESOURCE CACHE
+
+
+def test_resource_images_shared(image_context, temp_png):
+    shape_data = {"source": str(temp_png), "width": 50, "height": 25}
+    img1 = ImageShape(shape_data, image_context).source_resized
+    img2 = ImageShape(dict(shape_data), image_context).source_resized
+    assert img1 is img2
+    assert ImageShape({**shape_data, "width": 60}, image_context).source_resized is not img1
+
+
+def test_resource_cache_reloads_changed_file(image_context, temp_png):
+    import os
+    shape = ImageShape({"source": str(temp_png)}, image_context)
+    assert shape.source.getpixel((0, 0)) == (255, 0, 0, 255)
+    Image.new("RGBA", (100, 50), (0, 255, 0, 255)).save(temp_png)
+    stat = os.stat(temp_png)
+    os.utime(temp_png, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    shape.clear_cache()
+    assert shape.source.getpixel((0, 0)) == (0, 255, 0, 255)
+
+
+def test_mask_read_from_mask_file(image_context, temp_png, temp_mask):
+    shape = ImageShape({"source": str(temp_png), "mask": str(temp_mask)}, image_context)
+    assert shape.source.getpixel((0, 0)) == (255, 0, 0, 128)
+
+
+def _touch_changed(path, color):
+    import os
+    Image.new("RGBA", (100, 50), color).save(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.mark.parametrize("mode", ["bind", "static_layers", "rebind"])
+def test_reused_shapes_reload_changed_file(temp_png, mode):
+    from frame_stamp import CompiledTemplate, FrameStamp
+    template = {"shapes": [{"type": "image", "source": str(temp_png), "x": 0, "y": 0}]}
+    source = Image.new("RGB", (100, 50))
+    if mode == "rebind":
+        stamp = FrameStamp(source, template, {"frame": 0})
+        render = lambda frame: stamp.rebind(variables={"frame": frame}).render()
+    else:
+        compiled = CompiledTemplate(template, static_layers=mode == "static_layers")
+        render = lambda frame: compiled.bind(source, {"frame": frame}).render()
+    assert render(0).getpixel((0, 0)) == (255, 0, 0, 255)
+    assert render(1).getpixel((0, 0)) == (255, 0, 0, 255)
+    _touch_changed(temp_png, (0, 255, 0, 255))
+    assert render(2).getpixel((0, 0)) == (0, 255, 0, 255)
+
+
+def test_mask_expression(image_context, temp_png, temp_mask, tmp_path):
+    other_mask = tmp_path / "other_mask.png"
+    Image.new("L", (100, 50), 64).save(other_mask)
+    image_context["variables"] = {"mask_file": str(other_mask)}
+    shape = ImageShape({"source": str(temp_png), "mask": "$mask_file"}, image_context)
+    assert shape.source_key[1][0] == str(other_mask.resolve())
+    assert shape.source.getpixel((0, 0)) == (255, 0, 0, 64)
+    # the same image with other mask is another cached image
+    masked = ImageShape({"source": str(temp_png), "mask": str(temp_mask)}, image_context).source
+    assert masked.getpixel((0, 0)) == (255, 0, 0, 128)
+
+
+def test_image_keys_without_cache(image_context, temp_png, monkeypatch):
+    from frame_stamp import utils
+    monkeypatch.setattr(utils, "USE_CACHE", False)
+    shape = ImageShape({"source": str(temp_png)}, image_context)
+    assert shape.source.getpixel((0, 0)) == (255, 0, 0, 255)
+    assert not getattr(shape, "__cache__", None)
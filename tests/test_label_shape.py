@@ -218,4 +218,39 @@ def test_label_expression_order(context):
         "text": "`=self.x*2`",
     }
     shape = LabelShape(shape_data, context)
-    assert shape.text == "20"
\ No newline at end of file
+    assert shape.text == "20"
+
+
+# FONT CACHE
+
+
+def test_font_cached_between_shapes(context):
+    from frame_stamp.shape import label
+    label.clear_font_cache()
+    font1 = LabelShape({"text": "a", "font_size": 21}, context).font
+    font2 = LabelShape({"text": "b", "font_size": 21}, context).font
+    font3 = LabelShape({"text": "c", "font_size": 22}, context).font
+    assert font1 is font2
+    assert font1 is not font3
+    assert font1.path == font3.path
+    info = label.font_cache_info()
+    assert info["fonts"]["hits"] == 1
+    assert info["fonts"]["misses"] == 2
+    assert info["names"]["misses"] == 1
+
+
+def test_rendered_label_cached(context):
+    from frame_stamp.shape import label
+    label.set_label_cache_budget(label.LABEL_CACHE_BYTES)
+    size = context["source_image"].size
+    canvas1, _ = next(LabelShape({"text": "cached", "outline": 2}, context).render(size))
+    canvas2, _ = next(LabelShape({"text": "cached", "outline": 2}, context).render(size))
+    canvas3, _ = next(LabelShape({"text": "other", "outline": 2}, context).render(size))
+    assert canvas1 is canvas2
+    assert canvas1 is not canvas3
+    assert label.label_cache_info()["hits"] == 1
+    # image larger than budget is not stored
+    label.set_label_cache_budget(100)
+    next(LabelShape({"text": "cached"}, context).render(size))
+    assert label.label_cache_info()["size"] == 0
+    label.set_label_cache_budget(label.LABEL_CACHE_BYTES)
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from frame_stamp import CompiledTemplate, FrameStamp, OverlayManifest, render_overlays
+
+SIZE = (160, 90)
+STATIC = {
+    "shapes": [
+        {"type": "rect", "x": 4, "y": 4, "width": 40, "height": 10, "color": [255, 0, 0, 200]},
+        {"type": "rect", "x": 20, "y": 8, "width": 40, "height": 10, "color": [0, 0, 255, 128]},
+        {"type": "label", "text": "shot $shot", "x": 4, "y": 30, "color": [255, 255, 255, 255]},
+    ]
+}
+DYNAMIC = {"shapes": STATIC["shapes"] + [{"type": "label", "text": "frame $frame", "x": 4, "y": 60}]}
+
+
+def test_overlay_render():
+    stamp = FrameStamp(SIZE, STATIC, {"shot": "sh010"})
+    assert stamp.is_overlay
+    overlay = stamp.render()
+    assert overlay.mode == "RGBA" and overlay.size == SIZE
+    # straight alpha of the shape, "over" where shapes overlap
+    assert overlay.getpixel((5, 5)) == (255, 0, 0, 200)
+    assert overlay.getpixel((30, 10))[3] == 200 + round(55 * 128 / 255)
+    assert overlay.getpixel((150, 80)) == (0, 0, 0, 0)
+
+
+def test_overlay_matches_burned_frame():
+    plate = Image.new("RGB", SIZE, (30, 90, 60))
+    overlay = FrameStamp(SIZE, STATIC, {"shot": "sh010"}).render()
+    burned = FrameStamp(plate, STATIC, {"shot": "sh010"}).render().convert("RGB")
+    composited = Image.alpha_composite(plate.convert("RGBA"), overlay).convert("RGB")
+    diff = np.abs(np.asarray(composited, dtype=int) - np.asarray(burned, dtype=int))
+    assert diff.max() <= 2
+
+
+@pytest.mark.parametrize("static_layers", [False, True])
+def test_compiled_overlay(static_layers):
+    compiled = CompiledTemplate(DYNAMIC, static_layers=static_layers)
+    expected = FrameStamp(SIZE, DYNAMIC, {"shot": "sh010", "frame": 2}).render()
+    for frame in range(3):
+        overlay = compiled.bind(SIZE, {"shot": "sh010", "frame": frame}).render()
+    assert overlay.tobytes() == expected.tobytes()
+    # burned frame after overlay with the same shapes
+    stamp = compiled.bind(Image.new("RGB", SIZE, "white"), {"shot": "sh010", "frame": 2})
+    assert not stamp.is_overlay
+    assert stamp.render().getpixel((150, 80)) == (255, 255, 255, 255)
+
+
+def test_overlay_source_image_and_save(tmp_path):
+    template = {"shapes": [{"type": "image", "source": "$source", "x": 0, "y": 0, "width": 40, "height": 20},
+                           {"type": "rect", "x": 4, "y": 4, "width": 10, "height": 10, "color": [0, 255, 0, 100]}]}
+    FrameStamp(SIZE, template, {}).render(save_path=tmp_path / "overlay.png")
+    saved = Image.open(tmp_path / "overlay.png")
+    assert saved.mode == "RGBA" and saved.getpixel((5, 5)) == (0, 255, 0, 100)
+
+
+def test_invalid_canvas_size():
+    with pytest.raises(ValueError):
+        FrameStamp((0, 10), STATIC, {"shot": "sh010"})
+
+
+def test_static_sequence_overlay(tmp_path):
+    manifest = render_overlays(STATIC, SIZE, tmp_path, range(1001, 1011), {"shot": "sh010"})
+    assert manifest.is_static
+    assert manifest.files == ["overlay.1001.png"]
+    assert sorted(p.name for p in tmp_path.glob("*.png")) == ["overlay.1001.png"]
+    assert set(manifest.frames) == set(range(1001, 1011))
+    expected = FrameStamp(SIZE, STATIC, {"shot": "sh010"}).render()
+    assert Image.open(manifest.path(1005)).tobytes() == expected.tobytes()
+
+
+def test_dynamic_sequence_overlay(tmp_path):
+    manifest = render_overlays(DYNAMIC, SIZE, tmp_path, range(1, 6), {"shot": "sh010"})
+    assert len(manifest.files) == 5
+    for frame in range(1, 6):
+        expected = FrameStamp(SIZE, DYNAMIC, {"shot": "sh010", "frame": frame}).render()
+        assert Image.open(manifest.path(frame)).tobytes() == expected.tobytes()
+
+
+def test_changed_frames_only(tmp_path):
+    rendered = []
+    compiled = CompiledTemplate(STATIC, static_layers=True)
+    render = compiled.bind
+
+    def bind(image, variables):
+        stamp = render(image, variables)
+        stamp_render = stamp.render
+        stamp.render = lambda **kwargs: rendered.append(variables["frame"]) or stamp_render(**kwargs)
+        return stamp
+
+    compiled.bind = bind
+    manifest = render_overlays(compiled, SIZE, tmp_path, range(10), {},
+                               context_callback=lambda frame: {"shot": f"sh{frame // 4}"})
+    assert rendered == [0, 4, 8]
+    assert manifest.files == ["overlay.0000.png", "overlay.0004.png", "overlay.0008.png"]
+    assert manifest.frames[7] == "overlay.0004.png"
+    loaded = OverlayManifest.load(tmp_path)
+    assert loaded.size == SIZE and loaded.frames == manifest.frames
+
+
+def test_unchanged_random_overlay(tmp_path):
+    # signature of random shapes is unknown, equal overlays still share the file
+    template = {"shapes": [{"type": "rect", "x": "=int(random()*0)", "y": 0, "width": 10, "height": 10}]}
+    manifest = render_overlays(template, SIZE, tmp_path, range(3), {})
+    assert manifest.files == ["overlay.0000.png"]
@@ -0,0 +1,224 @@
+import pickle
+
+import pytest
+from PIL import Image
+
+from frame_stamp import CompiledTemplate, FrameStamp, pipeline, process_sequence
+from frame_stamp.manifest import RenderManifest
+from frame_stamp.pipeline import FrameJob, SequencePipeline, iter_jobs
+from frame_stamp.transport import SharedFrameRing
+
+TEMPLATE = {
+    "shapes": [
+        {"type": "rect", "x": 5, "y": 5, "width": 40, "height": 10, "color": [255, 0, 0, 200]},
+        {"type": "label", "text": "frame $frame", "x": 5, "y": 20},
+    ]
+}
+
+
+def test_process_sequence_renders_all_frames(sequence_dir, tmp_path):
+    out = tmp_path / "out"
+    results = []
+    failed = process_sequence(sequence_dir, out, TEMPLATE, {}, multithread=False, depth=3, on_result=results.append)
+    assert failed == []
+    assert [r.index for r in results] == list(range(12))
+    assert all(r.ok and r.path.exists() and r.duration > 0 for r in results)
+    source = Image.open(sequence_dir / "frame.0005.png")
+    expected = FrameStamp(source, TEMPLATE, {"frame": 5}).render()
+    assert Image.open(out / "frame.0005.png").tobytes() == expected.tobytes()
+
+
+def test_frame_errors_are_reported(sequence_dir, tmp_path):
+    (sequence_dir / "frame.0003.png").write_bytes(b"not an image")
+    failed = process_sequence(sequence_dir, tmp_path / "out", TEMPLATE, {}, multithread=False)
+    assert [r.index for r in failed] == [3]
+    assert failed[0].path is None and failed[0].error is not None
+    assert len(list((tmp_path / "out").glob("*.png"))) == 11
+
+
+def test_jobs_are_taken_lazily(sequence_dir, tmp_path):
+    calls = []
+
+    def callback(i, file, total, **kwargs):
+        calls.append(i)
+        return {"frame": i * 10}
+
+    files = sorted(sequence_dir.iterdir())
+    pipeline = SequencePipeline(CompiledTemplate(TEMPLATE), multithread=False, depth=2)
+    results = pipeline.run(iter_jobs(files, tmp_path, {}, callback))
+    first = next(results)
+    assert first.index == 0
+    # frames in the pipeline never exceed depth
+    assert len(calls) <= 3
+    results.close()
+    assert len(calls) <= 3
+
+
+def test_unordered_results(sequence_dir, tmp_path):
+    jobs = [FrameJob(i, file, tmp_path / file.name, {"frame": i})
+            for i, file in enumerate(sorted(sequence_dir.iterdir()))]
+    results = list(SequencePipeline(TEMPLATE, multithread=False, ordered=False).run(jobs))
+    assert sorted(r.index for r in results) == list(range(12))
+
+
+def test_multiprocess_pipeline(sequence_dir, tmp_path):
+    failed = process_sequence(sequence_dir, tmp_path / "out", TEMPLATE, {}, max_workers=2, depth=4)
+    assert failed == []
+    assert len(list((tmp_path / "out").glob("*.png"))) == 12
+
+
+def test_default_depth(sequence_dir, monkeypatch):
+    source = sorted(sequence_dir.iterdir())[0]
+    processes = SequencePipeline(TEMPLATE, max_workers=4)
+    assert processes.depth == 8
+    # small frames fill chunks of all workers
+    assert processes.get_chunk_depth(source) == 4 * 2 * processes.chunks.max_size
+    # large frames are not buffered for chunks
+    monkeypatch.setattr(pipeline, "PIPELINE_MEMORY", 120 * 60 * 8 * 5)
+    assert processes.get_chunk_depth(source) == 8
+    monkeypatch.setattr(pipeline, "PIPELINE_MEMORY", 120 * 60 * 8 * 20)
+    assert processes.get_chunk_depth(source) == 20
+    assert SequencePipeline(TEMPLATE, max_workers=4, backend="thread").depth == 8
+    assert SequencePipeline(TEMPLATE, max_workers=4, depth=5).depth == 5
+
+
+def test_callback_gets_max_workers(sequence_dir, tmp_path):
+    calls = []
+
+    def callback(i, file, total, **kwargs):
+        calls.append(kwargs.get("max_workers"))
+        return {}
+
+    process_sequence(sequence_dir, tmp_path / "out", TEMPLATE, {}, multithread=False, max_workers=3,
+                     context_callback=callback, resume=False)
+    assert calls == [3] * 12
+
+
+def test_worker_initializer(sequence_dir):
+    compiled = CompiledTemplate(TEMPLATE)
+    source = sorted(sequence_dir.iterdir())[2]
+    pipeline.init_worker(compiled, {"frame": 0, "shot": "sh010"}, source.as_posix())
+    # warm up created shapes of the template
+    assert pipeline._worker_template.state is not None
+    delta = pipeline.get_context_delta({"frame": 2, "shot": "sh010"}, {"frame": 0, "shot": "sh010"})
+    assert delta == {"frame": 2}
+    [(result, error, _)] = pipeline.render_in_worker([(source.as_posix(), delta)])
+    assert error is None
+    expected = FrameStamp(Image.open(source), TEMPLATE, {"frame": 2, "shot": "sh010"}).render()
+    assert result.tobytes() == expected.tobytes()
+
+
+def test_adaptive_chunks():
+    chunks = pipeline.AdaptiveChunks(target=0.05, max_size=16)
+    assert chunks.next_size(1000, 4) == 1
+    chunks.update([0.01, 0.01])
+    assert chunks.next_size(1000, 4) == 5
+    chunks.update([0.001] * 50)
+    assert chunks.next_size(1000, 4) == 16
+    # tail of the sequence
+    assert chunks.next_size(24, 4) == 3
+    assert chunks.next_size(1, 4) == 1
+    assert pipeline.get_chunk_policy(None).next_size(1000, 4) == 1
+    assert pipeline.get_chunk_policy(4).next_size(1000, 4) == 4
+    with pytest.raises(ValueError):
+        pipeline.get_chunk_policy("unknown")
+
+
+@pytest.mark.parametrize("chunking", ["adaptive", 5])
+def test_chunked_results_are_ordered(sequence_dir, tmp_path, chunking):
+    (sequence_dir / "frame.0007.png").write_bytes(b"not an image")
+    results = []
+    failed = process_sequence(sequence_dir, tmp_path / "out", TEMPLATE, {}, max_workers=2, depth=6,
+                              chunking=chunking, on_result=results.append)
+    assert [r.index for r in results] == list(range(12))
+    assert [r.index for r in failed] == [7]
+
+
+def test_shared_frame_ring():
+    ring = SharedFrameRing(slots=2, slot_bytes=120 * 60 * 4)
+    try:
+        frame = ring.acquire((120, 60))
+        source = Image.new("RGB", (120, 60), (10, 20, 30))
+        frame.write(source)
+        restored = pickle.loads(pickle.dumps(frame))
+        view = restored.array()
+        assert tuple(view[5, 5]) == (10, 20, 30, 255)
+        view[5, 5] = (1, 2, 3, 4)
+        del view
+        image = frame.image()
+        assert image.getpixel((5, 5)) == (1, 2, 3, 4)
+        del image
+        ring.release(frame)
+        # slots are reused
+        names = {ring.acquire((120, 60)).name for _ in range(2)}
+        assert frame.name in names and len(names) == 2
+        assert not ring.fits((121, 60))
+    finally:
+        ring.close()
+
+
+def test_shared_memory_transport(sequence_dir, tmp_path):
+    # one frame of other size is sent by path
+    Image.new("RGB", (130, 60), (0, 50, 100)).save(sequence_dir / "frame.0004.png")
+    failed = process_sequence(sequence_dir, tmp_path / "out", TEMPLATE, {}, max_workers=2, depth=3,
+                              transport="shm")
+    assert failed == []
+    for i in (1, 4):
+        source = Image.open(sequence_dir / f"frame.{i:04d}.png")
+        expected = FrameStamp(source, TEMPLATE, {"frame": i}).render()
+        assert Image.open(tmp_path / "out" / f"frame.{i:04d}.png").tobytes() == expected.tobytes()
+
+
+def test_resume_skips_rendered_frames(sequence_dir, tmp_path):
+    out = tmp_path / "out"
+    results = []
+    process_sequence(sequence_dir, out, TEMPLATE, {}, multithread=False, on_result=results.append)
+    assert not any(r.skipped for r in results) and (out / RenderManifest.FILE_NAME).exists()
+    # frames are changed: source, output removed, variables
+    Image.new("RGB", (120, 60), (255, 0, 0)).save(sequence_dir / "frame.0002.png")
+    (out / "frame.0005.png").unlink()
+
+    def callback(i, file, total, **kwargs):
+        return {"shot": "sh020"} if i == 9 else {}
+
+    results = []
+    process_sequence(sequence_dir, out, TEMPLATE, {}, multithread=False, context_callback=callback,
+                     on_result=results.append)
+    assert [r.index for r in results if not r.skipped] == [2, 5, 9]
+    # template is changed
+    template = {"shapes": TEMPLATE["shapes"][:1]}
+    results = []
+    process_sequence(sequence_dir, out, template, {}, multithread=False, on_result=results.append)
+    assert not any(r.skipped for r in results)
+    results = []
+    process_sequence(sequence_dir, out, template, {}, multithread=False, force=True, on_result=results.append)
+    assert not any(r.skipped for r in results)
+
+
+def test_manifest_written_atomically(tmp_path):
+    manifest = RenderManifest(tmp_path, TEMPLATE, save_interval=0)
+    source = tmp_path / "source.png"
+    Image.new("RGB", (10, 10)).save(source)
+    frame_hash = manifest.frame_hash(source, {"frame": 1})
+    assert frame_hash == manifest.frame_hash(source, {"frame": 1})
+    assert frame_hash != manifest.frame_hash(source, {"frame": 2})
+    manifest.record(tmp_path / "out.png", frame_hash)
+    assert not list(tmp_path.glob("*.tmp"))
+    (tmp_path / "out.png").write_bytes(b"")
+    assert RenderManifest(tmp_path, TEMPLATE).is_current(tmp_path / "out.png", frame_hash)
+    assert not RenderManifest(tmp_path, TEMPLATE, force=True).is_current(tmp_path / "out.png", frame_hash)
+    (tmp_path / RenderManifest.FILE_NAME).write_text("{broken")
+    assert len(RenderManifest(tmp_path, TEMPLATE)) == 0
+
+
+def test_thread_backend(sequence_dir, tmp_path):
+    results = []
+    failed = process_sequence(sequence_dir, tmp_path / "out", TEMPLATE, {}, backend="thread", max_workers=4,
+                              on_result=results.append)
+    assert failed == []
+    assert [r.index for r in results] == list(range(12))
+    for i in (0, 7):
+        expected = FrameStamp(Image.open(sequence_dir / f"frame.{i:04d}.png"), TEMPLATE, {"frame": i}).render()
+        assert Image.open(tmp_path / "out" / f"frame.{i:04d}.png").tobytes() == expected.tobytes()
+    with pytest.raises(ValueError):
+        SequencePipeline(TEMPLATE, backend="gpu")
@@ -0,0 +1,168 @@
+import json
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from frame_stamp import process_sequence
+from frame_stamp.sharding import FileLock, FrameClaims, parse_frame_ranges, shard_indices
+
+TEMPLATE = {
+    "shapes": [
+        {"type": "label", "text": "frame $frame", "x": 5, "y": 5},
+    ]
+}
+
+
+def test_parse_frame_ranges():
+    assert parse_frame_ranges("0-2, 5,9-", 12) == [0, 1, 2, 5, 9, 10, 11]
+    assert parse_frame_ranges("-1,20", 12) == [0, 1]
+    assert parse_frame_ranges([range(3), (6, 7), 11, 30], 12) == [0, 1, 2, 6, 7, 11]
+
+
+@pytest.mark.parametrize("count", [0, 5, 12, 13])
+def test_shards_cover_all_frames(count):
+    shards = [shard_indices(count, i, 4) for i in range(4)]
+    frames = [i for shard in shards for i in shard]
+    assert frames == list(range(count))
+    assert max(map(len, shards)) - min(map(len, shards)) <= 1
+    with pytest.raises(ValueError):
+        shard_indices(count, 4, 4)
+
+
+def test_file_lock(tmp_path):
+    path = tmp_path / "lock"
+    with FileLock(path):
+        assert path.exists()
+        with pytest.raises(TimeoutError):
+            FileLock(path, timeout=0.1).acquire()
+    assert not path.exists()
+    # lock of killed process is broken
+    path.write_text("{}")
+    os.utime(path, (0, 0))
+    with FileLock(path, timeout=0.1, stale_timeout=1):
+        pass
+
+
+def test_frame_claims(tmp_path):
+    claims = FrameClaims(tmp_path)
+    other = FrameClaims(tmp_path)
+    save_path = tmp_path / "frame.png"
+    assert claims.claim(save_path, "a" * 40)
+    assert not other.claim(save_path, "a" * 40)
+    # changed inputs is another claim
+    assert other.claim(save_path, "b" * 40)
+    claims.release(save_path, "a" * 40)
+    assert other.claim(save_path, "a" * 40)
+
+    save_path.write_bytes(b"")
+    other.complete(save_path, "a" * 40)
+    assert not claims.claim(save_path, "a" * 40)
+    # rendered output is removed
+    save_path.unlink()
+    assert claims.claim(save_path, "a" * 40)
+
+
+def test_stale_claims_are_taken_over(tmp_path):
+    claims = FrameClaims(tmp_path, stale_timeout=1)
+    save_path = tmp_path / "frame.png"
+    path = claims.root / f"{save_path.name}.{'a' * 16}"
+    # dead process of the same host
+    path.write_text(json.dumps({"host": claims._host, "pid": 2 ** 22 + 1, "state": "claimed"}))
+    assert claims.claim(save_path, "a" * 40)
+    # other host, expired
+    path.write_text(json.dumps({"host": "other", "pid": 1, "state": "claimed"}))
+    assert not claims.claim(save_path, "a" * 40)
+    os.utime(path, (0, 0))
+    assert claims.claim(save_path, "a" * 40)
+
+
+def test_stale_claim_taken_over_once(tmp_path):
+    save_path = tmp_path / "frame.png"
+    claims = [FrameClaims(tmp_path, stale_timeout=1) for _ in range(8)]
+    path = claims[0].root / f"{save_path.name}.{'a' * 16}"
+    path.write_text(json.dumps({"host": "other", "pid": 1, "state": "claimed"}))
+    os.utime(path, (0, 0))
+    barrier = threading.Barrier(len(claims))
+    taken = []
+
+    def claim(c):
+        barrier.wait()
+        taken.append(c.claim(save_path, "a" * 40))
+
+    threads = [threading.Thread(target=claim, args=(c,)) for c in claims]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert taken.count(True) == 1
+
+
+def test_process_sequence_shard(sequence_dir, tmp_path):
+    out = tmp_path / "out"
+    results = []
+    process_sequence(sequence_dir, out, TEMPLATE, {}, multithread=False, shard_index=1, shard_count=3,
+                     on_result=results.append)
+    assert [r.index for r in results] == [4, 5, 6, 7]
+    results.clear()
+    process_sequence(sequence_dir, out, TEMPLATE, {}, multithread=False, frames="0-1,10-", shard_index=1,
+                     shard_count=2, on_result=results.append)
+    assert [r.index for r in results] == [10, 11]
+    assert sorted(p.name for p in out.glob("*.png")) == [f"frame.{i:04d}.png" for i in (4, 5, 6, 7, 10, 11)]
+
+
+def _render_claimed(src, out, log_path, **options):
+    rendered = []
+    process_sequence(src, out, TEMPLATE, {}, multithread=False, claim=True, **options,
+                     on_result=lambda r: r.skipped or rendered.append(r.index))
+    log_path.write_text(json.dumps(rendered))
+
+
+def test_claimed_frames_rendered_once(sequence_dir, tmp_path):
+    out = tmp_path / "out"
+    ctx = multiprocessing.get_context("spawn")
+    logs = [tmp_path / f"log{i}.json" for i in range(3)]
+    processes = [ctx.Process(target=_render_claimed, args=(sequence_dir, out, log)) for log in logs]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(60)
+        assert p.exitcode == 0
+    rendered = [i for log in logs for i in json.loads(log.read_text())]
+    assert sorted(rendered) == list(range(12))
+    assert len(list(out.glob("*.png"))) == 12
+    # all frames are done, nothing to render
+    results = []
+    process_sequence(sequence_dir, out, TEMPLATE, {}, multithread=False, claim=True, resume=False,
+                     on_result=results.append)
+    assert len(results) == 12 and all(r.skipped for r in results)
+
+
+def test_force_claimed_frames(sequence_dir, tmp_path):
+    out = tmp_path / "out"
+    process_sequence(sequence_dir, out, TEMPLATE, {}, multithread=False, claim=True)
+    results = []
+    process_sequence(sequence_dir, out, TEMPLATE, {}, multithread=False, claim=True, force=True,
+                     on_result=results.append)
+    assert len(results) == 12 and not any(r.skipped for r in results)
+    # done claims of the forced run are kept
+    results.clear()
+    process_sequence(sequence_dir, out, TEMPLATE, {}, multithread=False, claim=True, on_result=results.append)
+    assert all(r.skipped for r in results)
+
+
+def test_force_claimed_frames_rendered_once(sequence_dir, tmp_path):
+    out = tmp_path / "out"
+    process_sequence(sequence_dir, out, TEMPLATE, {}, multithread=False, claim=True)
+    ctx = multiprocessing.get_context("spawn")
+    logs = [tmp_path / f"log{i}.json" for i in range(3)]
+    processes = [ctx.Process(target=_render_claimed, args=(sequence_dir, out, log),
+                             kwargs={"force": True, "run_id": "retake"}) for log in logs]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(60)
+        assert p.exitcode == 0
+    rendered = [i for log in logs for i in json.loads(log.read_text())]
+    assert sorted(rendered) == list(range(12))
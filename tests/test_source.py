@@ -0,0 +1,91 @@
+import pytest
+from PIL import Image
+
+from frame_stamp import CompiledTemplate, FrameStamp
+from frame_stamp.source import SourceFrame, refers_to_source
+
+COVER = {"type": "rect", "x": 0, "y": 0, "width": 100, "height": 60, "color": [255, 0, 0, 255]}
+SOURCE_IMAGE = {"type": "image", "source": "$source", "x": 0, "y": 0, "width": 50, "height": 30}
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.png"
+    Image.new("RGB", (100, 60), (10, 200, 30)).save(path)
+    return path
+
+
+def test_size_from_header(source):
+    frame = SourceFrame(source)
+    assert frame.size == (100, 60)
+    assert not frame.is_decoded
+    assert frame.canvas.mode == "RGBA" and frame.is_decoded
+    assert frame.canvas.getpixel((0, 0)) == (10, 200, 30, 255)
+
+
+def test_layout_without_decode(source):
+    stamp = FrameStamp(source, {"shapes": [{"type": "rect", "id": "r", "x": "=$unt*2", "y": 0,
+                                            "width": "$source_width", "height": 10}]}, {})
+    shape = stamp.scope["r"]
+    assert (shape.variables["unt"], shape.variables["pnt"], shape.width) == (0.6, 0.775, 100)
+    assert stamp.source_size == (100, 60)
+    assert not stamp._shared_context["source_image"].is_decoded
+    stamp.render()
+    assert stamp._shared_context["source_image"].is_decoded
+
+
+def test_shape_source_image_is_pil(source):
+    stamp = FrameStamp(source, {"shapes": [{"type": "rect", "id": "r", "x": 0, "y": 0, "width": 10, "height": 10}]}, {})
+    shape = stamp.scope["r"]
+    assert shape.source_frame.size == (100, 60) and not shape.source_frame.is_decoded
+    img = shape.source_image
+    assert isinstance(img, Image.Image)
+    assert (img.width, img.height, img.mode) == (100, 60, "RGBA")
+    assert img.getpixel((0, 0)) == (10, 200, 30, 255)
+    assert img.crop((0, 0, 5, 5)).size == (5, 5)
+
+
+@pytest.mark.parametrize("keep_raw", [True, False])
+def test_raw_is_source_before_render(source, keep_raw):
+    frame = SourceFrame(source, keep_raw=keep_raw)
+    frame.canvas.paste((255, 0, 0, 255), (0, 0, 100, 60))
+    assert frame.raw.getpixel((0, 0)) == (10, 200, 30, 255)
+    assert frame.raw is not frame.canvas
+
+
+def test_raw_copied_only_for_source_shapes(source):
+    assert SourceFrame(source, keep_raw=False).canvas is not None
+    frame = SourceFrame(source, keep_raw=True)
+    frame.canvas
+    assert frame._raw is not None
+    frame = SourceFrame(source, keep_raw=False)
+    frame.canvas
+    assert frame._raw is None
+
+
+def test_source_alpha(tmp_path):
+    path = tmp_path / "rgba.png"
+    img = Image.new("RGBA", (10, 10), (10, 20, 30, 100))
+    img.save(path)
+    # alpha of source file is dropped, alpha of PIL image is kept
+    assert SourceFrame(path).canvas.getpixel((0, 0)) == (10, 20, 30, 255)
+    assert SourceFrame(img).canvas.getpixel((0, 0)) == (10, 20, 30, 100)
+
+
+def test_refers_to_source():
+    assert refers_to_source({"shapes": [SOURCE_IMAGE]})
+    assert not refers_to_source({"shapes": [{"type": "label", "text": "$source_width"}]})
+    assert CompiledTemplate({"shapes": [SOURCE_IMAGE]}).uses_source
+    assert not CompiledTemplate({"shapes": [COVER]}).uses_source
+
+
+@pytest.mark.parametrize("template, variables", [
+    ({"shapes": [COVER, SOURCE_IMAGE]}, {}),
+    # not found in template, decoded again
+    ({"shapes": [COVER, {**SOURCE_IMAGE, "source": "$src"}]}, {"src": "$source"}),
+])
+def test_source_image_shape(source, template, variables):
+    for stamp in (FrameStamp(source, template, variables), CompiledTemplate(template).bind(source, variables)):
+        img = stamp.render()
+        assert img.getpixel((10, 10)) == (10, 200, 30, 255)
+        assert img.getpixel((80, 50)) == (255, 0, 0, 255)
@@ -0,0 +1,86 @@
+import pytest
+from PIL import Image, ImageChops
+
+from frame_stamp import CompiledTemplate, FrameStamp
+from frame_stamp.utils.image_tools import alpha_composite_clipped
+
+
+@pytest.fixture
+def layers_template():
+    return {
+        "variables": {"frame": 0},
+        "shapes": [
+            {"type": "rect", "id": "back", "x": 10, "y": 10, "width": 200, "height": 50, "color": [0, 0, 0, 120]},
+            {"type": "label", "id": "title", "text": "Title", "x": 20, "y": 20, "text_color": "white"},
+            {"type": "label", "id": "counter", "text": "frame $frame", "x": 20, "y": 100},
+            {"type": "rect", "id": "under_counter", "x": "back.x", "y": 150, "width": 30, "height": 30},
+            {"type": "rect", "id": "noise", "x": "=randint(0, 100)", "y": 200, "width": 10, "height": 10},
+        ]
+    }
+
+
+def render_frames(template, frames, **kwargs):
+    compiled = CompiledTemplate(template, static_layers=True)
+    for frame in frames:
+        source = Image.new('RGB', (400, 300), (50, 100, 150))
+        result = compiled.bind(source, {"frame": frame, **kwargs}).render()
+        yield compiled, frame, result
+
+
+def max_diff(img1, img2):
+    diff = ImageChops.difference(img1.convert('RGB'), img2.convert('RGB'))
+    return max(band[1] for band in diff.getextrema())
+
+
+def test_static_units_composed_to_layer(layers_template):
+    frames = list(render_frames(layers_template, [1, 2, 3]))
+    compiled = frames[-1][0]
+    assert compiled.layers.stats == dict(static=3, dynamic=2, layers_reused=2, layers_rendered=0)
+    scope = compiled.state[1]
+    assert not compiled.layers.is_dynamic(next(scope["back"].iter_render_units()))
+    assert compiled.layers.is_dynamic(next(scope["counter"].iter_render_units()))
+    assert compiled.layers.is_dynamic(next(scope["noise"].iter_render_units()))
+
+
+def test_static_layers_match_plain_render(layers_template):
+    del layers_template["shapes"][-1]
+    for _, frame, result in render_frames(layers_template, [1, 2, 3, 3]):
+        source = Image.new('RGB', (400, 300), (50, 100, 150))
+        expected = FrameStamp(source, layers_template, {"frame": frame}).render()
+        assert max_diff(result, expected) <= 1
+
+
+def test_shape_referring_dynamic_shape_is_dynamic(layers_template):
+    layers_template["shapes"][0]["x"] = "=$frame*10"
+    compiled = list(render_frames(layers_template, [1, 2, 3]))[-1][0]
+    scope = compiled.state[1]
+    assert compiled.layers.is_dynamic(next(scope["under_counter"].iter_render_units()))
+    assert not compiled.layers.is_dynamic(next(scope["title"].iter_render_units()))
+
+
+def test_grid_cells_are_separate_units(temp_image):
+    template = {
+        "shapes": [{
+            "type": "row", "id": "row", "width": 200, "height": 20,
+            "border": {"enabled": True, "width": 1, "color": "red"},
+            "shapes": [
+                {"type": "label", "id": "static_cell", "text": "A"},
+                {"type": "label", "id": "dynamic_cell", "text": "$frame"},
+            ]
+        }]
+    }
+    compiled = list(render_frames(template, [1, 2, 3]))[-1][0]
+    scope = compiled.state[1]
+    units = list(scope["row"].iter_render_units())
+    assert [unit.shape for unit in units] == [scope["static_cell"], scope["dynamic_cell"], scope["row"]]
+    assert compiled.layers.is_dynamic(units[1])
+    assert not compiled.layers.is_dynamic(units[0])
+    assert not compiled.layers.is_dynamic(units[2])
+
+
+def test_alpha_composite_clipped():
+    dst = Image.new('RGBA', (10, 10), (0, 0, 0, 0))
+    alpha_composite_clipped(dst, Image.new('RGBA', (5, 5), (255, 0, 0, 255)), (-3, -3))
+    assert dst.getbbox() == (0, 0, 2, 2)
+    alpha_composite_clipped(dst, Image.new('RGBA', (5, 5), (255, 0, 0, 255)), (8, 20))
+    assert dst.getbbox() == (0, 0, 2, 2)
@@ -0,0 +1,178 @@
+import io
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from frame_stamp import FrameStamp
+from frame_stamp.stream import RawFrameReader, Y4MHeader, Y4MReader, Y4MWriter, main, process_stream
+from frame_stamp.utils.templates import load_template_file
+
+TEMPLATE = {
+    "shapes": [
+        {"type": "rect", "x": 4, "y": 4, "width": 30, "height": 8, "color": [255, 0, 0, 200]},
+        {"type": "label", "text": "frame $frame $shot", "x": 4, "y": 16},
+    ]
+}
+SIZE = (96, 48)
+
+
+def make_frames(count, mode="RGB"):
+    return [Image.new(mode, SIZE, (i * 40, 80, 160, 255)[:len(mode)]) for i in range(count)]
+
+
+def expected_frame(img, frame, mode="RGB"):
+    return FrameStamp(img, TEMPLATE, {"shot": "sh010", "frame": frame}).render().convert(mode)
+
+
+@pytest.mark.parametrize("mode", ["rgb", "rgba"])
+def test_raw_stream(mode):
+    frames = make_frames(4, mode.upper())
+    src = io.BytesIO(b"".join(img.tobytes() for img in frames))
+    dst = io.BytesIO()
+    assert process_stream(src, dst, TEMPLATE, {"shot": "sh010"}, size=SIZE, input_format=mode) == 4
+    output = list(RawFrameReader(io.BytesIO(dst.getvalue()), SIZE, mode.upper()))
+    assert len(output) == 4
+    for i, (img, result) in enumerate(zip(frames, output)):
+        assert result.tobytes() == expected_frame(img, i, mode.upper()).tobytes()
+
+
+def test_stream_from_pipe():
+    frames = make_frames(6)
+    read_fd, write_fd = os.pipe()
+
+    def feed():
+        with open(write_fd, "wb") as stream:
+            for img in frames:
+                stream.write(img.tobytes())
+
+    thread = threading.Thread(target=feed)
+    thread.start()
+    dst = io.BytesIO()
+    try:
+        count = process_stream(read_fd, dst, TEMPLATE, {"shot": "sh010"}, size=SIZE, buffers=1)
+    finally:
+        thread.join()
+        os.close(read_fd)
+    assert count == 6
+    assert dst.getvalue() == b"".join(expected_frame(img, i).tobytes() for i, img in enumerate(frames))
+
+
+def test_context_callback():
+    frames = make_frames(2)
+    dst = io.BytesIO()
+    process_stream(io.BytesIO(b"".join(img.tobytes() for img in frames)), dst, TEMPLATE, {}, size=SIZE,
+                   context_callback=lambda frame: {"shot": f"sh{frame}"})
+    expected = FrameStamp(frames[1], TEMPLATE, {"shot": "sh1", "frame": 1}).render().convert("RGB")
+    assert dst.getvalue()[-len(expected.tobytes()):] == expected.tobytes()
+
+
+def test_truncated_frame():
+    data = b"".join(img.tobytes() for img in make_frames(2))[:-10]
+    with pytest.raises(EOFError):
+        process_stream(io.BytesIO(data), io.BytesIO(), TEMPLATE, {"shot": "sh010"}, size=SIZE)
+
+
+class EndlessStream(io.RawIOBase):
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        buf[:] = bytes(len(buf))
+        return len(buf)
+
+
+class ClosedPipe(io.BytesIO):
+    def write(self, data):
+        raise BrokenPipeError()
+
+
+def test_output_closed():
+    # endless input is not read after encoder is gone
+    with pytest.raises(BrokenPipeError):
+        process_stream(EndlessStream(), ClosedPipe(), TEMPLATE, {"shot": "sh010"}, size=SIZE)
+
+
+def test_raw_size_required():
+    with pytest.raises(ValueError):
+        process_stream(io.BytesIO(), io.BytesIO(), TEMPLATE, {})
+
+
+@pytest.mark.parametrize("colorspace", ["420jpeg", "422", "444", "mono"])
+@pytest.mark.parametrize("full_range", [False, True])
+def test_y4m_roundtrip(colorspace, full_range):
+    header = Y4MHeader(*SIZE, fps="24:1", colorspace=colorspace,
+                       extensions=["XCOLORRANGE=FULL"] if full_range else [])
+    img = Image.new("RGB", SIZE, (120, 100, 90) if colorspace != "mono" else (100, 100, 100))
+    stream = io.BytesIO()
+    writer = Y4MWriter(stream, header)
+    writer.write(img)
+    writer.write(img)
+    assert len(stream.getvalue()) == len(header.to_bytes()) + 2 * (len(b"FRAME\n") + header.frame_bytes)
+    stream.seek(0)
+    reader = Y4MReader(stream)
+    assert reader.header.to_bytes() == header.to_bytes()
+    frames = list(reader)
+    assert len(frames) == 2
+    diff = np.abs(np.asarray(frames[0], dtype=int) - np.asarray(img, dtype=int))
+    assert diff.max() <= 3
+
+
+def test_y4m_stream():
+    header = Y4MHeader(*SIZE, fps="25:1", colorspace="420jpeg", extensions=["XCOLORRANGE=LIMITED"])
+    src = io.BytesIO()
+    writer = Y4MWriter(src, header)
+    for img in make_frames(3):
+        writer.write(img)
+    src.seek(0)
+    dst = io.BytesIO()
+    assert process_stream(src, dst, TEMPLATE, {"shot": "sh010"}, input_format="y4m") == 3
+    dst.seek(0)
+    reader = Y4MReader(dst)
+    # header of input stream is kept
+    assert reader.header.to_bytes() == header.to_bytes()
+    frames = list(reader)
+    assert len(frames) == 3
+    red = np.asarray(frames[0])[8, 10].astype(int)
+    assert red[0] > 150 and red[1] < 120
+
+
+def test_raw_to_y4m():
+    frames = make_frames(2)
+    dst = io.BytesIO()
+    process_stream(io.BytesIO(b"".join(img.tobytes() for img in frames)), dst, TEMPLATE, {"shot": "sh010"},
+                   size=SIZE, output_format="y4m", fps="24000:1001")
+    dst.seek(0)
+    reader = Y4MReader(dst)
+    assert reader.size == SIZE and reader.header.fps == "24000:1001"
+    assert len(list(reader)) == 2
+
+
+def test_invalid_y4m():
+    with pytest.raises(ValueError):
+        process_stream(io.BytesIO(b"not a stream\n"), io.BytesIO(), TEMPLATE, {}, input_format="y4m")
+
+
+def test_cli(tmp_path):
+    template_file = tmp_path / "template.json"
+    template_file.write_text('{"shapes": [{"type": "label", "text": "frame $frame $shot", "x": 4, "y": 16},'
+                             '{"type": "rect", "x": 4, "y": 4, "width": 30, "height": 8,'
+                             ' "color": [255, 0, 0, 200]}]}')
+    frames = make_frames(2)
+    (tmp_path / "in.raw").write_bytes(b"".join(img.tobytes() for img in frames))
+    main([str(template_file), "-s", "96x48", "-i", str(tmp_path / "in.raw"), "--output", str(tmp_path / "out.raw"),
+          "-v", "shot=sh010"])
+    output = list(RawFrameReader(io.BytesIO((tmp_path / "out.raw").read_bytes()), SIZE))
+    assert len(output) == 2
+
+
+def test_cli_example_template(tmp_path):
+    example = Path(__file__).parent.parent / "examples" / "burn-in1.json"
+    frames = make_frames(1)
+    (tmp_path / "in.raw").write_bytes(frames[0].tobytes())
+    main([str(example), "-s", "96x48", "-i", str(tmp_path / "in.raw"), "--output", str(tmp_path / "out.raw")])
+    expected = FrameStamp(frames[0], load_template_file(example), {"frame": 0}).render().convert("RGB")
+    assert (tmp_path / "out.raw").read_bytes() == expected.tobytes()